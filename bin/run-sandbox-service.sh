@@ -20,4 +20,8 @@ python manage.py shell << EOF
 ${CREATE_SUPERUSER}
 EOF
 python manage.py register_roles
+# SERVER_INTERFACE=asgi serves the asynchronous views from a single event loop per worker.
+if [ "${SERVER_INTERFACE:-wsgi}" = "asgi" ]; then
+    exec uvicorn --host ${LISTEN_IP} --port ${LISTEN_PORT} --workers ${ASGI_WORKERS:-5} crczp.sandbox_service_project.asgi:application
+fi
 gunicorn --bind ${LISTEN_IP}:${LISTEN_PORT} --timeout 600 --workers 5 crczp.sandbox_service_project.wsgi:application
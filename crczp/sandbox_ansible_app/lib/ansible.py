@@ -2,10 +2,13 @@
 
 import os
 import shutil
+from collections.abc import Iterable
 from dataclasses import dataclass
+from typing import Any
 
 import structlog
 from django.conf import settings
+from django.core.cache import cache
 from jinja2 import Environment, FileSystemLoader
 
 from crczp.cloud_commons import TopologyInstance
@@ -18,14 +21,14 @@ from crczp.sandbox_ansible_app.lib.inventory import (
     BaseInventory,
     DefaultAnsibleHostsGroups,
     Inventory,
+    serialize_inventory,
 )
 from crczp.sandbox_ansible_app.models import AnsibleStage
 from crczp.sandbox_common_lib import exceptions
 from crczp.sandbox_common_lib.crczp_config import CrczpConfiguration
 from crczp.sandbox_common_lib.git_config import get_git_server
 from crczp.sandbox_common_lib.netbird_client import get_client_management_url
-from crczp.sandbox_definition_app.lib import definitions
-from crczp.sandbox_instance_app.lib import sandboxes, sshconfig
+from crczp.sandbox_instance_app.lib import definition_snapshots, sandboxes, sshconfig
 from crczp.sandbox_instance_app.models import (
     Pool,
     Sandbox,
@@ -55,6 +58,8 @@ TEMPLATES_DIR_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), '
 DOCKER_COMPOSE_TEMPLATE = 'docker-compose.j2'
 DOCKERFILE_TEMPLATE = 'Dockerfile.j2'
 GIT_CREDENTIALS_FILENAME = '.git-credentials'
+INVENTORY_CACHE_PREFIX = 'ansible-inventory-{}'
+INVENTORY_CACHE_TIMEOUT = 86400  # the Ansible stages of an allocation run within a day
 
 
 class AnsibleRunner:  # pylint: disable=too-many-instance-attributes
@@ -189,8 +194,7 @@ class AllocationAnsibleRunner(AnsibleRunner):
         """
         Prepare and save Ansible inventory file that will be bind to Docker container.
         """
-        inventory_object = self.create_inventory(sandbox)
-        self.save_file(self.inventory_path, inventory_object.serialize())
+        self.save_file(self.inventory_path, serialize_inventory(self.get_inventory(sandbox)))
 
     def _generate_docker_composes(self, top_ins: TopologyInstance) -> None:
         """Generate docker-compose files for each host in the topology."""
@@ -239,11 +243,8 @@ class AllocationAnsibleRunner(AnsibleRunner):
                         'Error while generating dockerfile from template: ', e
                     ) from e
             else:
-                dockerfile_path = container_definition.dockerfile
-                url = sandbox.allocation_unit.pool.definition.url
-                rev = sandbox.allocation_unit.pool.rev_sha
-                dockerfile = definitions.get_dockerfile(
-                    url, rev, settings.CRCZP_CONFIG, dockerfile_path
+                dockerfile = definition_snapshots.get_dockerfile(
+                    sandbox.allocation_unit.pool, container_definition.dockerfile
                 )
             self.save_file(os.path.join(host_container_path, 'Dockerfile'), dockerfile)
 
@@ -255,9 +256,30 @@ class AllocationAnsibleRunner(AnsibleRunner):
             self._generate_docker_composes(top_ins)
             self._generate_dockerfiles(sandbox)
 
-    def create_inventory(self, sandbox: Sandbox) -> Inventory:
+    def get_inventory(self, sandbox: Sandbox) -> dict[str, Any]:
+        """
+        Return Ansible inventory represented as a dict.
+
+        The part derived from the topology is built once per sandbox and cached,
+        so it is shared by all its Ansible stages.
+        """
+        inventory = cache.get_or_set(
+            get_inventory_cache_key(sandbox),
+            lambda: self._create_topology_inventory(sandbox).to_dict(),
+            INVENTORY_CACHE_TIMEOUT,
+        )
+        vpn_group = (
+            inventory['all']
+            .get('children', {})
+            .get(DefaultAnsibleHostsGroups.VPN_ENTRYPOINTS.value)
+        )
+        if vpn_group and vpn_group.get('hosts'):
+            vpn_group['hosts'].update(self._get_netbird_hosts_vars(sandbox, vpn_group['hosts']))
+        return inventory  # type: ignore[no-any-return]
+
+    def _create_topology_inventory(self, sandbox: Sandbox) -> Inventory:
         """
-        Return Ansible inventory file.
+        Return Ansible inventory of the sandbox without its runtime state.
         """
         mgmt_public_certificate = self.container_ssh_path(MGMT_CERTIFICATE_FILENAME)
         mgmt_public_key = self.container_ssh_path(MGMT_PUBLIC_KEY_FILENAME)
@@ -280,7 +302,7 @@ class AllocationAnsibleRunner(AnsibleRunner):
         }
         extra_vars['global_netbird_management_url'] = get_client_management_url()
 
-        inventory = Inventory(
+        return Inventory(
             sau.pool.get_pool_prefix(),
             sau.get_stack_name(),
             top_ins,
@@ -291,19 +313,32 @@ class AllocationAnsibleRunner(AnsibleRunner):
             extra_vars,
         )
 
-        # Attach each entrypoint's NetBird setup key as a host variable on the
-        # vpn_entrypoints group. Group membership itself is built from the
-        # topology definition by the inventory group builder; the setup key is
-        # runtime state that only exists once the entrypoint has been provisioned.
-        vpn_group = inventory.get_group(DefaultAnsibleHostsGroups.VPN_ENTRYPOINTS.value)
-        if vpn_group:
-            for nbr in SandboxNetbirdResources.objects.filter(sandbox=sau.sandbox):
-                if nbr.host_setup_key_value and nbr.entrypoint_host_name in vpn_group.hosts:
-                    vpn_group.hosts_vars[nbr.entrypoint_host_name] = {
-                        'netbird_setup_key': nbr.host_setup_key_value,
-                    }
-
-        return inventory
+    @staticmethod
+    def _get_netbird_hosts_vars(
+        sandbox: Sandbox, vpn_entrypoints: Iterable[str]
+    ) -> dict[str, dict[str, str]]:
+        """
+        Return the NetBird setup key of each entrypoint as its host variable.
+
+        Group membership itself is built from the topology definition by the inventory
+        group builder; the setup key is runtime state that only exists once the entrypoint
+        has been provisioned.
+        """
+        return {
+            nbr.entrypoint_host_name: {'netbird_setup_key': nbr.host_setup_key_value}
+            for nbr in SandboxNetbirdResources.objects.filter(sandbox=sandbox)
+            if nbr.host_setup_key_value and nbr.entrypoint_host_name in vpn_entrypoints
+        }
+
+
+def get_inventory_cache_key(sandbox: Sandbox) -> str:
+    """Return the cache key of the Ansible inventory of the given sandbox."""
+    return INVENTORY_CACHE_PREFIX.format(sandbox.id)
+
+
+def clear_inventory_cache(sandbox: Sandbox) -> None:
+    """Delete the cached Ansible inventory of the given sandbox."""
+    cache.delete(get_inventory_cache_key(sandbox))
 
 
 class CleanupAnsibleRunner(AnsibleRunner):
@@ -186,7 +186,7 @@ def _add_vpn_entrypoints_group(inventory: 'Inventory', topology: TopologyInstanc
     Membership comes from the topology definition's ``vpn.entrypoints``. The
     per-node setup keys are runtime state and are attached to this group as the
     ``netbird_setup_key`` host variable later, in
-    sandbox_ansible_app.lib.ansible.AllocationAnsibleRunner.create_inventory.
+    sandbox_ansible_app.lib.ansible.AllocationAnsibleRunner.get_inventory.
     """
     vpn = topology.topology_definition.vpn
     vpn_entrypoints = vpn.entrypoints if vpn else None
@@ -13,8 +13,14 @@ from django.conf import settings
 
 from crczp.cloud_commons import Link, TopologyInstance
 from crczp.sandbox_common_lib import exceptions
+from crczp.sandbox_common_lib.topology_graph import get_topology_graph
 from crczp.topology_definition.models import Network, Router
 
+try:
+    from yaml import CDumper as YAMLDumper
+except ImportError:  # PyYAML built without libyaml
+    from yaml import Dumper as YAMLDumper  # type: ignore[assignment]
+
 PROXY_JUMP_NAME = 'proxy-jump'
 
 LOG = structlog.get_logger()
@@ -49,6 +55,14 @@ def _normalize_address(address: str | None) -> str | None:
         ) from None
 
 
+def serialize_inventory(inventory: dict[str, Any]) -> str:
+    """
+    Return YAML representation of the inventory dict as a string.
+    The libyaml emitter is used when available, its output is the same as the pure-Python one.
+    """
+    return yaml.dump(inventory, Dumper=YAMLDumper, default_flow_style=False, indent=2)
+
+
 class DefaultAnsibleHostsGroups(Enum):
     """
     Enumerator for default ansible hosts groups.
@@ -217,7 +231,7 @@ class Routing:  # pylint: disable=too-few-public-methods
 
     def __init__(self, topology_instance: TopologyInstance):
         self.topology_instance = topology_instance
-        self.network_to_router_mappings = self._get_network_to_router_mapping(topology_instance)
+        self.topology_graph = get_topology_graph(topology_instance)
         self.interfaces: dict[str, dict[str, Interface]] = {
             node.name: {} for node in topology_instance.get_nodes()
         }
@@ -233,11 +247,11 @@ class Routing:  # pylint: disable=too-few-public-methods
         """
         The main method that initializes a Routing instance from TopologyInstance.
         """
-        man_to_routers_link = self.topology_instance.get_link_between_node_and_network(
+        man_to_routers_link = self.topology_graph.get_link_between_node_and_network(
             self.topology_instance.man, self.topology_instance.wan
         )
         man_to_routers_interface = self._create_interface_for_link(man_to_routers_link)
-        for router_link in self.topology_instance.get_links_from_wan_to_routers():
+        for router_link in self.topology_graph.get_links_from_wan_to_routers():
             router_to_man_interface = self._create_interface_for_link(
                 router_link, man_to_routers_link.ip
             )
@@ -249,12 +263,9 @@ class Routing:  # pylint: disable=too-few-public-methods
         Return a list of user-defined Networks connected to The Router needed to be routed to.
         """
         return [
-            router_to_network_link.network
-            for router_to_network_link in self.topology_instance.get_node_links(
-                router, self.topology_instance.get_hosts_networks()
-            )
-            if router_to_network_link.node.name
-            == self.network_to_router_mappings[router_to_network_link.network.name]
+            network
+            for network in self.topology_graph.get_router_networks(router)
+            if self.topology_graph.get_network_router_name(network) == router.name
         ]
 
     def _create_interface_for_link(self, link: Link, default_gateway_ip: str = '') -> Interface:
@@ -269,15 +280,7 @@ class Routing:  # pylint: disable=too-few-public-methods
 
         Prefers router which is first in alphabetical order.
         """
-        net_to_router = {}
-        router_mappings = sorted(
-            topology_instance.topology_definition.router_mappings,
-            key=lambda x: x.router,
-            reverse=True,
-        )
-        for router_mapping in router_mappings:
-            net_to_router[router_mapping.network] = router_mapping.router
-        return net_to_router
+        return get_topology_graph(topology_instance).get_network_to_router_mapping()
 
 
 class BaseInventory(Group):
@@ -317,7 +320,7 @@ class BaseInventory(Group):
         """
         Return YAML representation of Inventory as a string.
         """
-        return yaml.dump(self.to_dict(), default_flow_style=False, indent=2)
+        return serialize_inventory(self.to_dict())
 
 
 class Inventory(BaseInventory):
@@ -348,6 +351,7 @@ class Inventory(BaseInventory):
         super().__init__(proxy_jump_user_access_mgmt_name, proxy_jump_user_access_user_name)
         self.docker_hosts = None
         self.topology_instance = topology_instance
+        self.topology_graph = get_topology_graph(topology_instance)
         self.routing = Routing(topology_instance)
 
         self._create_hosts()
@@ -384,7 +388,7 @@ class Inventory(BaseInventory):
         """
         mgmt_links = {
             link.node.name: link.ip
-            for link in self.topology_instance.get_network_links(self.topology_instance.man_network)
+            for link in self.topology_graph.get_network_links(self.topology_instance.man_network)
         }
         mgmt_links[self.topology_instance.man.name] = self.topology_instance.ip
         for node in self.topology_instance.get_nodes():
@@ -431,7 +435,7 @@ class Inventory(BaseInventory):
         """
         return [
             self.hosts[link.node.name]
-            for link in self.topology_instance.get_links_to_user_accessible_nodes()
+            for link in self.topology_graph.get_links_to_user_accessible_nodes()
         ]
 
     def _create_user_defined_groups(self) -> None:
@@ -447,7 +451,7 @@ class Inventory(BaseInventory):
         """
         user_defined_networks = self.topology_instance.get_hosts_networks()
         links_lists = [
-            self.topology_instance.get_network_links(network) for network in user_defined_networks
+            self.topology_graph.get_network_links(network) for network in user_defined_networks
         ]
         networks_links = chain(*links_lists)
 
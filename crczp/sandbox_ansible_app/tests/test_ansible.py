@@ -1,9 +1,12 @@
 """Tests for the Ansible runner utilities."""
 
 import pytest
-from django.conf import settings
+import yaml
+from django.core.cache import cache
 
+from crczp.sandbox_ansible_app.lib import ansible
 from crczp.sandbox_ansible_app.lib.ansible import AllocationAnsibleRunner
+from crczp.sandbox_ansible_app.lib.inventory import Inventory
 from crczp.sandbox_instance_app.lib import sandboxes
 from crczp.sandbox_instance_app.models import Sandbox, SandboxNetbirdResources
 
@@ -21,21 +24,57 @@ class TestPrepareInventoryFile:
         self.save_file = mocker.patch(
             'crczp.sandbox_ansible_app.lib.ansible.AnsibleRunner.save_file'
         )
+        cache.clear()
         yield
+        cache.clear()
 
-    def test_prepare_inventory_file_success(self, mocker, top_ins):  # pylint: disable=unused-argument
-        """Test that the inventory file is saved when preparing a successful allocation."""
-        mock_inventory = mocker.patch('crczp.sandbox_ansible_app.lib.ansible.Inventory')
+    @staticmethod
+    def get_sandbox(mocker):
+        """Return the sandbox with a mocked pool prefix and stack name."""
+        sandbox = Sandbox.objects.get(pk=1)
+        sandbox.allocation_unit.pool.get_pool_prefix = mocker.MagicMock(return_value='pool-prefix')
+        sandbox.allocation_unit.get_stack_name = mocker.MagicMock(return_value='stack-name')
+        return sandbox
+
+    def test_prepare_inventory_file_success(self, mocker, top_ins, inventory):
+        """Test that the inventory file is saved and the inventory built once per sandbox."""
+        mock_inventory = mocker.patch(
+            'crczp.sandbox_ansible_app.lib.ansible.Inventory', wraps=Inventory
+        )
         mocker.patch.object(sandboxes, 'get_topology_instance', return_value=top_ins)
+        sandbox = self.get_sandbox(mocker)
 
-        dir_path = '/tmp'  # nosec B108
-        sandbox = Sandbox.objects.get(pk=1)
-        AllocationAnsibleRunner(dir_path).prepare_inventory_file(sandbox)
+        # The networking and the user stage.
+        AllocationAnsibleRunner('/tmp/networking').prepare_inventory_file(sandbox)  # nosec B108
+        AllocationAnsibleRunner('/tmp/user').prepare_inventory_file(sandbox)  # nosec B108
 
         mock_inventory.assert_called_once()
+        (first_path, first), (second_path, second) = [
+            call.args for call in self.save_file.call_args_list
+        ]
+        assert (first_path, second_path) == (
+            '/tmp/networking/inventory.yml',
+            '/tmp/user/inventory.yml',
+        )
+        assert first == second
+        assert yaml.safe_load(first) == inventory
+
+    def test_clear_inventory_cache(self, mocker, top_ins):
+        """Test that the inventory is built again once its cache is cleared."""
+        mock_inventory = mocker.patch(
+            'crczp.sandbox_ansible_app.lib.ansible.Inventory', wraps=Inventory
+        )
+        mocker.patch.object(sandboxes, 'get_topology_instance', return_value=top_ins)
+        sandbox = self.get_sandbox(mocker)
+
+        AllocationAnsibleRunner('/tmp').get_inventory(sandbox)  # nosec B108
+        ansible.clear_inventory_cache(sandbox)
+        AllocationAnsibleRunner('/tmp').get_inventory(sandbox)  # nosec B108
+
+        assert mock_inventory.call_count == 2
 
     def test_prepare_inventory_object(self, mocker, top_ins, inventory):
-        """Test that create_inventory returns a correctly structured inventory dict."""
+        """Test that get_inventory returns a correctly structured inventory dict."""
         mocker.patch.object(sandboxes, 'get_topology_instance', return_value=top_ins)
         dir_path = mocker.MagicMock()
         sandbox = Sandbox.objects.get(pk=1)
@@ -43,13 +82,12 @@ class TestPrepareInventoryFile:
         sandbox.allocation_unit.pool.get_pool_prefix.return_value = 'pool-prefix'
         sandbox.allocation_unit.get_stack_name = mocker.MagicMock()
         sandbox.allocation_unit.get_stack_name.return_value = 'stack-name'
-        result = AllocationAnsibleRunner(dir_path).create_inventory(sandbox)
+        result = AllocationAnsibleRunner(dir_path).get_inventory(sandbox)
 
-        assert result.to_dict() == inventory
+        assert result == inventory
 
-    def test_create_inventory_attaches_netbird_setup_key(self, mocker, top_ins_vpn):
-        sandboxes.get_topology_instance = mocker.MagicMock()
-        sandboxes.get_topology_instance.return_value = top_ins_vpn
+    def test_get_inventory_attaches_netbird_setup_key(self, mocker, top_ins_vpn):
+        mocker.patch.object(sandboxes, 'get_topology_instance', return_value=top_ins_vpn)
 
         dir_path = mocker.MagicMock()
         sandbox = Sandbox.objects.get(pk=1)
@@ -64,18 +102,38 @@ class TestPrepareInventoryFile:
             host_setup_key_value='SK-TEST-123',
         )
 
-        result = AllocationAnsibleRunner(dir_path).create_inventory(sandbox)
+        result = AllocationAnsibleRunner(dir_path).get_inventory(sandbox)
 
-        vpn_group = result.get_group('vpn_entrypoints')
+        vpn_group = result['all']['children'].get('vpn_entrypoints')
         assert vpn_group is not None
-        assert vpn_group.hosts_vars['server'] == {'netbird_setup_key': 'SK-TEST-123'}
+        assert vpn_group['hosts']['server'] == {'netbird_setup_key': 'SK-TEST-123'}
+
+    def test_cached_inventory_attaches_netbird_setup_key(self, mocker, top_ins_vpn):
+        """Test that setup keys provisioned after the inventory was cached are included."""
+        mocker.patch.object(sandboxes, 'get_topology_instance', return_value=top_ins_vpn)
+        sandbox = self.get_sandbox(mocker)
+        runner = AllocationAnsibleRunner('/tmp')  # nosec B108
+        vpn_hosts = runner.get_inventory(sandbox)['all']['children']['vpn_entrypoints']['hosts']
+        assert vpn_hosts['server'] is None
+
+        SandboxNetbirdResources.objects.create(
+            sandbox=sandbox,
+            entrypoint_host_name='server',
+            host_setup_key_value='SK-TEST-123',
+        )
+        inventory = runner.get_inventory(sandbox)
+
+        vpn_hosts = inventory['all']['children']['vpn_entrypoints']['hosts']
+        assert vpn_hosts['server'] == {'netbird_setup_key': 'SK-TEST-123'}
+        ansible.clear_inventory_cache(sandbox)
+        assert inventory == runner.get_inventory(sandbox)
 
 
 class TestGenerateDockerfiles:
     """Tests for Dockerfile generation."""
 
-    def test_dockerfile_fetched_from_pinned_rev_sha(self, mocker):
-        """Dockerfiles are fetched from the pool's pinned rev_sha, not the branch rev."""
+    def test_dockerfile_fetched_from_pinned_definition(self, mocker):
+        """Dockerfiles are read from the definition pinned by the pool."""
         mocker.patch('crczp.sandbox_ansible_app.lib.ansible.AnsibleRunner.make_dir')
         mocker.patch('crczp.sandbox_ansible_app.lib.ansible.AnsibleRunner.save_file')
 
@@ -88,18 +146,13 @@ class TestGenerateDockerfiles:
         mocker.patch.object(sandboxes, 'get_topology_instance', return_value=top_ins)
 
         mock_get_dockerfile = mocker.patch(
-            'crczp.sandbox_ansible_app.lib.ansible.definitions.get_dockerfile',
+            'crczp.sandbox_ansible_app.lib.ansible.definition_snapshots.get_dockerfile',
             return_value='FROM debian',
         )
 
         sandbox = mocker.Mock()
-        sandbox.allocation_unit.pool.definition.url = 'test-def-url'
-        sandbox.allocation_unit.pool.definition.rev = 'branch-name'
-        sandbox.allocation_unit.pool.rev_sha = 'resolved-sha-123'
 
         runner = AllocationAnsibleRunner('/tmp')  # nosec B108
         runner._generate_dockerfiles(sandbox)  # pylint: disable=protected-access
 
-        mock_get_dockerfile.assert_called_once_with(
-            'test-def-url', 'resolved-sha-123', settings.CRCZP_CONFIG, 'docker2/'
-        )
+        mock_get_dockerfile.assert_called_once_with(sandbox.allocation_unit.pool, 'docker2/')
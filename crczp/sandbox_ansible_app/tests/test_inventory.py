@@ -1,8 +1,10 @@
 """Tests for Ansible inventory generation."""
 
 import pytest
+import yaml
 
-from crczp.sandbox_ansible_app.lib.inventory import Inventory, Routing
+from crczp.sandbox_ansible_app.lib.inventory import Inventory, Routing, serialize_inventory
+from crczp.sandbox_common_lib.tests.topologies import create_topology_instance, measure
 
 pytestmark = pytest.mark.django_db
 
@@ -209,3 +211,47 @@ class TestVpnEntrypointsGroup:
         )
 
         assert 'vpn_entrypoints' not in result.to_dict()['all']['children']
+
+
+def create_inventory(topology_instance):
+    """Create the inventory of the topology instance."""
+    return Inventory(
+        'pool-prefix',
+        'stack-name',
+        topology_instance,
+        '/root/.ssh/pool_mng_key',
+        '/root/.ssh/pool_mng_cert',
+        '/root/.ssh/pool_mng_key.pub',
+        '/root/.ssh/user_key.pub',
+    )
+
+
+class TestSerializeInventory:  # pylint: disable=too-few-public-methods
+    """Tests for the inventory serialization."""
+
+    def test_same_as_pure_python_dump(self, top_ins_with_containers):
+        """Test that the inventory is serialized as by the pure-Python YAML emitter."""
+        inventory = create_inventory(top_ins_with_containers).to_dict()
+
+        result = serialize_inventory(inventory)
+
+        assert result == yaml.dump(inventory, default_flow_style=False, indent=2)
+        assert yaml.safe_load(result) == inventory
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('routers, hosts_per_router', [(2, 4), (5, 9), (10, 9), (20, 9)])
+def test_inventory_build_time(routers, hosts_per_router):
+    """Benchmark the inventory build and serialization against the topology size."""
+    top_ins = create_topology_instance(routers, hosts_per_router)
+    inventory = create_inventory(top_ins).to_dict()
+
+    build = measure(lambda: create_inventory(top_ins).to_dict())
+    pure_python = measure(lambda: yaml.dump(inventory, default_flow_style=False, indent=2))
+    libyaml = measure(lambda: serialize_inventory(inventory))
+
+    print(
+        f'\n{len(top_ins.get_nodes())} nodes: build {build * 1000:.2f} ms,'
+        f' serialization {pure_python * 1000:.2f} ms pure-Python,'
+        f' {libyaml * 1000:.2f} ms libyaml'
+    )
@@ -1,6 +1,5 @@
 """REST API views for OpenStack cloud project information."""
 
-import datetime
 from typing import Any, override
 
 import structlog
@@ -13,8 +12,7 @@ from rest_framework.response import Response
 
 from crczp.sandbox_cloud_app import serializers
 from crczp.sandbox_cloud_app.lib import projects
-from crczp.sandbox_common_lib import utils
-from crczp.sandbox_common_lib.common_cloud import list_images
+from crczp.sandbox_common_lib import common_cloud, utils
 from crczp.sandbox_instance_app.models import Pool
 
 LOG = structlog.get_logger()
@@ -53,17 +51,14 @@ class ProjectImagesView(generics.ListAPIView[Any]):
 
     queryset = Pool.objects.none()
     serializer_class = serializers.ImageSerializer
+    # The images are sorted by the pre-sorted orderings of the image catalog.
+    presorted_results = True
 
     @override
     @property
     def paginator(self) -> BasePagination | None:
         _paginator = super().paginator
         _paginator.sort_by_default_param = 'name'  # type: ignore[union-attr]
-        _paginator.sorting_default_values = {  # type: ignore[union-attr]
-            # values replace None during sorting
-            'size': float('-inf'),
-            'updated_at': datetime.MINYEAR,
-        }
         return _paginator
 
     @extend_schema(
@@ -102,7 +97,9 @@ class ProjectImagesView(generics.ListAPIView[Any]):
                 name='cached',
                 location=OpenApiParameter.QUERY,
                 type=OpenApiTypes.BOOL,
-                description='Performs the faster version of this endpoint.',
+                description='Performs the faster version of this endpoint, serving the cached '
+                'images. Otherwise, the images are listed from the cloud and the cache is '
+                'refreshed.',
                 default=False,
             ),
         ],
@@ -119,40 +116,23 @@ class ProjectImagesView(generics.ListAPIView[Any]):
         Get list of images.
         """
         cached_request = request.GET.get('cached', 'false').lower() == 'true'
-        image_set = list_images(cached=cached_request)
-
-        if request.GET.get('onlyCustom') == 'true':
-            image_set = [
-                image
-                for image in image_set
-                if image.owner_specified.get('owner_specified.openstack.custom', 'other') == 'true'
-            ]
-        if request.GET.get('GUI') == 'true':
-            image_set = [
-                image
-                for image in image_set
-                if image.owner_specified.get('owner_specified.openstack.gui_access', 'other')
-                == 'true'
-            ]
-
-        if image_set:
-            image_attributes = [
-                attribute for attribute in dir(image_set[0]) if not attribute.startswith('__')
-            ]
-            for attribute in image_attributes:
-                attribute_filter = request.GET.get(attribute)
-                if attribute_filter:
-                    image_set = [
-                        image
-                        for image in image_set
-                        if getattr(image, attribute)
-                        and attribute_filter in getattr(image, attribute)
-                    ]
-        serialized_image_set = serializers.ImageSerializer(image_set, many=True)
-        page = self.paginate_queryset(serialized_image_set.data)  # type: ignore[arg-type]
+        sort_by, descending = self.paginator.get_ordering(request)  # type: ignore[union-attr]
+        image_set = common_cloud.get_image_catalog(cached=cached_request).select(
+            {
+                attribute: request.GET[attribute]
+                for attribute in (*common_cloud.IMAGE_FILTER_ATTRIBUTES, 'tags')
+                if request.GET.get(attribute)
+            },
+            only_custom=request.GET.get('onlyCustom') == 'true',
+            gui_access=request.GET.get('GUI') == 'true',
+            sort_by=sort_by,
+            descending=descending,
+        )
+
+        page = self.paginate_queryset(image_set)
         if page is not None:
-            return self.get_paginated_response(page)
-        return Response({'image_set': serialized_image_set.data})
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response({'image_set': self.get_serializer(image_set, many=True).data})
 
 
 class ProjectLimitsView(generics.RetrieveAPIView[Any]):
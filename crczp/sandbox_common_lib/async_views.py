@@ -0,0 +1,58 @@
+"""
+Asynchronous variants of the Django REST Framework views.
+
+Handlers of these views are coroutines. Served over ASGI, a request waiting on Redis,
+the database, git or the cloud does not occupy a worker thread, so a single process
+serves many concurrent requests. Authentication, permission checks and other
+synchronous code run in threads of a shared pool (see asgiref.sync.sync_to_async with
+thread_sensitive=False), so they do not wait for the synchronous code of other requests.
+Over WSGI, Django runs the handlers in an event loop of their own.
+"""
+
+import inspect
+from typing import Any, override
+
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest
+from rest_framework import generics
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """APIView dispatching requests to coroutine handlers."""
+
+    @override
+    async def dispatch(  # type: ignore[override]
+        self, request: HttpRequest, *args: Any, **kwargs: Any
+    ) -> Response:
+        """Like APIView.dispatch, awaiting the handler."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial, thread_sensitive=False)(request, *args, **kwargs)
+            method = request.method.lower() if request.method else ''
+            if method in self.http_method_names:
+                handler = getattr(self, method, self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncGenericAPIView(AsyncAPIView, generics.GenericAPIView[Any]):
+    """GenericAPIView dispatching requests to coroutine handlers."""
+
+    async def aget_object(self) -> Any:
+        """Return the object of the view, see GenericAPIView.get_object."""
+        return await sync_to_async(self.get_object)()
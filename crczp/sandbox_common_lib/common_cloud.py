@@ -1,25 +1,347 @@
-"""Cloud utility functions for accessing OpenStack images."""
+"""
+Catalog of the cloud project metadata: images, flavors, limits, quotas and the project name.
 
+Each section of the catalog is cached without expiration and served stale-while-revalidate:
+a section older than cloud_catalog_refresh_interval is returned as it is and a refresh is
+enqueued to the RQ worker. The refresh job reschedules itself, so the catalog is kept fresh
+periodically by workers running with the RQ scheduler. Only a section that has never been
+fetched is fetched synchronously.
+
+The cache holds the fetched values and, under a key of its own, the time each section was
+fetched at. Each process keeps the values it served, built for use (the images are indexed
+in an ImageCatalog), and reads only the fetch time from the cache while it is unchanged.
+The values are shared by all callers in the process, they must not be modified.
+"""
+
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import timedelta
+from enum import Enum
 from typing import Any
 
+import django_rq
+import redis
+import structlog
+from django.conf import settings
 from django.core.cache import cache
 
+from crczp.cloud_commons import Image, Limits, QuotaSet
 from crczp.sandbox_common_lib import utils
+from crczp.sandbox_common_lib.single_flight import SingleFlight
+
+LOG = structlog.get_logger()
+
+CLOUD_CATALOG_CACHE_KEY = 'cloud-catalog-{}'
+CLOUD_CATALOG_FETCHED_AT_KEY = 'cloud-catalog-{}-fetched-at'
+CLOUD_CATALOG_REFRESH_LOCK_KEY = 'cloud-catalog-refresh-lock'
+CLOUD_CATALOG_REFRESH_JOB_ID = 'cloud-catalog-refresh'
+
+IMAGE_FILTER_ATTRIBUTES = (
+    'name',
+    'os_distro',
+    'os_type',
+    'disk_format',
+    'container_format',
+    'visibility',
+    'status',
+    'default_user',
+    'created_at',
+    'updated_at',
+)
+IMAGE_SORT_ATTRIBUTES = (*IMAGE_FILTER_ATTRIBUTES, 'size', 'min_ram', 'min_disk')
+OWNER_SPECIFIED_CUSTOM = 'owner_specified.openstack.custom'
+OWNER_SPECIFIED_GUI_ACCESS = 'owner_specified.openstack.gui_access'
 
-IMAGE_LIST_CACHE_KEY = 'image_list'
-IMAGE_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+_fetches = SingleFlight()
+# Entries of the values built in this process, by section.
+_local_entries: dict['CatalogSection', 'CatalogEntry'] = {}
 
 
-def list_images(cached: bool = True) -> Any:
+class CatalogSection(Enum):
+    """Sections of the cloud catalog, fetched and cached separately."""
+
+    IMAGES = 'images'
+    FLAVORS = 'flavors'
+    LIMITS = 'limits'
+    QUOTA_SET = 'quota-set'
+    PROJECT_NAME = 'project-name'
+
+
+class ImageCatalog:
     """
-    Get list of images as generator
+    Images of the cloud project indexed for lookups, filtering and sorting.
+    The indexes are built once per catalog refresh.
+
+    Attributes:
+        images (list[Image]): Images of the project.
+        by_name (dict[str, Image]): The first image of each name.
     """
-    if cached:
-        image_set = cache.get(IMAGE_LIST_CACHE_KEY)
-        if image_set is not None:
-            return image_set
 
+    def __init__(self, images: list[Image]) -> None:
+        self.images = images
+        self.by_name: dict[str, Image] = {}
+        for image in images:
+            self.by_name.setdefault(image.name, image)
+
+        # attribute -> value -> positions of the images in self.images
+        self._values: dict[str, dict[str, list[int]]] = {
+            attribute: {} for attribute in IMAGE_FILTER_ATTRIBUTES
+        }
+        self._tags: dict[str, set[int]] = {}
+        self._owner_flags: dict[str, frozenset[int]] = {}
+        for position, image in enumerate(images):
+            for attribute, index in self._values.items():
+                value = getattr(image, attribute)
+                if value:
+                    index.setdefault(value, []).append(position)
+            for tag in image.tags or ():
+                self._tags.setdefault(tag, set()).add(position)
+        for key in (OWNER_SPECIFIED_CUSTOM, OWNER_SPECIFIED_GUI_ACCESS):
+            self._owner_flags[key] = frozenset(
+                position
+                for position, image in enumerate(images)
+                if image.owner_specified.get(key) == 'true'
+            )
+
+        # (attribute, descending) -> positions of the images in the sorted order
+        self._orderings: dict[tuple[str, bool], list[int]] = {}
+        for attribute in IMAGE_SORT_ATTRIBUTES:
+            ascending = _sort_positions(images, attribute)
+            self._orderings[attribute, False] = ascending
+            self._orderings[attribute, True] = _reverse_stable(ascending, images, attribute)
+
+    def get(self, name: str) -> Image | None:
+        """Return the image of the name, None if there is no such image."""
+        return self.by_name.get(name)
+
+    def select(
+        self,
+        filters: dict[str, str],
+        *,
+        only_custom: bool = False,
+        gui_access: bool = False,
+        sort_by: str | None = None,
+        descending: bool = False,
+    ) -> list[Image]:
+        """
+        Return the images matching all the filters, sorted.
+
+        :param filters: Substrings of IMAGE_FILTER_ATTRIBUTES values, or tags, by attribute
+        :param only_custom: Return only custom images
+        :param gui_access: Return only images with GUI access
+        :param sort_by: One of IMAGE_SORT_ATTRIBUTES, the catalog order is kept otherwise;
+            images without the attribute come last in the ascending order
+        :param descending: Sort in descending order
+        :return: The matching images
+        """
+        selected: set[int] | frozenset[int] | None = None
+        for attribute, substring in filters.items():
+            if attribute == 'tags':
+                matching = self._tags.get(substring, set())
+            else:
+                matching = set()
+                for value, positions in self._values[attribute].items():
+                    if substring in value:
+                        matching.update(positions)
+            selected = matching if selected is None else selected & matching
+        for key, enabled in (
+            (OWNER_SPECIFIED_CUSTOM, only_custom),
+            (OWNER_SPECIFIED_GUI_ACCESS, gui_access),
+        ):
+            if enabled:
+                flagged = self._owner_flags[key]
+                selected = flagged if selected is None else selected & flagged
+
+        ordering = self._orderings.get((sort_by or '', descending), range(len(self.images)))
+        return [
+            self.images[position]
+            for position in ordering
+            if selected is None or position in selected
+        ]
+
+
+def _sort_positions(images: list[Image], attribute: str) -> list[int]:
+    """Return the positions of the images sorted by the attribute, None values last."""
+
+    def sort_key(position: int) -> tuple[bool, Any]:
+        value = getattr(images[position], attribute, None)
+        return value is None, value
+
+    return sorted(range(len(images)), key=sort_key)
+
+
+def _reverse_stable(ordering: list[int], images: list[Image], attribute: str) -> list[int]:
+    """Reverse the ordering, keeping the catalog order of images of equal values."""
+    groups: list[list[int]] = []
+    previous = object()
+    for position in ordering:
+        value = getattr(images[position], attribute, None)
+        if not groups or value != previous:
+            groups.append([])
+        groups[-1].append(position)
+        previous = value
+    return [position for group in reversed(groups) for position in group]
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """Cached value of a catalog section.
+
+    Attributes:
+        value (Any): The fetched value.
+        fetched_at (float): UNIX time the value was fetched at.
+    """
+
+    value: Any
+    fetched_at: float = field(default_factory=time.time)
+
+
+_FETCHERS: dict[CatalogSection, Callable[[Any], Any]] = {
+    CatalogSection.IMAGES: lambda client: client.list_images(),
+    CatalogSection.FLAVORS: lambda client: client.get_flavors_dict(),
+    CatalogSection.LIMITS: lambda client: client.get_project_limits(),
+    CatalogSection.QUOTA_SET: lambda client: client.get_quota_set(),
+    CatalogSection.PROJECT_NAME: lambda client: client.get_project_name(),
+}
+# Build the value used in the process from the fetched one, the fetched one is used by default.
+_BUILDERS: dict[CatalogSection, Callable[[Any], Any]] = {
+    CatalogSection.IMAGES: ImageCatalog,
+}
+
+
+def get_image_catalog(cached: bool = True) -> ImageCatalog:
+    """
+    Get the catalog of images of the cloud project.
+
+    :param cached: If False, the images are fetched from the cloud synchronously
+    :return: The catalog of images
+    """
+    if not cached:
+        image_catalog = refresh_catalog([CatalogSection.IMAGES])[CatalogSection.IMAGES]
+        return image_catalog  # type: ignore[no-any-return]
+    return _get_section(CatalogSection.IMAGES)  # type: ignore[no-any-return]
+
+
+def list_images(cached: bool = True) -> list[Image]:
+    """
+    Get the list of images of the cloud project.
+
+    :param cached: If False, the images are fetched from the cloud synchronously
+    :return: The images
+    """
+    return get_image_catalog(cached).images
+
+
+def get_flavors() -> dict[str, Any]:
+    """Get the flavors of the cloud project by their name."""
+    return _get_section(CatalogSection.FLAVORS)  # type: ignore[no-any-return]
+
+
+def get_project_limits() -> Limits:
+    """Get the absolute limits of the cloud project."""
+    return _get_section(CatalogSection.LIMITS)  # type: ignore[no-any-return]
+
+
+def get_quota_set() -> QuotaSet:
+    """Get the quota set of the cloud project."""
+    return _get_section(CatalogSection.QUOTA_SET)  # type: ignore[no-any-return]
+
+
+def get_project_name() -> str:
+    """Get the name of the cloud project."""
+    return _get_section(CatalogSection.PROJECT_NAME)  # type: ignore[no-any-return]
+
+
+def refresh_catalog(sections: list[CatalogSection] | None = None) -> dict[CatalogSection, Any]:
+    """
+    Fetch the sections of the catalog from the cloud and cache them.
+
+    :param sections: The sections to refresh, all of them by default
+    :return: The fetched values by section, built for use
+    """
     client = utils.get_terraform_client()
-    image_set = client.list_images()
-    cache.set(IMAGE_LIST_CACHE_KEY, image_set, IMAGE_LIST_CACHE_TIMEOUT)
-    return image_set
+    values = {}
+    for section in sections or list(CatalogSection):
+        entry = CatalogEntry(_FETCHERS[section](client))
+        cache.set_many(
+            {
+                CLOUD_CATALOG_CACHE_KEY.format(section.value): entry,
+                CLOUD_CATALOG_FETCHED_AT_KEY.format(section.value): entry.fetched_at,
+            },
+            None,
+        )
+        values[section] = _build(section, entry)
+    return values
+
+
+def clear_catalog() -> None:
+    """Drop all cached sections of the catalog."""
+    cache.delete_many([
+        key.format(section.value)
+        for section in CatalogSection
+        for key in (CLOUD_CATALOG_CACHE_KEY, CLOUD_CATALOG_FETCHED_AT_KEY)
+    ])
+    _local_entries.clear()
+
+
+def refresh_catalog_job() -> None:
+    """
+    RQ job refreshing the whole catalog. Sections failing to be fetched keep their stale
+    values. The job reschedules itself after the refresh interval.
+    """
+    interval = settings.CRCZP_CONFIG.cloud_catalog_refresh_interval
+    # Keeps request_refresh from enqueuing another job while the periodic one is scheduled.
+    cache.set(CLOUD_CATALOG_REFRESH_LOCK_KEY, True, 2 * interval)
+    try:
+        for section in CatalogSection:
+            try:
+                refresh_catalog([section])
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                LOG.warning('Cloud catalog refresh failed', section=section.value, error=str(ex))
+        LOG.info('Cloud catalog refreshed')
+    finally:
+        django_rq.get_queue().enqueue_in(
+            timedelta(seconds=interval), refresh_catalog_job, job_id=CLOUD_CATALOG_REFRESH_JOB_ID
+        )
+
+
+def request_refresh() -> None:
+    """
+    Enqueue a refresh of the catalog, unless one is already enqueued or scheduled.
+    Failures to enqueue are logged, not raised.
+    """
+    interval = settings.CRCZP_CONFIG.cloud_catalog_refresh_interval
+    if not cache.add(CLOUD_CATALOG_REFRESH_LOCK_KEY, True, 2 * interval):
+        return
+    try:
+        django_rq.get_queue().enqueue(refresh_catalog_job, job_id=CLOUD_CATALOG_REFRESH_JOB_ID)
+    except redis.exceptions.RedisError as ex:
+        cache.delete(CLOUD_CATALOG_REFRESH_LOCK_KEY)
+        LOG.warning('Failed to enqueue the cloud catalog refresh', error=str(ex))
+
+
+def _get_section(section: CatalogSection) -> Any:
+    cache_key = CLOUD_CATALOG_CACHE_KEY.format(section.value)
+    fetched_at: float | None = cache.get(CLOUD_CATALOG_FETCHED_AT_KEY.format(section.value))
+    entry: CatalogEntry | None = None
+    if fetched_at is not None:
+        entry = _local_entries.get(section)
+        if entry is None or entry.fetched_at != fetched_at:
+            entry = cache.get(cache_key)
+    if entry is None:
+        # Nothing to serve yet, so the section is fetched once for all concurrent callers.
+        return _fetches.do(cache_key, lambda: refresh_catalog([section])[section])
+    if time.time() - entry.fetched_at > settings.CRCZP_CONFIG.cloud_catalog_refresh_interval:
+        request_refresh()
+    return _build(section, entry)
+
+
+def _build(section: CatalogSection, entry: CatalogEntry) -> Any:
+    """Return the value of the entry built for use, built once per process and fetch."""
+    local_entry = _local_entries.get(section)
+    if local_entry is None or local_entry.fetched_at != entry.fetched_at:
+        build = _BUILDERS.get(section)
+        local_entry = CatalogEntry(build(entry.value) if build else entry.value, entry.fetched_at)
+        _local_entries[section] = local_entry
+    return local_entry.value
@@ -21,6 +21,10 @@ GIT_SSH_PORT = 22
 GIT_REST_SERVER = 'https://gitlab.com/'
 GIT_USER = 'git'
 GIT_PRIVATE_KEY = os.path.expanduser('~/.ssh/git_rsa_key')
+GIT_REV_CACHE_TIMEOUT = 30
+GIT_MIRROR_SYNC_INTERVAL = 300
+CLOUD_CATALOG_REFRESH_INTERVAL = 300
+REQUEST_DEADLINE = 60
 ANSIBLE_NETWORKING_REV = 'master'
 SANDBOX_BUILD_TIMEOUT = 3600 * 2
 SANDBOX_DELETE_TIMEOUT = 3600
@@ -41,6 +45,7 @@ REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_DB = 0
 REDIS_TIMEOUT = 86400 * 30
+REDIS_TOPOLOGY_LOCAL_CACHE_SIZE = 128
 
 
 class ProxyJump(Object):  # type: ignore[misc]
@@ -98,6 +103,8 @@ class Redis(Object):  # type: ignore[misc]
     default_cache_timeout = Attribute(type=int, default=REDIS_TIMEOUT)
     uag_cache_timeout = Attribute(type=int, default=REDIS_TIMEOUT)
     topology_cache_timeout = Attribute(type=int, default=REDIS_TIMEOUT)
+    # Max number of topology instances kept in memory of each process, 0 disables the tier
+    topology_local_cache_size = Attribute(type=int, default=REDIS_TOPOLOGY_LOCAL_CACHE_SIZE)
 
 
 class GitType(Enum):
@@ -255,6 +262,10 @@ class CrczpConfiguration(Object):  # type: ignore[misc]
     )
 
     git_skip_ssl_verification = Attribute(type=bool, default=False)
+    git_rev_cache_timeout = Attribute(type=int, default=GIT_REV_CACHE_TIMEOUT)
+    git_webhook_secret = Attribute(type=str, default=None)
+    git_mirror_path = Attribute(type=str, default=None)
+    git_mirror_sync_interval = Attribute(type=int, default=GIT_MIRROR_SYNC_INTERVAL)
 
     topology_cache_mode = Attribute(
         type=Typed(
@@ -281,6 +292,7 @@ class CrczpConfiguration(Object):  # type: ignore[misc]
     sandbox_build_timeout = Attribute(type=int, default=SANDBOX_BUILD_TIMEOUT)
     sandbox_delete_timeout = Attribute(type=int, default=SANDBOX_DELETE_TIMEOUT)
     sandbox_ansible_timeout = Attribute(type=int, default=SANDBOX_ANSIBLE_TIMEOUT)
+    request_deadline = Attribute(type=int, default=REQUEST_DEADLINE)
 
     ansible_docker_image = Attribute(type=str, default=ANSIBLE_DOCKER_IMAGE)
     ansible_docker_network = Attribute(type=str, default=ANSIBLE_DOCKER_NETWORK)
@@ -292,6 +304,7 @@ class CrczpConfiguration(Object):  # type: ignore[misc]
     ssl_ca_certificate_verify = Attribute(type=str, default=SSL_CA_CERTIFICATE_VERIFY)
 
     trc = Attribute(type=TransformationConfiguration, key='sandbox_configuration')
+    cloud_catalog_refresh_interval = Attribute(type=int, default=CLOUD_CATALOG_REFRESH_INTERVAL)
 
     # Email allocation notifications
     smtp_server = Attribute(type=str, default=None)
@@ -21,6 +21,8 @@ CORS_ORIGIN_ALLOW_ALL = True
 CORS_ORIGIN_WHITELIST: list[str] = []
 AUTHENTICATED_REST_API = False
 ALLOWED_OIDC_PROVIDERS: list[dict[str, str]] = []
+LOCAL_TOKEN_VERIFICATION = False
+JWKS_REFRESH_INTERVAL = 3600
 
 
 def stack_name_prefix_validator(_: object, value: str) -> None:
@@ -44,18 +46,24 @@ class Authentication(Object):  # type: ignore[misc]
     )
     roles_registration_url = Attribute(type=str)
     roles_acquisition_url = Attribute(type=str)
+    local_token_verification = Attribute(type=bool, default=LOCAL_TOKEN_VERIFICATION)
+    jwks_refresh_interval = Attribute(type=int, default=JWKS_REFRESH_INTERVAL)
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
         self,
         authenticated_rest_api: bool,
         allowed_oidc_providers: 'AllowedOidcProviders',
         roles_registration_url: str,
         roles_acquisition_url: str,
+        local_token_verification: bool,
+        jwks_refresh_interval: int,
     ) -> None:
         self.authenticated_rest_api = authenticated_rest_api
         self.allowed_oidc_providers = allowed_oidc_providers
         self.roles_registration_url = roles_registration_url
         self.roles_acquisition_url = roles_acquisition_url
+        self.local_token_verification = local_token_verification
+        self.jwks_refresh_interval = jwks_refresh_interval
 
 
 class CrczpServiceConfig(Object):  # type: ignore[misc]
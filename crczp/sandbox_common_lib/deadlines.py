@@ -0,0 +1,186 @@
+"""
+Deadlines of the API requests.
+
+DeadlineMiddleware sets a deadline for each API request, the request_deadline configuration
+option or the request_deadline attribute of the view. The calls of external services made
+while the request is handled get only the time remaining until the deadline: the timeouts of
+HTTP requests are shortened to it and read-only calls of clients without timeouts are abandoned
+when it expires. Calls changing the state of a service are never abandoned, the request would
+fail while the change still takes place. A call made after the deadline expired, or failing
+because of it, raises DeadlineExceededError, which is answered with 503 Service Unavailable.
+Outside of API requests (e.g. in RQ jobs) there is no deadline and the calls are unbounded.
+"""
+
+import contextvars
+import functools
+import threading
+import time
+from collections.abc import Callable, Collection, Generator
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any
+
+from crczp.sandbox_common_lib import exceptions
+
+# Maximum number of calls of clients without timeouts running at once, abandoned ones included.
+BOUNDED_CALL_WORKERS = 16
+
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar('deadline', default=None)
+_executor = ThreadPoolExecutor(max_workers=BOUNDED_CALL_WORKERS, thread_name_prefix='deadline')
+_workers = threading.BoundedSemaphore(BOUNDED_CALL_WORKERS)
+
+Timeout = float | tuple[float | None, float | None] | None
+
+
+def start(seconds: float) -> contextvars.Token[float | None]:
+    """
+    Set the deadline of the current context to expire in seconds.
+    An earlier deadline already set is kept.
+
+    :param seconds: Seconds until the deadline expires
+    :return: Token restoring the previous deadline, see contextvars.ContextVar.reset
+    """
+    expires_at = time.monotonic() + seconds
+    current = _deadline.get()
+    return _deadline.set(expires_at if current is None else min(current, expires_at))
+
+
+@contextmanager
+def deadline(seconds: float) -> Generator[None]:
+    """
+    Set the deadline to expire in seconds within the block, see start.
+
+    :param seconds: Seconds until the deadline expires
+    """
+    token = start(seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Return the seconds remaining until the deadline, None if there is no deadline."""
+    expires_at = _deadline.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+def expired() -> bool:
+    """Return True if the deadline has expired."""
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check(service: str) -> float | None:
+    """
+    Check that the deadline has not expired before calling the service.
+
+    :param service: Name of the called service, used in the error message
+    :return: The seconds remaining until the deadline, None if there is no deadline
+    :raise DeadlineExceededError: The deadline has expired
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise exceptions.DeadlineExceededError(
+            f'The request deadline expired before calling {service}.'
+        )
+    return left
+
+
+def clamp_timeout(timeout: Timeout, service: str) -> Timeout:
+    """
+    Shorten the timeout of an HTTP request to the time remaining until the deadline.
+
+    :param timeout: Timeout of the request, in seconds or a (connect, read) tuple
+    :param service: Name of the called service, used in the error message
+    :return: The timeout, not exceeding the remaining time
+    :raise DeadlineExceededError: The deadline has expired
+    """
+    left = check(service)
+    if left is None:
+        return timeout
+    if isinstance(timeout, tuple):
+        return tuple(left if part is None else min(part, left) for part in timeout)  # type: ignore[return-value]
+    return left if timeout is None else min(timeout, left)
+
+
+@contextmanager
+def enforced(service: str) -> Generator[None]:
+    """
+    Raise DeadlineExceededError instead of the error of a call of the service
+    that failed because the deadline expired, e.g. its timeout was shortened to it.
+
+    :param service: Name of the called service, used in the error message
+    """
+    try:
+        yield
+    except exceptions.DeadlineExceededError:
+        raise
+    except Exception as ex:
+        if expired():
+            raise exceptions.DeadlineExceededError(
+                f'{service} did not respond before the request deadline expired.'
+            ) from ex
+        raise
+
+
+def call(service: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Call a client without timeouts, abandoning the call when the deadline expires.
+    Use only for calls that do not change the state of the service.
+
+    The call runs in a worker thread; an abandoned call is left to finish there and keeps
+    its worker. If the service hangs and all workers are taken, the calls fail immediately
+    instead of waiting for a worker.
+
+    :param service: Name of the called service, used in the error message
+    :param fn: The called function
+    :return: The result of fn
+    :raise DeadlineExceededError: The deadline expired before fn returned,
+        or all workers are taken by calls that have not returned
+    """
+    left = check(service)
+    if left is None:
+        return fn(*args, **kwargs)
+    if not _workers.acquire(blocking=False):
+        raise exceptions.DeadlineExceededError(
+            f'Too many calls of {service} have not returned, it is not responding.'
+        )
+    future = _executor.submit(_call_and_release_worker, fn, *args, **kwargs)
+    done, _ = wait([future], timeout=left)
+    if not done:
+        raise exceptions.DeadlineExceededError(
+            f'{service} did not respond before the request deadline expired.'
+        )
+    return future.result()
+
+
+def _call_and_release_worker(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _workers.release()
+
+
+class DeadlineProxy:  # pylint: disable=too-few-public-methods
+    """
+    Proxy of a client without timeouts, bounding the calls of its read-only methods
+    by the deadline. Other methods are called directly.
+    """
+
+    def __init__(self, service: str, client: Any, read_only_methods: Collection[str]) -> None:
+        """
+        :param service: Name of the service, used in the error messages
+        :param client: The proxied client
+        :param read_only_methods: Names of the methods which do not change the state
+            of the service, only their calls are bounded
+        """
+        self._service = service
+        self._client = client
+        self._read_only_methods = read_only_methods
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._client, name)
+        if name not in self._read_only_methods or not callable(attribute):
+            return attribute
+        return functools.partial(call, self._service, attribute)
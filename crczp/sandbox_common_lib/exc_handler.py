@@ -11,7 +11,7 @@ from rest_framework.response import Response
 from rest_framework.views import exception_handler
 
 from crczp.cloud_commons import CrczpException
-from crczp.sandbox_common_lib.exceptions import ApiException
+from crczp.sandbox_common_lib.exceptions import ApiException, DeadlineExceededError
 
 # Create logger
 LOG = structlog.get_logger()
@@ -24,6 +24,8 @@ def custom_exception_handler(exc: Exception, context: dict[str, Any]) -> Respons
         response = handle_permission_denied(exc, context)
     elif isinstance(exc, ValidationError):
         response = handle_model_validation_error(exc, context)
+    elif isinstance(exc, DeadlineExceededError):
+        response = handle_deadline_exceeded(exc, context)
     elif isinstance(exc, (ApiException, CrczpException)):
         response = handle_crczp_exception(exc, context)
     elif isinstance(exc, Http404):
@@ -65,6 +67,16 @@ def handle_crczp_exception(exc: Exception, _context: dict[str, Any]) -> Response
     )
 
 
+def handle_deadline_exceeded(exc: DeadlineExceededError, _context: dict[str, Any]) -> Response:
+    """Answer a request whose deadline expired with 503, the service may answer a retry."""
+    return Response(
+        {
+            'detail': str(exc),
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
 def handle_permission_denied(exc: PermissionDenied, context: dict[str, Any]) -> Response:
     """Add user-role list to Permission denied error."""
     try:
@@ -69,3 +69,9 @@ class EmailException(ApiException):
     """
     Raised when email notifications are not sent successfully.
     """
+
+
+class DeadlineExceededError(ApiException):
+    """
+    Raised when the deadline of the request expires before an external service responds.
+    """
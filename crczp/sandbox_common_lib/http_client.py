@@ -0,0 +1,196 @@
+"""
+Shared client for the outbound HTTP requests of the service.
+
+All sessions created here share a single transport adapter, so connections to each
+destination host are kept alive in a per-host pool and reused across requests and threads
+instead of repeating the TCP and TLS handshakes. The adapter applies the default timeouts
+to requests sent without one, retries failed connections and idempotent requests answered
+by an unavailable upstream with an exponential backoff, and records the latency and errors
+of the requests of each destination. Within an API request, timeouts and retries are bounded
+by the time remaining until the deadline of the request, see the deadlines module.
+"""
+
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, override
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from crczp.sandbox_common_lib import deadlines, exceptions
+
+# Connect and read timeouts (seconds) of requests sent without a timeout.
+DEFAULT_TIMEOUT = (5, 30)
+# Number of per-host pools kept and of connections kept alive in each of them.
+POOL_HOSTS = 16
+POOL_CONNECTIONS_PER_HOST = 20
+# Failed connections, and idempotent requests answered with one of RETRY_STATUSES,
+# are retried up to RETRY_TOTAL times, sleeping RETRY_BACKOFF * 2 ** (retry - 1) seconds.
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (502, 503, 504)
+
+REQUESTS = 'requests'
+ERRORS = 'errors'
+LATENCY_TOTAL = 'latency_total'
+LATENCY_MAX = 'latency_max'
+
+
+class DestinationMetrics:
+    """Thread-safe counters of the requests, errors and latency of each destination host."""
+
+    def __init__(self) -> None:
+        self._destinations: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, destination: str, latency: float, error: bool) -> None:
+        """
+        Record a request.
+
+        :param destination: Scheme and host of the request, see get_destination
+        :param latency: Seconds until the response (or the failure), including retries
+        :param error: Whether the request failed or was answered with a server error
+        """
+        with self._lock:
+            counters = self._destinations.setdefault(
+                destination, {REQUESTS: 0, ERRORS: 0, LATENCY_TOTAL: 0.0, LATENCY_MAX: 0.0}
+            )
+            counters[REQUESTS] += 1
+            counters[ERRORS] += error
+            counters[LATENCY_TOTAL] += latency
+            counters[LATENCY_MAX] = max(counters[LATENCY_MAX], latency)
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """Return the counters by destination, with the mean latency of its requests."""
+        with self._lock:
+            return {
+                destination: {
+                    **counters,
+                    'latency_mean': counters[LATENCY_TOTAL] / counters[REQUESTS],
+                }
+                for destination, counters in self._destinations.items()
+            }
+
+    def clear(self) -> None:
+        """Reset all counters."""
+        with self._lock:
+            self._destinations.clear()
+
+
+METRICS = DestinationMetrics()
+
+
+def get_destination(url: str) -> str:
+    """Return the scheme and host of the URL the metrics of its requests are kept under."""
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+class DeadlineRetry(Retry):
+    """Retry policy giving up when the deadline expires and sleeping no longer than until then."""
+
+    @override
+    def is_exhausted(self) -> bool:
+        return super().is_exhausted() or deadlines.expired()
+
+    @override
+    def get_backoff_time(self) -> float:
+        return self._until_deadline(super().get_backoff_time())
+
+    @override
+    def get_retry_after(self, response: Any) -> float | None:
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else self._until_deadline(retry_after)
+
+    @staticmethod
+    def _until_deadline(seconds: float) -> float:
+        left = deadlines.remaining()
+        return seconds if left is None else max(min(seconds, left), 0)
+
+
+class OutboundAdapter(HTTPAdapter):
+    """
+    Transport adapter with per-host connection pools, default timeouts,
+    retries and metrics of the requests by destination.
+    """
+
+    def __init__(
+        self,
+        timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+        metrics: DestinationMetrics = METRICS,
+        **kwargs: Any,
+    ) -> None:
+        self.timeout = timeout
+        self.metrics = metrics
+        kwargs.setdefault('pool_connections', POOL_HOSTS)
+        kwargs.setdefault('pool_maxsize', POOL_CONNECTIONS_PER_HOST)
+        kwargs.setdefault(
+            'max_retries',
+            DeadlineRetry(
+                total=RETRY_TOTAL,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                raise_on_status=False,
+            ),
+        )
+        super().__init__(**kwargs)
+
+    @override
+    def send(  # type: ignore[override]
+        self,
+        request: requests.PreparedRequest,
+        stream: bool = False,
+        timeout: Any = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        destination = get_destination(str(request.url))
+        timeout = deadlines.clamp_timeout(timeout or self.timeout, destination)
+        start = time.perf_counter()
+        try:
+            with deadlines.enforced(destination):
+                response = super().send(request, stream=stream, timeout=timeout, **kwargs)
+        except (requests.RequestException, exceptions.DeadlineExceededError):
+            self.metrics.record(destination, time.perf_counter() - start, error=True)
+            raise
+        self.metrics.record(
+            destination, time.perf_counter() - start, error=response.status_code >= 500
+        )
+        return response
+
+
+_ADAPTER = OutboundAdapter()
+
+
+def create_session() -> requests.Session:
+    """
+    Create a session sending its requests through the shared adapter.
+
+    Cookies are never stored, so that sessions shared by requests
+    of different users cannot leak them to each other.
+    """
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    session.mount('https://', _ADAPTER)
+    session.mount('http://', _ADAPTER)
+    return session
+
+
+SESSION = create_session()
+
+
+def request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """Send a request through the shared session, see requests.request."""
+    return SESSION.request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    """Send a GET request through the shared session, see requests.get."""
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    """Send a POST request through the shared session, see requests.post."""
+    return request('POST', url, **kwargs)
@@ -0,0 +1,53 @@
+"""Django middleware of the sandbox service."""
+
+import asyncio
+import contextvars
+from collections.abc import Callable
+from typing import Any
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+
+from crczp.sandbox_common_lib import deadlines
+
+
+class DeadlineMiddleware:
+    """
+    Set the deadline of each request, see the deadlines module.
+
+    The deadline is the request_deadline attribute of the view if it has one, else the
+    request_deadline configuration option; zero or None disables it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Any:
+        # The deadline set by process_view is dropped with the context of the request.
+        if self.is_async:
+            return self.__acall__(request)
+        return contextvars.copy_context().run(self.get_response, request)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        """Handle the request in a task of its own, i.e. in a copy of the context."""
+        return await asyncio.create_task(self.get_response(request))  # type: ignore[arg-type]
+
+    def process_view(
+        self,
+        _request: HttpRequest,
+        view_func: Callable[..., Any],
+        _view_args: Any,
+        _view_kwargs: Any,
+    ) -> None:
+        """Enter the deadline of the view for the rest of the request."""
+        view = getattr(view_func, 'cls', view_func)
+        seconds = getattr(view, 'request_deadline', settings.CRCZP_CONFIG.request_deadline)
+        if seconds:
+            deadlines.start(seconds)
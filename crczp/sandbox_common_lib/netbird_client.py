@@ -5,6 +5,8 @@ from typing import Any
 import requests as http_requests
 from django.conf import settings
 
+from crczp.sandbox_common_lib import http_client
+
 # Wire defaults applied to each nameserver entry: a plain DNS-over-UDP resolver
 # on the standard DNS port.
 _DNS_NS_TYPE = 'udp'
@@ -46,7 +48,7 @@ class NetbirdClient:
     def __init__(self, management_url: str, pat: str, timeout: tuple[int, int] = (5, 30)):
         self._base_url = management_url.rstrip('/')
         self._timeout = timeout
-        self._session = http_requests.Session()
+        self._session = http_client.create_session()
         self._session.headers.update({
             'Authorization': f'Token {pat}',
             'Content-Type': 'application/json',
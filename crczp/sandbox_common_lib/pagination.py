@@ -55,6 +55,12 @@ class PageNumberWithPageSizePagination(PageNumberPagination):
             ])
         )
 
+    def get_ordering(self, request: Request) -> tuple[str, bool]:
+        """Return the attribute to sort the results by and whether the order is descending."""
+        sort_by_param = request.GET.get('sort_by', self.sort_by_default_param)
+        order_param = request.GET.get('order', self.order_default_param)
+        return sort_by_param, order_param == 'desc'
+
     @override
     def paginate_queryset(
         self, queryset: Any, request: Request, view: Any = None
@@ -65,6 +71,9 @@ class PageNumberWithPageSizePagination(PageNumberPagination):
         if isinstance(queryset, QuerySet):
             sort_by_param = '-' + sort_by_param if order_param == 'desc' else sort_by_param
             queryset = queryset.order_by(sort_by_param)
+        elif getattr(view, 'presorted_results', False):
+            # The view has sorted the results itself, according to get_ordering.
+            pass
         else:
             queryset = sorted(
                 queryset,
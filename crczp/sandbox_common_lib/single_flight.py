@@ -0,0 +1,152 @@
+"""
+Deduplication of concurrent calls computing the same value,
+within a process or across processes sharing a cache.
+"""
+
+import secrets
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import redis
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.redis import RedisCache
+
+from crczp.sandbox_common_lib import exceptions
+
+
+class _Call:
+    """A call in flight; waiting callers share its outcome."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time within the process.
+
+    Callers arriving while a call for the same key is running wait for it and receive
+    its result (or its exception) instead of repeating the work.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Return the result of fn, shared with concurrent callers of the same key.
+
+        :param key: Identifier of the computed value
+        :param fn: Callable computing the value
+        :return: The result of fn
+        :raise: The exception raised by fn
+        """
+        with self._lock:
+            leader = key not in self._calls
+            if leader:
+                self._calls[key] = _Call()
+            call = self._calls[key]
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as exc:  # pylint: disable=broad-exception-caught
+                call.error = exc
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class CacheSingleFlight:
+    """
+    Run at most one call per key at a time across the processes sharing a cache.
+
+    The result of the call is stored in the cache under the key. The caller holding
+    a short lock in the cache makes the call, the others poll the cache for the result.
+    When the lock is released without a result, one of the waiting callers takes it over.
+    Waiting callers never make the call without the lock, if it is still held by another
+    caller after the lock timeout, they fail. The lock holds a token of its owner, so a caller
+    whose call outlived the lock does not release the lock another caller took over.
+    Within a process, callers are deduplicated by a SingleFlight before reaching the cache.
+    """
+
+    def __init__(
+        self, cache: BaseCache, lock_timeout: float = 10, poll_interval: float = 0.05
+    ) -> None:
+        """
+        :param cache: Cache shared by the processes
+        :param lock_timeout: Seconds after which the lock expires and waiting callers fail
+        :param poll_interval: Seconds between polls of waiting callers
+        """
+        self._cache = cache
+        self._lock_timeout = lock_timeout
+        self._poll_interval = poll_interval
+        self._local = SingleFlight()
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: float | None) -> Any:
+        """
+        Return the cached result of fn, computed once for all concurrent callers of the key.
+
+        :param key: Cache key of the result
+        :param fn: Callable computing the result, it must not return None
+        :param timeout: Cache timeout of the result
+        :return: The result of fn
+        :raise DeadlineExceededError: The lock is held by another caller after the lock timeout
+        :raise: The exception raised by fn
+        """
+        return self._local.do(key, lambda: self._do(key, fn, timeout))
+
+    def _do(self, key: str, fn: Callable[[], Any], timeout: float | None) -> Any:
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f'{key}-lock'
+        deadline = time.monotonic() + self._lock_timeout
+        token = secrets.randbits(63)
+        while not self._cache.add(lock_key, token, self._lock_timeout):
+            time.sleep(self._poll_interval)
+            value = self._cache.get(key)
+            if value is not None:
+                return value
+            if time.monotonic() > deadline:
+                raise exceptions.DeadlineExceededError(
+                    f'The call computing {key} has not returned in {self._lock_timeout} seconds.'
+                )
+
+        try:
+            value = fn()
+            self._cache.set(key, value, timeout)
+            return value
+        finally:
+            self._release(lock_key, token)
+
+    def _release(self, lock_key: str, token: int) -> None:
+        """Delete the lock if it still holds the token, compared and deleted atomically in Redis."""
+        if not isinstance(self._cache, RedisCache):
+            if self._cache.get(lock_key) == token:
+                self._cache.delete(lock_key)
+            return
+        key = self._cache.make_and_validate_key(lock_key)
+        client = self._cache._cache.get_client(key, write=True)  # pylint: disable=protected-access
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) == str(token).encode():
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.execute()
+            except redis.WatchError:
+                pass  # the lock changed meanwhile, it is not held by the token
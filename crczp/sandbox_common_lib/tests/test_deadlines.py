@@ -0,0 +1,128 @@
+"""Tests for the deadlines of the API requests."""
+
+# pylint: disable=redefined-outer-name
+import socket
+import threading
+import time
+
+import pytest
+from django.test import RequestFactory
+
+from crczp.sandbox_common_lib import deadlines, exceptions, http_client
+from crczp.sandbox_common_lib.exc_handler import custom_exception_handler
+from crczp.sandbox_common_lib.middleware import DeadlineMiddleware
+
+
+@pytest.fixture
+def silent_url():
+    """Return the URL of a server accepting connections but never responding."""
+    with socket.socket() as server:
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        yield f'http://127.0.0.1:{server.getsockname()[1]}/'
+
+
+class TestDeadline:
+    """Tests for setting and checking the deadline."""
+
+    def test_no_deadline(self):
+        """Test that calls outside of a deadline are unbounded."""
+        assert deadlines.remaining() is None
+        assert deadlines.clamp_timeout((5, 30), 'service') == (5, 30)
+        assert deadlines.call('service', lambda: 'result') == 'result'
+
+    def test_timeouts_are_clamped(self):
+        """Test that timeouts are shortened to the remaining time."""
+        with deadlines.deadline(10):
+            assert deadlines.clamp_timeout((5, 30), 'service') == pytest.approx((5, 10), abs=0.1)
+            assert deadlines.clamp_timeout(None, 'service') == pytest.approx(10, abs=0.1)
+            with deadlines.deadline(60):
+                assert deadlines.remaining() == pytest.approx(10, abs=0.1)
+        assert deadlines.remaining() is None
+
+    def test_expired_deadline(self):
+        """Test that no call is made after the deadline expired."""
+        with deadlines.deadline(0), pytest.raises(exceptions.DeadlineExceededError):
+            deadlines.call('service', pytest.fail)
+
+    def test_slow_call_is_abandoned(self):
+        """Test that a call of a client without timeouts is abandoned at the deadline."""
+        start = time.monotonic()
+        with (
+            deadlines.deadline(0.1),
+            pytest.raises(exceptions.DeadlineExceededError, match='the cloud'),
+        ):
+            deadlines.DeadlineProxy('the cloud', time, {'sleep'}).sleep(2)
+
+        assert time.monotonic() - start < 1
+
+    def test_changing_call_is_not_abandoned(self):
+        """Test that a call of a method which is not read-only runs to completion."""
+        with deadlines.deadline(0.05):
+            deadlines.DeadlineProxy('the cloud', time, {'monotonic'}).sleep(0.2)
+
+    def test_calls_fail_fast_when_workers_are_taken(self, monkeypatch):
+        """Test that calls fail immediately while abandoned calls take all workers."""
+        monkeypatch.setattr(deadlines, '_workers', threading.BoundedSemaphore(1))
+        released = threading.Event()
+        with deadlines.deadline(0.05), pytest.raises(exceptions.DeadlineExceededError):
+            deadlines.call('the cloud', released.wait)
+
+        with (
+            deadlines.deadline(10),
+            pytest.raises(exceptions.DeadlineExceededError, match='Too many calls'),
+        ):
+            deadlines.call('the cloud', pytest.fail)
+
+        released.set()
+        time.sleep(0.05)
+        with deadlines.deadline(10):
+            assert deadlines.call('the cloud', lambda: 'result') == 'result'
+
+    def test_http_request_fails_fast(self, silent_url):
+        """Test that an HTTP request to a hanging server fails at the deadline."""
+        start = time.monotonic()
+        with deadlines.deadline(0.2), pytest.raises(exceptions.DeadlineExceededError):
+            http_client.get(silent_url)
+
+        assert time.monotonic() - start < 1
+
+
+class TestDeadlineMiddleware:
+    """Tests for setting the deadline of the requests."""
+
+    @staticmethod
+    def handle(view):
+        """Handle a request of the view, returning the deadline remaining in the view."""
+        middleware = None
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return deadlines.remaining()
+
+        middleware = DeadlineMiddleware(get_response)
+        return middleware(RequestFactory().get('/'))
+
+    def test_configured_deadline(self, settings):
+        """Test that views get the configured deadline, which is dropped after the request."""
+        configured = settings.CRCZP_CONFIG.request_deadline
+
+        assert self.handle(lambda request: None) == pytest.approx(configured, abs=0.1)
+        assert deadlines.remaining() is None
+
+    def test_view_deadline(self):
+        """Test that the deadline of a view overrides the configured one."""
+
+        def view(request):  # pylint: disable=unused-argument
+            """A view with its own deadline."""
+
+        view.cls = type('View', (), {'request_deadline': 120})
+
+        assert self.handle(view) == pytest.approx(120, abs=0.1)
+
+
+def test_deadline_exceeded_is_service_unavailable():
+    """Test that an expired deadline is answered with 503."""
+    response = custom_exception_handler(exceptions.DeadlineExceededError('expired'), {})
+
+    assert response.status_code == 503
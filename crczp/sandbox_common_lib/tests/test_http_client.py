@@ -0,0 +1,125 @@
+"""Tests for the shared client of the outbound HTTP requests."""
+
+# pylint: disable=redefined-outer-name
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from crczp.sandbox_common_lib import http_client
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answer each request with the next status of the server, 200 by default."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer a GET request."""
+        self.server.ports.add(self.client_address[1])
+        self.server.requests += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header('Set-Cookie', 'session=secret')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Do not log the requests."""
+
+
+@pytest.fixture
+def server():
+    """Run a local HTTP server counting the requests and the client connections."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.ports = set()
+    server.requests = 0
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def url(server):
+    """Return the URL of the local server."""
+    return f'http://127.0.0.1:{server.server_port}/'
+
+
+@pytest.fixture
+def metrics():
+    """Reset the metrics of the shared adapter."""
+    http_client.METRICS.clear()
+    yield http_client.METRICS
+    http_client.METRICS.clear()
+
+
+class TestOutboundAdapter:
+    """Tests for the requests sent through the shared adapter."""
+
+    def test_connections_are_reused(self, server, url):
+        """Test that requests of all sessions to a host share its kept-alive connections."""
+        http_client.get(url)
+        http_client.get(url)
+        http_client.create_session().get(url)
+
+        assert server.requests == 3
+        assert len(server.ports) == 1
+
+    def test_unavailable_upstream_is_retried(self, server, url, metrics):
+        """Test that an idempotent request answered with 503 is retried."""
+        server.statuses = [503]
+
+        response = http_client.get(url)
+
+        assert response.status_code == 200
+        assert server.requests == 2
+        assert metrics.get_stats()[url.rstrip('/')]['errors'] == 0
+
+    def test_post_is_not_retried(self, server, url, metrics):
+        """Test that a POST request answered with 503 is not repeated, and counts as an error."""
+        server.statuses = [503]
+
+        response = http_client.post(url, data=b'answers')
+
+        assert response.status_code == 503
+        assert server.requests == 1
+        assert metrics.get_stats()[url.rstrip('/')]['errors'] == 1
+
+    def test_metrics_by_destination(self, mocker, url, metrics):
+        """Test that the latency and errors of the requests are recorded by destination."""
+        mocker.patch('urllib3.util.retry.Retry.sleep')
+        http_client.get(url)
+        http_client.get(url + 'path?query=1')
+        with pytest.raises(requests.ConnectionError):
+            http_client.get('http://127.0.0.1:1/', timeout=1)
+
+        stats = metrics.get_stats()
+        destination = stats[url.rstrip('/')]
+        assert destination['requests'] == 2
+        assert destination['errors'] == 0
+        assert 0 < destination['latency_max'] <= destination['latency_total']
+        assert destination['latency_mean'] == destination['latency_total'] / 2
+        assert stats['http://127.0.0.1:1']['errors'] == 1
+
+    def test_default_timeout(self, mocker, url):
+        """Test that requests sent without a timeout get the default one."""
+        send = mocker.spy(requests.adapters.HTTPAdapter, 'send')
+
+        http_client.get(url)
+        http_client.get(url, timeout=3)
+
+        assert send.call_args_list[0].kwargs['timeout'] == http_client.DEFAULT_TIMEOUT
+        assert send.call_args_list[1].kwargs['timeout'] == 3
+
+    def test_cookies_are_not_kept(self, url):
+        """Test that the shared session does not store cookies set by a server."""
+        http_client.get(url)
+
+        assert not http_client.SESSION.cookies
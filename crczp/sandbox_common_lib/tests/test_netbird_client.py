@@ -37,10 +37,10 @@ def make_response(
 
 @pytest.fixture
 def session(mocker: Any) -> MagicMock:
-    """Patch the client's requests.Session and return the fake session."""
+    """Patch the client's session and return the fake session."""
     fake_session = MagicMock()
     mocker.patch(
-        'crczp.sandbox_common_lib.netbird_client.http_requests.Session',
+        'crczp.sandbox_common_lib.netbird_client.http_client.create_session',
         return_value=fake_session,
     )
     return fake_session
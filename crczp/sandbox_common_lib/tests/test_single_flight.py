@@ -0,0 +1,163 @@
+"""Unit tests for sandbox_common_lib single_flight."""
+
+import threading
+import time
+
+import fakeredis
+import pytest
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+from crczp.sandbox_common_lib.exceptions import DeadlineExceededError
+from crczp.sandbox_common_lib.single_flight import CacheSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_result():
+    """Test that callers of a key in flight wait for its result instead of calling again."""
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.do('key', compute)))
+    leader.start()
+    started.wait(5)
+    followers = [
+        threading.Thread(target=lambda: results.append(single_flight.do('key', compute)))
+        for _ in range(3)
+    ]
+    for follower in followers:
+        follower.start()
+    time.sleep(0.1)  # let the followers join the call in flight
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert results == ['value'] * 4
+    assert len(calls) == 1
+
+
+def test_exception_is_raised_and_key_released():
+    """Test that an exception reaches the caller and the next call runs again."""
+    single_flight = SingleFlight()
+
+    def fail():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        single_flight.do('key', fail)
+    assert single_flight.do('key', lambda: 'value') == 'value'
+
+
+class TestCacheSingleFlight:
+    """Tests for the deduplication of calls across processes sharing a cache."""
+
+    @pytest.fixture
+    def shared_cache(self):
+        """Return an empty cache shared by the simulated processes."""
+        cache = caches['default']
+        cache.clear()
+        return cache
+
+    def test_burst_makes_one_call(self, shared_cache):
+        """Test that a burst of calls from several processes makes a single call."""
+        processes = [CacheSingleFlight(shared_cache, poll_interval=0.01) for _ in range(4)]
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda process=process: results.append(process.do('key', compute, 60))
+            )
+            for process in processes
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)  # let all the callers wait for the call in flight
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == ['value'] * 20
+        assert len(calls) == 1
+        assert shared_cache.get('key') == 'value'
+
+    def test_waiter_takes_over_failed_call(self, shared_cache):
+        """Test that a waiting process makes the call when the lock is released without result."""
+        leader, waiter = CacheSingleFlight(shared_cache), CacheSingleFlight(shared_cache)
+        started, release = threading.Event(), threading.Event()
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError('upstream failed')
+
+        errors = []
+
+        def lead():
+            try:
+                leader.do('key', fail, 60)
+            except ValueError as ex:
+                errors.append(ex)
+
+        thread = threading.Thread(target=lead)
+        thread.start()
+        started.wait(5)
+        threading.Timer(0.1, release.set).start()
+
+        assert waiter.do('key', lambda: 'value', 60) == 'value'
+        thread.join()
+        assert len(errors) == 1
+
+    def test_expired_lock_is_taken_over(self, shared_cache):
+        """Test that a waiting caller makes the call when the lock expires."""
+        shared_cache.add('key-lock', True, 0.1)
+        single_flight = CacheSingleFlight(shared_cache, lock_timeout=1, poll_interval=0.01)
+
+        assert single_flight.do('key', lambda: 'value', 60) == 'value'
+
+    def test_stuck_lock_fails_waiters(self, shared_cache):
+        """Test that waiting callers fail instead of calling while the lock is held."""
+        shared_cache.add('key-lock', True, 60)
+        single_flight = CacheSingleFlight(shared_cache, lock_timeout=0.1, poll_interval=0.01)
+        calls = []
+
+        with pytest.raises(DeadlineExceededError):
+            single_flight.do('key', lambda: calls.append(1), 60)
+        assert not calls
+        assert shared_cache.get('key-lock')
+
+    @pytest.mark.parametrize('backend', ['locmem', 'redis'])
+    def test_lock_taken_over_is_kept(self, mocker, shared_cache, backend):
+        """Test that a call outliving its lock does not release the lock of another caller."""
+        if backend == 'redis':
+            shared_cache = RedisCache('redis://localhost:6379/1', {})
+            mocker.patch.object(
+                shared_cache._cache,  # pylint: disable=protected-access
+                'get_client',
+                return_value=fakeredis.FakeRedis(),
+            )
+        single_flight = CacheSingleFlight(shared_cache, lock_timeout=0.1)
+
+        def outlive_lock():
+            time.sleep(0.2)
+            assert shared_cache.add('key-lock', 42, 60)  # taken over by another caller
+            return 'value'
+
+        assert single_flight.do('key', outlive_lock, 60) == 'value'
+        assert shared_cache.get('key-lock') == 42
+        assert single_flight.do('other', lambda: 'value', 60) == 'value'
+        assert shared_cache.get('other-lock') is None
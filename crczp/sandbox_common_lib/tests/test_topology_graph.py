@@ -0,0 +1,219 @@
+"""Tests for the indexed view of topology instances."""
+
+# pylint: disable=redefined-outer-name
+import gc
+import weakref
+
+import pytest
+
+from crczp.cloud_commons import CrczpException, SecurityGroups
+from crczp.sandbox_common_lib.tests.topologies import create_topology_instance, measure
+from crczp.sandbox_common_lib.topology_graph import TopologyGraph, get_topology_graph
+
+
+@pytest.fixture
+def top_ins():
+    """Return a topology instance of 200 user-defined nodes."""
+    return create_topology_instance(routers=20, hosts_per_router=9)
+
+
+@pytest.fixture
+def graph(top_ins):
+    """Return the graph of the topology instance."""
+    return TopologyGraph(top_ins)
+
+
+def names(links):
+    """Return the link names, to compare the links regardless of their identity."""
+    return [link.name for link in links]
+
+
+class TestTopologyGraph:
+    """Tests that the graph answers the queries as the topology instance does."""
+
+    def test_size(self, top_ins):
+        """Test the size of the synthetic topology."""
+        assert len(top_ins.get_nodes_without_man()) == 200
+
+    def test_node_links(self, top_ins, graph):
+        """Test the links of nodes, also restricted to the user-defined networks."""
+        for node in top_ins.get_nodes():
+            assert names(graph.get_node_links(node)) == names(top_ins.get_node_links(node))
+            assert names(graph.get_hosts_network_links(node)) == names(
+                top_ins.get_node_links(node, top_ins.get_hosts_networks())
+            )
+
+    def test_network_links(self, top_ins, graph):
+        """Test the links of networks, also restricted to their hosts and routers."""
+        visible_hosts = top_ins.get_visible_hosts()
+        for network in top_ins.get_networks():
+            assert names(graph.get_network_links(network)) == names(
+                top_ins.get_network_links(network)
+            )
+            assert names(graph.get_network_host_links(network)) == names(
+                top_ins.get_network_links(network, top_ins.get_hosts())
+            )
+            assert names(graph.get_network_host_links(network, visible_only=True)) == names(
+                top_ins.get_network_links(network, visible_hosts)
+            )
+            assert names(graph.get_network_router_links(network)) == names(
+                top_ins.get_network_links(network, top_ins.get_routers())
+            )
+
+    def test_link_between_node_and_network(self, top_ins, graph):
+        """Test the link of a node to a network."""
+        for node in top_ins.get_nodes():
+            for network in (top_ins.wan, top_ins.man_network, top_ins.get_network('network-0')):
+                expected = top_ins.get_link_between_node_and_network(node, network)
+                link = graph.get_link_between_node_and_network(node, network)
+                assert link is expected
+
+    def test_link_between_node_and_network_ambiguous(self, top_ins, graph):
+        """Test that more links between a node and a network are refused."""
+        router = top_ins.get_node('router-0')
+        top_ins._add_link(router, top_ins.wan, SecurityGroups.SANDBOX_INTERNAL)  # pylint: disable=protected-access
+
+        with pytest.raises(CrczpException):
+            TopologyGraph(top_ins).get_link_between_node_and_network(router, top_ins.wan)
+        assert graph.get_link_between_node_and_network(router, top_ins.wan)
+
+    def test_special_links(self, top_ins, graph):
+        """Test the WAN, user-accessible and management links."""
+        assert names(graph.get_links_from_wan_to_routers()) == names(
+            top_ins.get_links_from_wan_to_routers()
+        )
+        assert names(graph.get_links_to_user_accessible_nodes()) == names(
+            top_ins.get_links_to_user_accessible_nodes()
+        )
+        assert names(graph.get_management_links()) == names(
+            pair.second for pair in top_ins.get_link_pairs_man_to_nodes_over_management_network()
+        )
+
+    def test_routers(self, top_ins, graph):
+        """Test the router adjacency of the user-defined networks."""
+        for router in top_ins.get_routers():
+            assert [network.name for network in graph.get_router_networks(router)] == [
+                link.network.name
+                for link in top_ins.get_node_links(router, top_ins.get_hosts_networks())
+            ]
+        assert graph.get_network_router_name(top_ins.get_network('network-0')) == 'router-0'
+        assert graph.get_network_router_name(top_ins.wan) is None
+
+    def test_visibility(self, top_ins, graph):
+        """Test the visible hosts and networks."""
+        assert graph.get_visible_networks() == top_ins.get_visible_networks()
+        assert {host.name for host in graph.get_visible_hosts()} == {
+            host.name for host in top_ins.get_visible_hosts()
+        }
+
+    def test_get_topology_graph_is_memoized(self, top_ins):
+        """Test that the graph of a topology instance is built once."""
+        assert get_topology_graph(top_ins) is get_topology_graph(top_ins)
+        assert get_topology_graph(top_ins) is not get_topology_graph(
+            create_topology_instance(routers=1, hosts_per_router=1)
+        )
+
+    def test_memoized_graph_does_not_keep_topology_instance(self):
+        """Test that the memoized graph is released with its topology instance."""
+        top_ins = create_topology_instance(routers=1, hosts_per_router=1)
+        get_topology_graph(top_ins)
+        top_ins_ref = weakref.ref(top_ins)
+
+        del top_ins
+        gc.collect()
+
+        assert top_ins_ref() is None
+
+
+@pytest.mark.benchmark
+class TestTopologyGraphBenchmark:
+    """
+    Microbenchmarks of the link queries on a topology of 200 nodes. The graph is built
+    once per topology instance and shared by all its consumers, so its build time
+    is reported separately.
+    """
+
+    @staticmethod
+    def naive_node_ips(top_ins):
+        """Return the links of every node to the user-defined networks and WAN."""
+        return [
+            names(top_ins.get_node_links(node, top_ins.get_hosts_networks()))
+            + names(top_ins.get_node_links(node, [top_ins.wan]))
+            for node in top_ins.get_nodes()
+        ]
+
+    @staticmethod
+    def indexed_node_ips(top_ins, graph):
+        """Return the links of every node to the user-defined networks and WAN."""
+        result = []
+        for node in top_ins.get_nodes():
+            wan_link = graph.get_link_between_node_and_network(node, top_ins.wan)
+            result.append(
+                names(graph.get_hosts_network_links(node)) + names([wan_link] if wan_link else [])
+            )
+        return result
+
+    @staticmethod
+    def naive_visualization(top_ins):
+        """Return the links queried by the topology visualization and the SSH configs."""
+        hosts = [
+            names(top_ins.get_network_links(network, top_ins.get_visible_hosts()))
+            for network in top_ins.get_visible_networks()
+        ]
+        routers = [
+            names(top_ins.get_node_links(router, top_ins.get_hosts_networks()))
+            for router in top_ins.get_visible_routers()
+        ]
+        return hosts, routers, names(top_ins.get_links_to_user_accessible_nodes())
+
+    @staticmethod
+    def indexed_visualization(top_ins, graph):
+        """Return the links queried by the topology visualization and the SSH configs."""
+        hosts = [
+            names(graph.get_network_host_links(network, visible_only=True))
+            for network in graph.get_visible_networks()
+        ]
+        routers = [
+            names(graph.get_hosts_network_links(router)) for router in top_ins.get_visible_routers()
+        ]
+        return hosts, routers, names(graph.get_links_to_user_accessible_nodes())
+
+    @staticmethod
+    def report(name: str, naive: float, build: float, queries: float) -> None:
+        """Print the measurements."""
+        print(
+            f'\n{name}: topology instance {naive * 1000:.2f} ms,'
+            f' graph build {build * 1000:.2f} ms + queries {queries * 1000:.2f} ms,'
+            f' queries {naive / queries:.1f}x faster'
+        )
+
+    @pytest.mark.parametrize('workload', ['node_ips', 'visualization'])
+    def test_queries(self, top_ins, graph, workload):
+        """Benchmark a workload of queries against the topology instance and the graph."""
+        naive = getattr(self, f'naive_{workload}')
+        indexed = getattr(self, f'indexed_{workload}')
+        assert naive(top_ins) == indexed(top_ins, graph)
+
+        self.report(
+            workload,
+            measure(lambda: naive(top_ins)),
+            measure(lambda: TopologyGraph(top_ins)),
+            measure(lambda: indexed(top_ins, graph)),
+        )
+
+    def test_access_bundle(self, top_ins):
+        """Benchmark all workloads run when the access bundle of a sandbox is built."""
+
+        def naive():
+            return self.naive_node_ips(top_ins), self.naive_visualization(top_ins)
+
+        def indexed():
+            graph = TopologyGraph(top_ins)
+            return self.indexed_node_ips(top_ins, graph), self.indexed_visualization(top_ins, graph)
+
+        assert naive() == indexed()
+        naive_time, indexed_time = measure(naive), measure(indexed)
+        print(
+            f'\naccess bundle: topology instance {naive_time * 1000:.2f} ms,'
+            f' graph {indexed_time * 1000:.2f} ms including its build'
+        )
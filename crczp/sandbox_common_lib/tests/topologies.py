@@ -0,0 +1,87 @@
+"""Synthetic topology instances and timing for tests and benchmarks."""
+
+import io
+import time
+
+import yaml
+
+from crczp.cloud_commons import TopologyInstance, TransformationConfiguration
+from crczp.topology_definition.models import TopologyDefinition
+
+BASE_BOX = {'image': 'debian-12-x86_64', 'mgmt_user': 'debian'}
+
+
+def create_topology_instance(routers: int, hosts_per_router: int) -> TopologyInstance:
+    """
+    Create a topology instance of routers with one network each and hosts in the networks.
+    Every third network is not accessible by the user, every fifth host and every seventh
+    router is hidden.
+    """
+    definition: dict = {
+        'name': 'synthetic',
+        'hosts': [],
+        'routers': [],
+        'networks': [],
+        'net_mappings': [],
+        'router_mappings': [],
+        'groups': [],
+    }
+    for router_index in range(routers):
+        network = f'network-{router_index}'
+        definition['routers'].append({
+            'name': f'router-{router_index}',
+            'base_box': BASE_BOX,
+            'flavor': 'standard.small',
+            'hidden': router_index % 7 == 6,
+        })
+        definition['networks'].append({
+            'name': network,
+            'cidr': f'10.{router_index}.0.0/24',
+            'accessible_by_user': router_index % 3 != 2,
+        })
+        definition['router_mappings'].append({
+            'router': f'router-{router_index}',
+            'network': network,
+            'ip': f'10.{router_index}.0.1',
+        })
+        for host_index in range(hosts_per_router):
+            host = f'host-{router_index}-{host_index}'
+            definition['hosts'].append({
+                'name': host,
+                'base_box': BASE_BOX,
+                'flavor': 'standard.small',
+                'hidden': host_index % 5 == 4,
+            })
+            definition['net_mappings'].append({
+                'host': host,
+                'network': network,
+                'ip': f'10.{router_index}.0.{host_index + 10}',
+            })
+    if routers > 1:
+        # A network routed by two routers, the first one in alphabetical order routes it.
+        definition['router_mappings'].append({
+            'router': 'router-1',
+            'network': 'network-0',
+            'ip': '10.0.0.2',
+        })
+
+    top_def = TopologyDefinition.load(io.StringIO(yaml.dump(definition, sort_keys=False)))
+    trc = TransformationConfiguration('debian-12-x86_64', 'standard.small', 'debian')
+    topology_instance = TopologyInstance(top_def, trc)
+    topology_instance.name = 'synthetic-stack'
+    topology_instance.ip = '10.10.10.10'
+    for index, link in enumerate(topology_instance.get_links()):
+        link.mac = f'fa:16:3e:{index >> 16 & 0xFF:02x}:{index >> 8 & 0xFF:02x}:{index & 0xFF:02x}'
+        if link.ip is None:
+            link.ip = f'172.{16 + (index >> 16)}.{index >> 8 & 0xFF}.{index & 0xFF}'
+    return topology_instance
+
+
+def measure(function, repeat: int = 5) -> float:
+    """Return the best time of the function in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
@@ -0,0 +1,239 @@
+"""
+Indexed view of a topology instance.
+
+The link queries of TopologyInstance filter the links of a node or a network by testing
+membership in a list of networks or nodes, and its visibility queries are recomputed on
+every call, so building the inventory, the SSH configs or the topology visualization
+of a sandbox takes time quadratic in its size. TopologyGraph builds the adjacency maps
+of the topology once and answers the same queries by dictionary lookups.
+"""
+
+import threading
+import weakref
+from collections import defaultdict
+
+from crczp.cloud_commons import CrczpException, Link, TopologyInstance
+from crczp.cloud_commons.topology_elements import Node
+from crczp.topology_definition.models import Host, Network, Router
+
+
+class TopologyGraph:  # pylint: disable=too-many-instance-attributes
+    """
+    Node, network and router adjacency maps of a topology instance.
+
+    The graph keeps references to the links of the topology instance, so changes of their
+    addresses are visible through it, but it has to be rebuilt if links are added.
+    """
+
+    def __init__(self, topology_instance: TopologyInstance) -> None:
+        # Not a strong reference, the graph is memoized by its topology instance.
+        self._topology_instance = weakref.ref(topology_instance)
+        ti = topology_instance
+
+        host_names = {host.name for host in ti.get_hosts()}
+        router_names = {router.name for router in ti.get_routers()}
+        hosts_network_names = {network.name for network in ti.get_hosts_networks()}
+        self._visible_networks = self._get_visible_networks(ti)
+        visible_network_names = {network.name for network in self._visible_networks}
+        self._visible_host_names = {
+            mapping.host
+            for mapping in ti.topology_definition.net_mappings
+            if mapping.host in host_names
+            and not ti.get_node(mapping.host).hidden
+            and mapping.network in visible_network_names
+        }
+        self._network_router = self._get_network_to_router_mapping(ti)
+
+        # Names are read once per link, attribute access of the topology elements is slow.
+        self._node_links: dict[str, list[Link]] = defaultdict(list)
+        self._network_links: dict[str, list[Link]] = defaultdict(list)
+        self._node_network_links: dict[tuple[str, str], list[Link]] = defaultdict(list)
+        self._hosts_network_links: dict[str, list[Link]] = defaultdict(list)
+        self._network_host_links: dict[str, list[Link]] = defaultdict(list)
+        self._network_visible_host_links: dict[str, list[Link]] = defaultdict(list)
+        self._network_router_links: dict[str, list[Link]] = defaultdict(list)
+        self._router_networks: dict[str, list[Network]] = defaultdict(list)
+        for link in ti.get_links():
+            node_name, network_name = link.node.name, link.network.name
+            self._node_links[node_name].append(link)
+            self._network_links[network_name].append(link)
+            self._node_network_links[node_name, network_name].append(link)
+            if network_name in hosts_network_names:
+                self._hosts_network_links[node_name].append(link)
+            if node_name in host_names:
+                self._network_host_links[network_name].append(link)
+                if node_name in self._visible_host_names:
+                    self._network_visible_host_links[network_name].append(link)
+            elif node_name in router_names:
+                self._network_router_links[network_name].append(link)
+                if network_name in hosts_network_names:
+                    self._router_networks[node_name].append(link.network)
+
+    @property
+    def topology_instance(self) -> TopologyInstance:
+        """The topology instance of the graph."""
+        topology_instance = self._topology_instance()
+        if topology_instance is None:
+            raise ReferenceError('The topology instance of the graph no longer exists')
+        return topology_instance
+
+    def get_node_links(self, node: Node) -> list[Link]:
+        """
+        Return the links of the node.
+        """
+        return self._node_links.get(node.name, [])
+
+    def get_hosts_network_links(self, node: Node) -> list[Link]:
+        """
+        Return the links of the node to the user-defined networks.
+        """
+        return self._hosts_network_links.get(node.name, [])
+
+    def get_network_links(self, network: Network) -> list[Link]:
+        """
+        Return the links of the network.
+        """
+        return self._network_links.get(network.name, [])
+
+    def get_network_host_links(self, network: Network, visible_only: bool = False) -> list[Link]:
+        """
+        Return the links of the network to hosts.
+
+        :param network: The network
+        :param visible_only: Whether to skip the hosts which are not visible, see get_visible_hosts
+        :return: Links of the network to hosts
+        """
+        links = self._network_visible_host_links if visible_only else self._network_host_links
+        return links.get(network.name, [])
+
+    def get_network_router_links(self, network: Network) -> list[Link]:
+        """
+        Return the links of the network to routers.
+        """
+        return self._network_router_links.get(network.name, [])
+
+    def get_link_between_node_and_network(self, node: Node, network: Network) -> Link | None:
+        """
+        Return the link between the node and the network, None if they are not linked.
+
+        :raise CrczpException: The node has more than one link to the network
+        """
+        links = self._node_network_links.get((node.name, network.name), [])
+        if not links:
+            return None
+        if len(links) > 1:
+            raise CrczpException(
+                'invalid number of links between server and network, '
+                f'there should be exactly 1 link, got: {links}'
+            )
+        return links[0]
+
+    def get_links_from_wan_to_routers(self) -> list[Link]:
+        """
+        Return the links between the routers and WAN.
+        """
+        wan = self.topology_instance.wan
+        links = (
+            self.get_link_between_node_and_network(router, wan)
+            for router in self.topology_instance.get_routers()
+        )
+        return [link for link in links if link is not None]
+
+    def get_links_to_user_accessible_nodes(self) -> list[Link]:
+        """
+        Return the links between the user-accessible networks and their hosts and routers.
+        """
+        links: list[Link] = []
+        for network in self.topology_instance.get_user_accessible_hosts_networks():
+            links.extend(self.get_network_host_links(network))
+            links.extend(self.get_network_router_links(network))
+        return links
+
+    def get_management_links(self) -> list[Link]:
+        """
+        Return the links of all nodes but MAN to the management network.
+
+        :raise CrczpException: Some node is not linked to the management network
+        """
+        ti = self.topology_instance
+        links = [link for link in self.get_network_links(ti.man_network) if link.node is not ti.man]
+        if len(links) != len(ti.get_nodes()) - 1:
+            raise CrczpException(
+                'invalid number of links between MAN and all other machines '
+                f'over management network, got: {links}'
+            )
+        return links
+
+    def get_router_networks(self, router: Router) -> list[Network]:
+        """
+        Return the user-defined networks linked to the router.
+        """
+        return self._router_networks.get(router.name, [])
+
+    def get_network_router_name(self, network: Network) -> str | None:
+        """
+        Return the name of the router routing the user-defined network, None if it has none.
+        The network is routed by the first of its routers in alphabetical order.
+        """
+        return self._network_router.get(network.name)
+
+    def get_network_to_router_mapping(self) -> dict[str, str]:
+        """
+        Return Dict[network_name, router_name] of the routers routing the user-defined networks.
+        """
+        return dict(self._network_router)
+
+    def get_visible_networks(self) -> list[Network]:
+        """
+        Return the networks which are not hidden and whose router is not hidden, and WAN.
+        """
+        return self._visible_networks
+
+    def get_visible_hosts(self) -> list[Host]:
+        """
+        Return the hosts which are not hidden directly or through their network.
+        """
+        return [
+            host
+            for host in self.topology_instance.get_hosts()
+            if host.name in self._visible_host_names
+        ]
+
+    @staticmethod
+    def _get_network_to_router_mapping(topology_instance: TopologyInstance) -> dict[str, str]:
+        network_to_router = {}
+        router_mappings = sorted(
+            topology_instance.topology_definition.router_mappings,
+            key=lambda x: x.router,
+            reverse=True,
+        )
+        for router_mapping in router_mappings:
+            network_to_router[router_mapping.network] = router_mapping.router
+        return network_to_router
+
+    @staticmethod
+    def _get_visible_networks(topology_instance: TopologyInstance) -> list[Network]:
+        ti = topology_instance
+        visible_router_names = {router.name for router in ti.get_visible_routers()}
+        return [
+            ti.get_network(mapping.network)
+            for mapping in ti.topology_definition.router_mappings
+            if mapping.router in visible_router_names and not ti.get_network(mapping.network).hidden
+        ] + [ti.wan]
+
+
+_graphs: 'weakref.WeakKeyDictionary[TopologyInstance, TopologyGraph]' = weakref.WeakKeyDictionary()
+_graphs_lock = threading.Lock()
+
+
+def get_topology_graph(topology_instance: TopologyInstance) -> TopologyGraph:
+    """
+    Return the graph of the topology instance, building it on the first call.
+    The graph lives as long as the topology instance.
+    """
+    with _graphs_lock:
+        graph = _graphs.get(topology_instance)
+        if graph is None:
+            graph = TopologyGraph(topology_instance)
+            _graphs[topology_instance] = graph
+        return graph
@@ -7,9 +7,11 @@ import gzip
 import json
 import logging
 import uuid
-from typing import Any
+from collections.abc import AsyncIterator, Iterator
+from typing import Any, cast
 
 import structlog
+from asgiref.sync import sync_to_async
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
@@ -17,12 +19,16 @@ from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
 from django.conf import settings
 from django.core.cache import cache
-from django.http import Http404
+from django.http import Http404, HttpRequest
+from django.http.response import HttpResponseBase
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from drf_spectacular.utils import OpenApiResponse
 from rest_framework import serializers, status
 from rest_framework.generics import get_object_or_404 as gen_get_object_or_404
 from rest_framework.response import Response
 
+from crczp.sandbox_common_lib import deadlines
 from crczp.terraform_driver import CrczpTerraformClient
 
 # Create logger
@@ -33,6 +39,24 @@ WIN_USERNAME = 'windows'
 OID = '1.3.6.1.4.1.311.20.2.3'
 # First two bytes are 'FORM FEED' and 'DEVICE CONTROL ONE' in order.
 OID_LOGIN = '\x0c\x11' + WIN_USERNAME + '@localhost'
+# Methods of the terraform client which do not change the cloud, their calls may be abandoned.
+TERRAFORM_CLIENT_READ_ONLY_METHODS = frozenset({
+    'get_console_url',
+    'get_enriched_topology_instance',
+    'get_flavors_dict',
+    'get_hardware_usage',
+    'get_image',
+    'get_keypair',
+    'get_node',
+    'get_project_limits',
+    'get_project_name',
+    'get_quota_set',
+    'get_topology_instance',
+    'list_images',
+    'list_stack_resources',
+    'list_stacks',
+    'validate_hardware_usage_of_stacks',
+})
 
 
 def configure_logging() -> None:
@@ -139,8 +163,16 @@ def generate_ssh_keypair(bits: int = 2048) -> tuple[str, str]:
 def get_terraform_client() -> CrczpTerraformClient:
     """
     Simplify access for the terraform client.
+    Within an API request, the calls of its read-only methods are bounded by the request deadline.
     """
-    return settings.TERRAFORM_CLIENT
+    if deadlines.remaining() is None:
+        return settings.TERRAFORM_CLIENT
+    return cast(
+        CrczpTerraformClient,
+        deadlines.DeadlineProxy(
+            'the cloud', settings.TERRAFORM_CLIENT, TERRAFORM_CLIENT_READ_ONLY_METHODS
+        ),
+    )
 
 
 def clear_cache(cache_key: str) -> None:
@@ -152,6 +184,19 @@ def clear_cache(cache_key: str) -> None:
     cache.delete(cache_key)
 
 
+async def aiter_chunks(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Iterate the chunks of a synchronous iterator asynchronously, so that they are streamed
+    under ASGI. The chunks are produced in the same thread, the iterator may read the database.
+
+    :param chunks: Iterator of the chunks
+    :return: Async iterator of the chunks
+    """
+    end = b''
+    while chunk := await sync_to_async(next, thread_sensitive=True)(chunks, end):
+        yield chunk
+
+
 def get_simple_uuid() -> str:
     """First four bytes of UUID as string."""
     return str(uuid.uuid4()).split('-', maxsplit=1)[0]
@@ -211,3 +256,21 @@ def create_compressed_response(data: dict[str, Any]) -> Response:
         return response
 
     return Response(data)
+
+
+def create_conditional_response(
+    request: HttpRequest, etag: str, response: HttpResponseBase
+) -> HttpResponseBase:
+    """
+    Tag the response with the ETag of its content, or answer 304 Not Modified
+    if the client has the current content (its If-None-Match matches the ETag).
+    Clients must revalidate the response before reusing it, shared caches must not store it.
+
+    :param request: The request
+    :param etag: The ETag of the response content, unquoted
+    :param response: The response
+    :return: The response or the 304 response
+    """
+    response['ETag'] = quote_etag(etag)
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=response['ETag'], response=response) or response
@@ -0,0 +1,179 @@
+"""
+Conditional requests against the GitLab and GitHub APIs.
+
+Validators (ETag, Last-Modified) and payloads of successful GET responses are kept in
+a process-wide cache. Later requests of the same resource are sent with If-None-Match
+and If-Modified-Since headers and a 304 Not Modified response is answered from the cache.
+GitHub does not count 304 responses against the rate limit.
+Within an API request, the timeouts of the requests are bounded by its deadline.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, override
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from crczp.sandbox_common_lib import deadlines, http_client
+
+MAX_ENTRIES = 1024
+OK = 'ok'
+NOT_MODIFIED = 'not_modified'
+CREDENTIAL_HEADERS = ('Authorization', 'PRIVATE-TOKEN', 'JOB-TOKEN')
+
+
+@dataclass
+class CachedResponse:
+    """Validators and payload of a successful response.
+
+    Attributes:
+        etag (str | None): The ETag header of the response.
+        last_modified (str | None): The Last-Modified header of the response.
+        payload (Any): The body of the response.
+        content_type (str | None): The Content-Type header of the response.
+    """
+
+    etag: str | None
+    last_modified: str | None
+    payload: Any
+    content_type: str | None = None
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Return the headers making a request conditional on this response."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of responses with validators, counting the responses
+    received in full (200) and confirmed not modified (304).
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._counters = {OK: 0, NOT_MODIFIED: 0}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedResponse | None:
+        """Return the cached response, None if there is none."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key: str, headers: Any, payload: Any) -> None:
+        """
+        Cache the response if it carries any validator.
+
+        :param key: Key of the requested resource, see make_key
+        :param headers: Headers of the response
+        :param payload: Body of the response
+        """
+        headers = CaseInsensitiveDict(headers)
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._entries[key] = CachedResponse(
+                etag, last_modified, payload, headers.get('Content-Type')
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, outcome: str) -> None:
+        """Count a response, OK or NOT_MODIFIED."""
+        with self._lock:
+            self._counters[outcome] += 1
+
+    def get_stats(self) -> dict[str, int]:
+        """Return the response counters and the number of cached responses."""
+        with self._lock:
+            return {**self._counters, 'entries': len(self._entries)}
+
+    def clear(self) -> None:
+        """Drop all cached responses and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+RESPONSES = ResponseCache()
+
+
+def make_key(url: str, credentials: str | None = None, accept: str | None = None) -> str:
+    """
+    Return the cache key of a resource. Responses of different credentials are kept
+    apart, as they may differ in what the credentials are allowed to see.
+
+    :param url: URL of the resource, including the query
+    :param credentials: The access token or authorization header the request is sent with
+    :param accept: The Accept header of the request
+    :return: The cache key
+    """
+    credentials_hash = hashlib.sha256((credentials or '').encode()).hexdigest()
+    return f'{url}|{credentials_hash}|{accept or ""}'
+
+
+class ConditionalCacheAdapter(HTTPAdapter):
+    """
+    Transport adapter sending GET requests conditionally and replaying the cached
+    response when the server answers 304 Not Modified.
+    """
+
+    def __init__(self, response_cache: ResponseCache = RESPONSES, **kwargs: Any) -> None:
+        self.response_cache = response_cache
+        super().__init__(**kwargs)
+
+    @override
+    def send(  # type: ignore[override]
+        self,
+        request: requests.PreparedRequest,
+        stream: bool = False,
+        timeout: Any = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        destination = http_client.get_destination(str(request.url))
+        kwargs['timeout'] = deadlines.clamp_timeout(timeout, destination)
+        with deadlines.enforced(destination):
+            return self._send(request, stream, **kwargs)
+
+    def _send(
+        self, request: requests.PreparedRequest, stream: bool, **kwargs: Any
+    ) -> requests.Response:
+        if request.method != 'GET' or stream:
+            return super().send(request, stream=stream, **kwargs)
+
+        credentials = next(
+            (request.headers[name] for name in CREDENTIAL_HEADERS if name in request.headers),
+            None,
+        )
+        key = make_key(str(request.url), credentials, request.headers.get('Accept'))
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            request.headers.update(cached.conditional_headers())
+
+        response = super().send(request, stream=stream, **kwargs)
+        if response.status_code == requests.codes.not_modified and cached is not None:
+            self.response_cache.record(NOT_MODIFIED)
+            response.status_code = requests.codes.ok
+            response._content = cached.payload  # pylint: disable=protected-access
+            if cached.content_type:
+                response.headers['Content-Type'] = cached.content_type
+                response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+            return response
+        if response.status_code == requests.codes.ok:
+            self.response_cache.record(OK)
+            self.response_cache.store(key, response.headers, response.content)
+        return response
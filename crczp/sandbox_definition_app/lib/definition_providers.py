@@ -1,22 +1,44 @@
 """Git provider implementations for accessing sandbox definition files."""
 
 import base64
+import posixpath
+import re
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections.abc import Callable
 from typing import Any, override
-from urllib.parse import ParseResult, urlparse
+from urllib.parse import ParseResult, quote, urlencode, urlparse
 
+import git
 import gitlab
 import requests
 import structlog
+from django.core.cache import cache
 from github import Auth, Github, GithubException, UnknownObjectException
 from github.Branch import Branch
 from github.Tag import Tag
 
-from crczp.sandbox_common_lib import exceptions, git_config
+from crczp.sandbox_common_lib import deadlines, exceptions, git_config
 from crczp.sandbox_common_lib.crczp_config import CrczpConfiguration, TopologyCacheMode
+from crczp.sandbox_common_lib.single_flight import SingleFlight
+from crczp.sandbox_definition_app.lib import conditional_requests
 
 LOG = structlog.get_logger()
 CRCZP_GIT_PREFIX = 'repos'
+FULL_SHA_PATTERN = re.compile(r'[0-9a-f]{40}')
+REV_SHA_CACHE_KEY = 'git-rev-sha-{}-{}-{}'
+PROVIDER_IDLE_TIMEOUT = 600
+GITHUB_POOL_SIZE = 10
+GITHUB = 'GitHub'
+
+_rev_resolutions = SingleFlight()
+
+
+def clear_rev_sha_cache(url: str, rev: str) -> None:
+    """Forget the cached commit SHA of the rev of the repository."""
+    project_path = GitlabProvider.get_project_path(urlparse(url))
+    cache.delete(REV_SHA_CACHE_KEY.format(git_config.get_rest_server(url), project_path, rev))
 
 
 class DefinitionProvider(ABC):
@@ -31,6 +53,10 @@ class DefinitionProvider(ABC):
     def get_file(self, path: str, rev: str) -> str:
         """Get file from repo as a string."""
 
+    @abstractmethod
+    def close(self) -> None:
+        """Release the HTTP connections of the provider."""
+
     @abstractmethod
     def get_refs(self) -> list[Any]:
         """Get a list of refs (branches + tags)."""
@@ -58,6 +84,8 @@ class GitlabProvider(DefinitionProvider):
         super().__init__(url, config)
         url_parsed = self.validate_https(url)
         self.project_path = self.get_project_path(url_parsed)
+        self.rev_cache_timeout = config.git_rev_cache_timeout
+        self._project: Any = None
 
         if self.git_access_token:
             self.gl = gitlab.Gitlab(
@@ -69,12 +97,24 @@ class GitlabProvider(DefinitionProvider):
             self.gl = gitlab.Gitlab(
                 self.git_rest_server, ssl_verify=not config.git_skip_ssl_verification
             )
+        # Files, commits and refs are requested conditionally on their cached validators.
+        self.gl.session.mount('https://', conditional_requests.ConditionalCacheAdapter())
+
+    @override
+    def close(self) -> None:
+        self.gl.session.close()
+
+    def get_project(self) -> Any:
+        """Return the project of this repository, without requesting it from the API."""
+        if self._project is None:
+            self._project = self.gl.projects.get(self.project_path, lazy=True)
+        return self._project
 
     @override
     def get_file(self, path: str, rev: str) -> str:
         """Get file from repo as a string."""
         try:
-            project = self.gl.projects.get(self.project_path)
+            project = self.get_project()
             file = project.files.get(file_path=path, ref=rev)
             return file.decode().decode()  # One decode to get content, one from bytes to str
         except (requests.exceptions.RequestException, gitlab.exceptions.GitlabError) as ex:
@@ -83,7 +123,7 @@ class GitlabProvider(DefinitionProvider):
     def get_branches(self) -> list[Any]:
         """Return a list of branches for this repository."""
         try:
-            project = self.gl.projects.get(self.project_path)
+            project = self.get_project()
             return project.branches.list()
         except (requests.exceptions.RequestException, gitlab.exceptions.GitlabError) as ex:
             raise exceptions.GitError(ex) from ex
@@ -91,7 +131,7 @@ class GitlabProvider(DefinitionProvider):
     def get_tags(self) -> list[Any]:
         """Return a list of tags for this repository."""
         try:
-            project = self.gl.projects.get(self.project_path)
+            project = self.get_project()
             return project.tags.list()
         except (requests.exceptions.RequestException, gitlab.exceptions.GitlabError) as ex:
             raise exceptions.GitError(ex) from ex
@@ -102,13 +142,40 @@ class GitlabProvider(DefinitionProvider):
 
     @override
     def get_rev_sha(self, rev: str) -> str:
+        """
+        Resolve the rev to its commit SHA.
+
+        A full commit SHA is returned as it is. Resolved branches, tags and short SHAs
+        are cached for git_rev_cache_timeout seconds and concurrent resolutions of the
+        same rev are done only once.
+        """
+        if FULL_SHA_PATTERN.fullmatch(rev):
+            return rev
+        cache_key = REV_SHA_CACHE_KEY.format(self.git_rest_server, self.project_path, rev)
+        rev_sha = cache.get(cache_key)
+        if rev_sha is None:
+            rev_sha = _rev_resolutions.do(cache_key, lambda: self._resolve_rev(rev, cache_key))
+        return rev_sha  # type: ignore[no-any-return]
+
+    def _resolve_rev(self, rev: str, cache_key: str) -> str:
+        # The rev may have been resolved by a call finished since the cache was checked.
+        rev_sha = cache.get(cache_key)
+        if rev_sha is None:
+            rev_sha = self._get_ref_sha(rev)
+            cache.set(cache_key, rev_sha, self.rev_cache_timeout)
+        return rev_sha  # type: ignore[no-any-return]
+
+    def _get_ref_sha(self, rev: str) -> str:
+        """Look the rev up as a branch, a tag and a commit, in this order."""
         try:
-            for ref in self.get_refs():
-                if ref.name == rev:
-                    return ref.commit['id']  # type: ignore[no-any-return]
-            project = self.gl.projects.get(self.project_path)
-            commit = project.commits.get(rev)
-            return commit.id  # type: ignore[no-any-return]
+            project = self.get_project()
+            for refs in (project.branches, project.tags):
+                try:
+                    return refs.get(rev).commit['id']  # type: ignore[no-any-return]
+                except gitlab.exceptions.GitlabGetError as ex:
+                    if ex.response_code != requests.codes.not_found:
+                        raise
+            return project.commits.get(rev).id  # type: ignore[no-any-return]
         except (requests.exceptions.RequestException, gitlab.exceptions.GitlabError) as ex:
             raise exceptions.GitError('Failed to get sha of the GIT rev.', ex) from ex
 
@@ -123,22 +190,29 @@ class GitlabProvider(DefinitionProvider):
 class GitHubProvider(DefinitionProvider):
     """
     Sandbox definition provider compatible with GitHub.
+    PyGithub has no per-call timeouts, so its calls are bounded by the request deadline.
     """
 
     def __init__(self, url: str, config: CrczpConfiguration) -> None:
         super().__init__(url, config)
         self.topology_cache_mode = config.topology_cache_mode
         if self.git_access_token:
-            github_client = Github(auth=Auth.Token(self.git_access_token))
+            self.github_client = Github(
+                auth=Auth.Token(self.git_access_token), pool_size=GITHUB_POOL_SIZE
+            )
         else:
-            github_client = Github()
+            self.github_client = Github(pool_size=GITHUB_POOL_SIZE)
 
         repo_name = self._get_repo_name(url)
         try:
-            self.repo = github_client.get_repo(repo_name)
+            self.repo = deadlines.call(GITHUB, self.github_client.get_repo, repo_name)
         except (GithubException, requests.exceptions.RequestException) as exc:
             raise exceptions.GitError(f'Cannot find the GitHub repository [url: {url}]') from exc
 
+    @override
+    def close(self) -> None:
+        self.github_client.close()
+
     def _get_repo_name(self, url: str) -> str:
         return url.removeprefix(self.git_rest_server).removesuffix('.git')
 
@@ -148,7 +222,12 @@ class GitHubProvider(DefinitionProvider):
         Get the plain text content of the file.
         """
         try:
-            contents = self.repo.get_contents(path, ref=rev)
+            contents = deadlines.call(
+                GITHUB,
+                self._conditional_get,
+                f'{self.repo.url}/contents/{quote(path)}',
+                {'ref': rev},
+            )
         except (
             UnknownObjectException,
             GithubException,
@@ -161,13 +240,42 @@ class GitHubProvider(DefinitionProvider):
             raise exceptions.GitError(
                 f"Path '{path}' is a directory in {self.repo.name} [rev: '{rev}']"
             )
-        return base64.b64decode(contents.content).decode()
+        return base64.b64decode(contents['content']).decode()
+
+    def _conditional_get(self, url: str, parameters: dict[str, str] | None = None) -> Any:
+        """
+        GET the API resource, sent conditionally on the validators of its cached response.
+
+        :param url: URL of the resource
+        :param parameters: Query parameters of the request
+        :return: The parsed JSON body, taken from the cache if the resource is not modified
+        :raise: GithubException if the request fails
+        """
+        responses = conditional_requests.RESPONSES
+        query = f'?{urlencode(sorted(parameters.items()))}' if parameters else ''
+        key = conditional_requests.make_key(f'{url}{query}', self.git_access_token)
+        cached = responses.get(key)
+        headers, data = self.github_client.requester.requestJsonAndCheck(
+            'GET',
+            url,
+            parameters=parameters,
+            headers=cached.conditional_headers() if cached is not None else None,
+        )
+        # PyGithub returns no data for a 304 Not Modified response.
+        if data is None and cached is not None:
+            responses.record(conditional_requests.NOT_MODIFIED)
+            return cached.payload
+        responses.record(conditional_requests.OK)
+        responses.store(key, headers, data)
+        return data
 
     @override
     def get_refs(self) -> list[Branch | Tag]:
         """Return a list of branches and tags for this repository."""
         try:
-            return list(self.repo.get_branches()) + list(self.repo.get_tags())
+            return deadlines.call(  # type: ignore[no-any-return]
+                GITHUB, lambda: list(self.repo.get_branches()) + list(self.repo.get_tags())
+            )
         except (GithubException, requests.exceptions.RequestException) as exc:
             raise exceptions.GitError('Failed to get refs from GitHub repository.') from exc
 
@@ -184,10 +292,147 @@ class GitHubProvider(DefinitionProvider):
         if self.topology_cache_mode is not TopologyCacheMode.FRESH:
             return rev
         try:
-            return self.repo.get_commit(rev).sha
+            commit = deadlines.call(
+                GITHUB, self._conditional_get, f'{self.repo.url}/commits/{quote(rev, safe="")}'
+            )
+            return commit['sha']  # type: ignore[no-any-return]
         except (
             UnknownObjectException,
             GithubException,
             requests.exceptions.RequestException,
         ) as exc:
             raise exceptions.GitError('Failed to get sha of the GIT rev.', exc) from exc
+
+
+class MirrorProvider(DefinitionProvider):
+    """
+    Sandbox definition provider reading a local bare mirror of the repository.
+
+    Revs not present in the mirror (e.g. pushed after the last fetch) are served
+    by the fallback REST provider.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        config: CrczpConfiguration,
+        repo: git.Repo,
+        fallback: Callable[[], DefinitionProvider],
+    ) -> None:
+        super().__init__(url, config)
+        self.url = url
+        self.repo = repo
+        self._fallback_factory = fallback
+        self._fallback: DefinitionProvider | None = None
+
+    @override
+    def close(self) -> None:
+        """The mirror and the fallback provider are shared, they are not closed."""
+
+    @property
+    def fallback(self) -> DefinitionProvider:
+        """The REST provider of the repository, created on first use."""
+        if self._fallback is None:
+            self._fallback = self._fallback_factory()
+        return self._fallback
+
+    @override
+    def get_file(self, path: str, rev: str) -> str:
+        """Get the plain text content of the file."""
+        commit = self._get_commit(rev)
+        if commit is None:
+            return self.fallback.get_file(path, rev)
+        try:
+            obj = commit.tree / posixpath.normpath(path)
+        except KeyError as exc:
+            raise exceptions.GitError(f"Cannot find '{path}' in {self.url} [rev: '{rev}']") from exc
+        if obj.type != 'blob':
+            raise exceptions.GitError(f"Path '{path}' is a directory in {self.url} [rev: '{rev}']")
+        return obj.data_stream.read().decode()  # type: ignore[no-any-return]
+
+    @override
+    def get_refs(self) -> list[Any]:
+        """Return a list of branches and tags of the mirror."""
+        return list(self.repo.heads) + list(self.repo.tags)
+
+    @override
+    def get_rev_sha(self, rev: str) -> str:
+        """Resolve a branch, tag or commit to its commit SHA."""
+        commit = self._get_commit(rev)
+        if commit is None:
+            return self.fallback.get_rev_sha(rev)
+        return commit.hexsha
+
+    def _get_commit(self, rev: str) -> git.Commit | None:
+        """Return the commit of the rev, None if it is not in the mirror.
+        Branches take precedence over tags, like in the GitLab provider."""
+        for refs in (self.repo.heads, self.repo.tags):
+            if rev in refs:
+                return refs[rev].commit
+        try:
+            return self.repo.commit(rev)
+        except (git.BadName, ValueError):
+            return None
+
+
+class ProviderRegistry:
+    """
+    Process-wide registry of reusable providers, so their HTTP sessions are kept alive
+    between requests. Providers unused for idle_timeout seconds are closed and dropped.
+    """
+
+    def __init__(self, idle_timeout: float = PROVIDER_IDLE_TIMEOUT) -> None:
+        self.idle_timeout = idle_timeout
+        self._providers: dict[tuple[Any, ...], tuple[DefinitionProvider, float]] = {}
+        self._lock = threading.Lock()
+        self._constructions = SingleFlight()
+
+    def get(
+        self, key: tuple[Any, ...], factory: Callable[[], DefinitionProvider]
+    ) -> DefinitionProvider:
+        """
+        Return the provider registered under the key, constructing it on a miss.
+
+        :param key: Identifier of the provider, e.g. its class, URL and access token
+        :param factory: Callable constructing the provider
+        :return: The registered provider
+        """
+        provider = self._touch(key)
+        if provider is None:
+            provider = self._constructions.do(repr(key), lambda: self._create(key, factory))
+        return provider
+
+    def clear(self) -> None:
+        """Close and drop all providers."""
+        with self._lock:
+            providers = [provider for provider, _ in self._providers.values()]
+            self._providers.clear()
+        for provider in providers:
+            provider.close()
+
+    def _touch(self, key: tuple[Any, ...]) -> DefinitionProvider | None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                (registered_key, provider)
+                for registered_key, (provider, last_used) in self._providers.items()
+                if now - last_used > self.idle_timeout
+            ]
+            for registered_key, _ in expired:
+                del self._providers[registered_key]
+            entry = self._providers.get(key)
+            if entry is not None:
+                self._providers[key] = (entry[0], now)
+        for _, provider in expired:
+            provider.close()
+        return entry[0] if entry is not None else None
+
+    def _create(
+        self, key: tuple[Any, ...], factory: Callable[[], DefinitionProvider]
+    ) -> DefinitionProvider:
+        provider = self._touch(key)
+        if provider is None:
+            provider = factory()
+            with self._lock:
+                self._providers[key] = (provider, time.monotonic())
+        return provider
@@ -2,6 +2,8 @@
 Definition Service module for Definition management.
 """
 
+import contextlib
+import hashlib
 import io
 import os
 from typing import TextIO
@@ -11,20 +13,25 @@ import yaml
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import ProtectedError
 from generator.var_object import Variable
 from yamlize import YamlizingError
 
 from crczp.sandbox_ansible_app.lib.inventory import DefaultAnsibleHostsGroups
-from crczp.sandbox_common_lib import exceptions, git_config, utils
-from crczp.sandbox_common_lib.common_cloud import list_images
+from crczp.sandbox_common_lib import common_cloud, exceptions, git_config, utils
 from crczp.sandbox_common_lib.crczp_config import CrczpConfiguration, GitType, TopologyCacheMode
 from crczp.sandbox_definition_app import serializers
+from crczp.sandbox_definition_app.lib import git_mirrors
 from crczp.sandbox_definition_app.lib.definition_providers import (
     DefinitionProvider,
     GitHubProvider,
     GitlabProvider,
+    MirrorProvider,
+    ProviderRegistry,
+    clear_rev_sha_cache,
 )
-from crczp.sandbox_definition_app.models import Definition
+from crczp.sandbox_definition_app.models import Definition, DefinitionFile
 from crczp.topology_definition.image_naming import image_name_replace
 from crczp.topology_definition.models import DockerContainers, TopologyDefinition
 
@@ -34,6 +41,9 @@ SANDBOX_DEFINITION_FILENAME = 'topology.yml'
 DOCKER_CONTAINERS_FILENAME = 'containers.yml'
 DOCKERFILE_FILENAME = 'Dockerfile'
 VARIABLES_FILENAME = 'variables.yml'
+DEFINITION_CACHE_KEY = 'definition-{}-rev-sha-{}-topology'
+
+PROVIDERS = ProviderRegistry()
 
 
 def create_definition(url: str, created_by: User | None, rev: str = 'master') -> Definition:
@@ -65,7 +75,9 @@ def create_definition(url: str, created_by: User | None, rev: str = 'master') ->
             error_message = f'Unknown error: {serializer.errors}'
 
         raise exceptions.ValidationError(error_message)
-    return serializer.save(created_by=created_by)
+    definition = serializer.save(created_by=created_by)
+    git_mirrors.enqueue_fetch(url)
+    return definition
 
 
 def load_definition(stream: TextIO) -> TopologyDefinition:
@@ -125,7 +137,7 @@ def get_definition(
     cache = caches['topology_cache']
     provider = get_def_provider(url, config)
     rev_sha = provider.get_rev_sha(rev)
-    cache_key = f'definition-{url}-rev-sha-{rev_sha}-topology'
+    cache_key = DEFINITION_CACHE_KEY.format(url, rev_sha)
     if not force_refresh:
         top_def = cache.get(cache_key, None)
         if top_def is not None:
@@ -144,6 +156,22 @@ def get_definition(
     return top_def
 
 
+def invalidate_rev(url: str, rev: str) -> None:
+    """Forget the cached commit SHA of the rev and the topology definition cached by its name.
+
+    Definitions cached by a commit SHA are kept, their content cannot change. On GitLab,
+    definitions are always cached by the commit SHA, so invalidating only drops the SHA
+    the rev resolved to, which would expire after git_rev_cache_timeout anyway; the next
+    request resolves it again. Only GitHub providers in the AGGRESSIVE and FRESH_IMPORT
+    modes cache definitions by the name of the rev, which is kept until it is invalidated.
+
+    :param url: URL of sandbox definition Git repository
+    :param rev: Name of the branch or tag
+    """
+    clear_rev_sha_cache(url, rev)
+    caches['topology_cache'].delete(DEFINITION_CACHE_KEY.format(url, rev))
+
+
 def get_containers(url: str, rev: str, config: CrczpConfiguration) -> DockerContainers:
     """Get containers.yml file content as DockerContainers if the file exists, None otherwise.
 
@@ -191,7 +219,16 @@ def get_variables(url: str, rev: str, config: CrczpConfiguration) -> list[Variab
         raise exceptions.GitError(
             f'Unable to retrieve {VARIABLES_FILENAME} file from repository.\n' + str(ex)
         ) from ex
-    var_list = yaml.safe_load(variables_file)
+    return load_variables(io.StringIO(variables_file))
+
+
+def load_variables(stream: TextIO) -> list[Variable]:
+    """Load APG variables from opened stream of variables.yml file.
+
+    :param stream: The opened stream from which the variables will be loaded
+    :return: array of Variables
+    """
+    var_list = yaml.safe_load(stream)
 
     variables = []
     for var in var_list:
@@ -207,17 +244,69 @@ def get_variables(url: str, rev: str, config: CrczpConfiguration) -> list[Variab
     return variables
 
 
+def store_file(content: str) -> DefinitionFile:
+    """Store the content of a definition file in the content-addressed file store.
+
+    Must be called in the transaction linking the file: the file row stays locked until
+    the transaction ends, so delete_unused_files cannot delete it before it is linked.
+
+    :param content: Content of the file
+    :return: The stored file, shared by all identical contents
+    """
+    digest = hashlib.sha256(content.encode()).hexdigest()
+    try:
+        # Waits for a concurrent delete_unused_files, then finds the file or its absence.
+        return DefinitionFile.objects.select_for_update().get(digest=digest)
+    except DefinitionFile.DoesNotExist:
+        file, _ = DefinitionFile.objects.get_or_create(digest=digest, defaults={'content': content})
+        return file
+
+
+def delete_unused_files() -> None:
+    """Delete stored definition files no longer referenced by any pool.
+    Files locked by a transaction storing them are skipped."""
+    with contextlib.suppress(IntegrityError, ProtectedError), transaction.atomic():
+        unused = list(
+            DefinitionFile.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(pooldefinitionfile__isnull=True)
+            .values_list('digest', flat=True)
+        )
+        DefinitionFile.objects.filter(digest__in=unused).delete()
+
+
 def get_def_provider(url: str, config: CrczpConfiguration) -> DefinitionProvider:
-    """Return correct provider according to the repository url."""
+    """Return the provider of the local mirror of the repository if it exists,
+    the REST provider according to the repository url otherwise."""
+    repo = git_mirrors.open_mirror(url, config)
+    if repo is not None:
+        git_mirrors.request_sync()
+        return MirrorProvider(url, config, repo, lambda: get_rest_provider(url, config))
+    return get_rest_provider(url, config)
+
+
+def get_rest_provider(url: str, config: CrczpConfiguration) -> DefinitionProvider:
+    """Return correct REST API provider according to the repository url.
+    Providers are reused across calls with the same repository, token and settings."""
     git_type = git_config.get_git_type(url)
+    provider_class: type[GitlabProvider | GitHubProvider]
     if git_type == GitType.GITLAB:
-        return GitlabProvider(url, config)
-    if git_type == GitType.GITHUB:
-        return GitHubProvider(url, config)
-    raise exceptions.ImproperlyConfigured(
-        f'Cannot determine provider type: {git_config.get_rest_server(url)} '
-        f'Supported types: gitlab, github'
+        provider_class = GitlabProvider
+    elif git_type == GitType.GITHUB:
+        provider_class = GitHubProvider
+    else:
+        raise exceptions.ImproperlyConfigured(
+            f'Cannot determine provider type: {git_config.get_rest_server(url)} '
+            f'Supported types: gitlab, github'
+        )
+    key = (
+        provider_class,
+        url,
+        git_config.get_git_token(git_config.get_rest_server(url), config),
+        config.git_skip_ssl_verification,
+        config.topology_cache_mode,
     )
+    return PROVIDERS.get(key, lambda: provider_class(url, config))
 
 
 def validate_topology_definition(topology_definition: TopologyDefinition) -> None:
@@ -238,9 +327,8 @@ def validate_topology_definition(topology_definition: TopologyDefinition) -> Non
                 f" '{group.name}'."
             )
 
-    client = utils.get_terraform_client()
-    terraform_flavors = client.get_flavors_dict()
-    terraform_images = [image.name for image in list_images()]
+    flavors = common_cloud.get_flavors()
+    images = common_cloud.get_image_catalog()
 
     used_flavors = [host.flavor for host in topology_definition.hosts] + [
         router.flavor for router in topology_definition.routers
@@ -251,13 +339,13 @@ def validate_topology_definition(topology_definition: TopologyDefinition) -> Non
     ]
 
     for flavor in used_flavors:
-        if flavor not in terraform_flavors:
+        if flavor not in flavors:
             raise exceptions.ValidationError(
                 f'Flavor {flavor} was not found on the terraform backend.'
             )
 
     for image in used_images:
-        if image not in terraform_images:
+        if image not in images.by_name:
             raise exceptions.ValidationError(
                 f'Image {image} was not found on the terraform backend.'
             )
@@ -0,0 +1,189 @@
+"""
+Local bare mirrors of sandbox definition repositories.
+
+The mirrors are stored in the git_mirror_path directory, one per repository URL. They are
+created and fetched by the RQ worker (when a definition is created, by push webhooks and
+periodically every git_mirror_sync_interval seconds) and read by the service, so the directory
+must be a volume shared by the service and its RQ workers. The periodic sync requires the worker
+to run with the RQ scheduler; the sync_git_mirrors management command fetches all mirrors
+at once, e.g. from cron.
+"""
+
+import base64
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from datetime import timedelta
+
+import django_rq
+import git
+import redis
+import structlog
+from django.conf import settings
+from django.core.cache import cache
+
+from crczp.sandbox_common_lib import exceptions, git_config
+from crczp.sandbox_common_lib.crczp_config import CrczpConfiguration, GitType
+from crczp.sandbox_common_lib.single_flight import SingleFlight
+from crczp.sandbox_definition_app.models import Definition
+
+LOG = structlog.get_logger()
+
+MIRROR_REMOTE = 'origin'
+MIRROR_REFSPECS = ('+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+GIT_USERS = {GitType.GITLAB: 'oauth2', GitType.GITHUB: 'x-access-token'}
+GIT_MIRRORS_SYNC_JOB_ID = 'git-mirrors-sync'
+GIT_MIRRORS_SYNC_LOCK_KEY = 'git-mirrors-sync-lock'
+
+_fetches = SingleFlight()
+# Opened mirrors by path, per thread, as git.Repo is not thread-safe.
+_repos = threading.local()
+
+
+def is_enabled(config: CrczpConfiguration) -> bool:
+    """Whether the definition repositories are mirrored."""
+    return bool(config.git_mirror_path)
+
+
+def get_mirror_path(url: str, config: CrczpConfiguration) -> str:
+    """Return the directory of the bare mirror of the repository."""
+    name = hashlib.sha256(url.encode()).hexdigest()
+    return os.path.join(config.git_mirror_path, f'{name}.git')
+
+
+def open_mirror(url: str, config: CrczpConfiguration) -> git.Repo | None:
+    """
+    Return the bare mirror of the repository, None if it has not been created yet.
+    The mirror is opened once per thread and reused.
+    """
+    if not is_enabled(config):
+        return None
+    path = get_mirror_path(url, config)
+    repos: dict[str, git.Repo] = _repos.__dict__.setdefault('by_path', {})
+    repo = repos.get(path)
+    if repo is None:
+        if not os.path.isdir(path):
+            return None
+        repo = repos[path] = git.Repo(path)
+    return repo
+
+
+def fetch_mirror(url: str) -> None:
+    """
+    Fetch the repository to its mirror, creating the mirror if it does not exist.
+    Concurrent fetches of the same repository within the process are done once.
+
+    :param url: URL of the sandbox definition Git repository
+    :raise: GitError if the repository cannot be fetched
+    """
+    config = settings.CRCZP_CONFIG
+    if not is_enabled(config):
+        return
+    _fetches.do(url, lambda: _fetch_mirror(url, config))
+
+
+def enqueue_fetch(url: str) -> None:
+    """Fetch the mirror of the repository in the background, if mirrors are enabled."""
+    if is_enabled(settings.CRCZP_CONFIG):
+        django_rq.get_queue().enqueue(fetch_mirror, url)
+
+
+def sync_mirrors() -> list[str]:
+    """
+    Fetch the mirrors of all definition repositories. Failures are logged, not raised.
+
+    :return: URLs of the repositories that failed to be fetched
+    """
+    failed = []
+    for url in Definition.objects.values_list('url', flat=True).distinct():
+        try:
+            fetch_mirror(url)
+        except exceptions.GitError as ex:
+            LOG.warning('Git mirror fetch failed', url=url, error=str(ex))
+            failed.append(url)
+    return failed
+
+
+def sync_mirrors_job() -> None:
+    """
+    RQ job fetching the mirrors of all definition repositories.
+    The job reschedules itself after the sync interval.
+    """
+    interval = settings.CRCZP_CONFIG.git_mirror_sync_interval
+    # Keeps request_sync from enqueuing another job while the periodic one is scheduled.
+    cache.set(GIT_MIRRORS_SYNC_LOCK_KEY, True, 2 * interval)
+    try:
+        sync_mirrors()
+    finally:
+        django_rq.get_queue().enqueue_in(
+            timedelta(seconds=interval), sync_mirrors_job, job_id=GIT_MIRRORS_SYNC_JOB_ID
+        )
+
+
+def request_sync() -> None:
+    """
+    Enqueue the periodic sync of the mirrors, unless it is already scheduled.
+    Failures to enqueue are logged, not raised.
+    """
+    config = settings.CRCZP_CONFIG
+    if not is_enabled(config) or not cache.add(
+        GIT_MIRRORS_SYNC_LOCK_KEY, True, 2 * config.git_mirror_sync_interval
+    ):
+        return
+    try:
+        django_rq.get_queue().enqueue(sync_mirrors_job, job_id=GIT_MIRRORS_SYNC_JOB_ID)
+    except redis.exceptions.RedisError as ex:
+        cache.delete(GIT_MIRRORS_SYNC_LOCK_KEY)
+        LOG.warning('Failed to enqueue the git mirrors sync', error=str(ex))
+
+
+def _fetch_mirror(url: str, config: CrczpConfiguration) -> None:
+    path = get_mirror_path(url, config)
+    if os.path.isdir(path):
+        _fetch(git.Repo(path), url, config)
+        LOG.info('Git mirror fetched', url=url)
+        return
+
+    # The mirror is fetched to a temporary directory first, so it never appears partial.
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        repo = git.Repo.init(tmp_path, bare=True, mkdir=True)
+        with repo.config_writer() as writer:
+            writer.set_value(f'remote "{MIRROR_REMOTE}"', 'url', url)
+            writer.set_value(f'remote "{MIRROR_REMOTE}"', 'fetch', MIRROR_REFSPECS[0])
+            writer.add_value(f'remote "{MIRROR_REMOTE}"', 'fetch', MIRROR_REFSPECS[1])
+        _fetch(repo, url, config)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process created the mirror meanwhile.
+            if not os.path.isdir(path):
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    LOG.info('Git mirror created', url=url)
+
+
+def _fetch(repo: git.Repo, url: str, config: CrczpConfiguration) -> None:
+    """
+    Fetch all branches and tags; the credentials are passed to this fetch only,
+    in the environment of the git process, not on its command line.
+    """
+    options = {'http.sslVerify': str(not config.git_skip_ssl_verification).lower()}
+    if url.startswith('https://'):
+        rest_server = git_config.get_rest_server(url)
+        token = git_config.get_git_token(rest_server, config)
+        if token:
+            user = GIT_USERS[git_config.get_git_type(rest_server)]
+            credentials = base64.b64encode(f'{user}:{token}'.encode()).decode()
+            options['http.extraHeader'] = f'Authorization: Basic {credentials}'
+    env = {'GIT_CONFIG_COUNT': str(len(options))}
+    for index, (key, value) in enumerate(options.items()):
+        env[f'GIT_CONFIG_KEY_{index}'] = key
+        env[f'GIT_CONFIG_VALUE_{index}'] = value
+    try:
+        repo.git.fetch(MIRROR_REMOTE, '--prune', '--prune-tags', env=env)
+    except git.GitCommandError as ex:
+        raise exceptions.GitError(f'Failed to fetch the mirror of {url}: {ex.stderr}') from ex
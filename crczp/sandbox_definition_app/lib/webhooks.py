@@ -0,0 +1,125 @@
+"""
+Git push webhooks invalidating cached definitions of the pushed refs.
+
+Both GitLab (Push Hook, Tag Push Hook) and GitHub (push) events are supported.
+Without mirrors, a push is picked up through the webhook earlier only by the cached
+commit SHA of the rev (git_rev_cache_timeout), except for GitHub repositories in the
+AGGRESSIVE and FRESH_IMPORT topology cache modes, whose definitions are cached by the name
+of the rev until the webhook invalidates them. With mirrors, the webhook fetches the mirror.
+"""
+
+import hashlib
+import hmac
+from dataclasses import dataclass
+from typing import Any
+
+import structlog
+from rest_framework.exceptions import AuthenticationFailed
+
+from crczp.sandbox_common_lib import exceptions
+from crczp.sandbox_definition_app.lib import definitions, git_mirrors
+from crczp.sandbox_definition_app.models import Definition
+
+LOG = structlog.get_logger()
+
+GITLAB_EVENT_HEADER = 'X-Gitlab-Event'
+GITLAB_TOKEN_HEADER = 'X-Gitlab-Token'
+GITLAB_PUSH_EVENTS = ('Push Hook', 'Tag Push Hook')
+GITHUB_EVENT_HEADER = 'X-GitHub-Event'
+GITHUB_SIGNATURE_HEADER = 'X-Hub-Signature-256'
+GITHUB_PUSH_EVENTS = ('push',)
+REF_PREFIXES = ('refs/heads/', 'refs/tags/')
+
+
+@dataclass
+class PushEvent:
+    """Repository and ref updated by a push.
+
+    Attributes:
+        urls (list[str]): HTTPS clone URLs of the repository.
+        rev (str): Name of the pushed branch or tag.
+    """
+
+    urls: list[str]
+    rev: str
+
+
+def verify_request(headers: Any, body: bytes, secret: str | None) -> None:
+    """
+    Verify the webhook request was sent by a git server knowing the secret.
+
+    :param headers: Headers of the request
+    :param body: Raw body of the request
+    :param secret: The configured webhook secret, webhooks are disabled if it is not set
+    :raise: AuthenticationFailed if the request cannot be verified
+    """
+    if not secret:
+        raise AuthenticationFailed('Git webhooks are not enabled.')
+    if GITLAB_EVENT_HEADER in headers:
+        token = headers.get(GITLAB_TOKEN_HEADER, '')
+        if hmac.compare_digest(token.encode(), secret.encode()):
+            return
+    elif GITHUB_EVENT_HEADER in headers:
+        digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        signature = headers.get(GITHUB_SIGNATURE_HEADER, '')
+        if hmac.compare_digest(signature.encode(), f'sha256={digest}'.encode()):
+            return
+    raise AuthenticationFailed('Invalid git webhook signature.')
+
+
+def parse_push_event(headers: Any, payload: dict[str, Any]) -> PushEvent | None:
+    """
+    Parse the push event from the webhook payload.
+
+    :param headers: Headers of the request
+    :param payload: Parsed JSON body of the request
+    :return: The push event, None if the event is not a push of a branch or a tag
+    :raise: ValidationError if the payload is not a valid push event
+    """
+    if headers.get(GITLAB_EVENT_HEADER) in GITLAB_PUSH_EVENTS:
+        repository = payload.get('project') or payload.get('repository') or {}
+        url = repository.get('git_http_url')
+    elif headers.get(GITHUB_EVENT_HEADER) in GITHUB_PUSH_EVENTS:
+        url = (payload.get('repository') or {}).get('clone_url')
+    else:
+        return None
+
+    ref = payload.get('ref')
+    if not isinstance(url, str) or not url.startswith('https://') or not isinstance(ref, str):
+        raise exceptions.ValidationError('Push event has no HTTPS repository URL or ref.')
+    for prefix in REF_PREFIXES:
+        if ref.startswith(prefix):
+            return PushEvent(urls=[url], rev=ref.removeprefix(prefix))
+    return None
+
+
+def handle_push_event(event: PushEvent) -> list[Definition]:
+    """
+    Invalidate the cached topology definitions and the resolved SHA of the pushed ref
+    and fetch the mirrors of the repository.
+
+    :param event: The push event
+    :return: Definitions of the pushed repository
+    """
+    normalized_urls = {_normalize_url(url) for url in event.urls}
+    matching = [
+        definition
+        for definition in Definition.objects.all()
+        if _normalize_url(definition.url) in normalized_urls
+    ]
+    urls = set(event.urls) | {definition.url for definition in matching}
+    for url in urls:
+        definitions.invalidate_rev(url, event.rev)
+    for definition_url in {definition.url for definition in matching}:
+        git_mirrors.enqueue_fetch(definition_url)
+    LOG.info(
+        'Git push processed',
+        urls=sorted(urls),
+        rev=event.rev,
+        definitions=[definition.id for definition in matching],
+    )
+    return matching
+
+
+def _normalize_url(url: str) -> str:
+    return url.strip().lower().removesuffix('/').removesuffix('.git')
@@ -0,0 +1,23 @@
+"""Django management command for fetching the local mirrors of definition repositories."""
+
+from typing import Any, override
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from crczp.sandbox_definition_app.lib import git_mirrors
+
+
+class Command(BaseCommand):
+    """Custom management command to create and fetch mirrors of definition repositories."""
+
+    help = 'Create and fetch local mirrors of all sandbox definition repositories.'
+    requires_migrations_checks = True
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        if not git_mirrors.is_enabled(settings.CRCZP_CONFIG):
+            raise CommandError('The `git_mirror_path` must be set to mirror the repositories.')
+        failed = git_mirrors.sync_mirrors()
+        if failed:
+            raise CommandError(f'Failed to fetch the mirrors of: {", ".join(failed)}')
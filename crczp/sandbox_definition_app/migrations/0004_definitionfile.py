@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('sandbox_definition_app', '0003_definition_created_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DefinitionFile',
+            fields=[
+                (
+                    'digest',
+                    models.CharField(
+                        help_text='SHA-256 hex digest of the content.',
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ('content', models.TextField(help_text='Content of the file.')),
+            ],
+        ),
+    ]
@@ -27,3 +27,16 @@ class Definition(models.Model):
     @override
     def __str__(self) -> str:
         return f'ID: {self.id}, NAME: {self.name}, URL: {self.url}, REV: {self.rev}'
+
+
+class DefinitionFile(models.Model):
+    """Content-addressed copy of a file from a sandbox definition repository."""
+
+    digest = models.CharField(
+        primary_key=True, max_length=64, help_text='SHA-256 hex digest of the content.'
+    )
+    content = models.TextField(help_text='Content of the file.')
+
+    @override
+    def __str__(self) -> str:
+        return f'DIGEST: {self.digest}'
@@ -8,6 +8,7 @@ from django.contrib.auth.models import User
 from ruamel.yaml import YAML
 
 from crczp.cloud_commons import Image
+from crczp.sandbox_common_lib import common_cloud
 
 TESTING_DATA_DIR = 'assets'
 
@@ -72,6 +73,7 @@ def get_terraform_client(mocker, image):  # pylint: disable=redefined-outer-name
     mock_client.list_images.return_value = [image]
 
     mocker.patch('crczp.sandbox_common_lib.utils.get_terraform_client', return_value=mock_client)
+    common_cloud.clear_catalog()
     return mock_client
 
 
@@ -0,0 +1,110 @@
+"""Tests for conditional requests against the git server APIs."""
+
+# pylint: disable=redefined-outer-name
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from crczp.sandbox_definition_app.lib.conditional_requests import (
+    NOT_MODIFIED,
+    OK,
+    ConditionalCacheAdapter,
+    ResponseCache,
+)
+
+URL = 'https://gitlab.example.com/api/v4/projects/1/repository/files/topology.yml?ref=master'
+PAYLOAD = b'{"content": "dGVzdA=="}'
+
+
+def make_response(status_code: int, content: bytes = b'', **headers: str) -> requests.Response:
+    """Build a response of the git server."""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content  # pylint: disable=protected-access
+    response.headers.update({name.replace('_', '-'): value for name, value in headers.items()})
+    return response
+
+
+@pytest.fixture
+def response_cache():
+    """Return an empty response cache."""
+    return ResponseCache(max_entries=2)
+
+
+@pytest.fixture
+def session(response_cache):
+    """Return a session sending the requests conditionally."""
+    session = requests.Session()
+    session.mount('https://', ConditionalCacheAdapter(response_cache))
+    return session
+
+
+@pytest.fixture
+def server(mocker):
+    """Mock the transport of the requests, returning the responses of the git server."""
+    return mocker.patch.object(HTTPAdapter, 'send')
+
+
+class TestConditionalCacheAdapter:
+    """Tests for conditional GET requests."""
+
+    def test_not_modified_replays_cached_response(self, session, server, response_cache):
+        """Test that the validators are sent and a 304 is answered from the cache."""
+        server.side_effect = [
+            make_response(200, PAYLOAD, ETag='"v1"', Content_Type='application/json'),
+            make_response(304, ETag='"v1"'),
+        ]
+        session.get(URL, headers={'PRIVATE-TOKEN': 'token'})
+
+        response = session.get(URL, headers={'PRIVATE-TOKEN': 'token'})
+
+        assert response.status_code == 200
+        assert response.json() == {'content': 'dGVzdA=='}
+        assert server.call_args.args[0].headers['If-None-Match'] == '"v1"'
+        assert response_cache.get_stats() == {OK: 1, NOT_MODIFIED: 1, 'entries': 1}
+
+    def test_modified_resource_is_replaced(self, session, server, response_cache):
+        """Test that a 200 response to a conditional request replaces the cached one."""
+        server.side_effect = [
+            make_response(200, b'old', Last_Modified='Mon, 19 Oct 2026 10:00:00 GMT'),
+            make_response(200, b'new', ETag='"v2"'),
+            make_response(304),
+        ]
+        session.get(URL)
+        assert session.get(URL).content == b'new'
+
+        assert session.get(URL).content == b'new'
+        assert server.call_args_list[1].args[0].headers['If-Modified-Since'] == (
+            'Mon, 19 Oct 2026 10:00:00 GMT'
+        )
+        assert response_cache.get_stats()[OK] == 2
+
+    def test_credentials_are_cached_apart(self, session, server):
+        """Test that a response is not reused for requests with other credentials."""
+        server.side_effect = [
+            make_response(200, PAYLOAD, ETag='"v1"'),
+            make_response(200, PAYLOAD, ETag='"v1"'),
+        ]
+        session.get(URL, headers={'PRIVATE-TOKEN': 'first'})
+        session.get(URL, headers={'PRIVATE-TOKEN': 'second'})
+
+        assert 'If-None-Match' not in server.call_args.args[0].headers
+
+    def test_responses_without_validators_and_other_methods(self, session, server, response_cache):
+        """Test that only GET responses with validators are cached."""
+        server.side_effect = [
+            make_response(200, PAYLOAD),
+            make_response(201, PAYLOAD, ETag='"v1"'),
+        ]
+        session.get(URL)
+        session.post(URL)
+
+        assert response_cache.get_stats()['entries'] == 0
+
+    def test_least_recently_used_is_evicted(self, response_cache):
+        """Test that the cache keeps at most max_entries responses."""
+        for key in ('first', 'second', 'third'):
+            response_cache.store(key, {'ETag': f'"{key}"'}, b'')
+
+        assert response_cache.get('first') is None
+        assert response_cache.get('third').etag == '"third"'
@@ -1,12 +1,16 @@
 """Tests for definition provider implementations."""
 
+import threading
+
 import pytest
 import requests
+from django.core.cache import cache
 from github import GithubException, UnknownObjectException
-from gitlab import GitlabError
+from gitlab import GitlabError, GitlabGetError
 
 from crczp.sandbox_common_lib.crczp_config import CrczpConfiguration, TopologyCacheMode
 from crczp.sandbox_common_lib.exceptions import GitError
+from crczp.sandbox_definition_app.lib import conditional_requests
 from crczp.sandbox_definition_app.lib.definition_providers import GitHubProvider, GitlabProvider
 
 EXPECTED_RESULT_ARRAY = ['t', 'e', 's', 't']
@@ -45,7 +49,9 @@ class TestGitlabProvider:
         gitlab_provider = GitlabProvider(self.URL1, self.CFG)
         gitlab_provider.gl.projects.get = mocker.MagicMock()
         gitlab_provider.gl.projects.get.return_value = gitlab_project
-        return gitlab_provider
+        cache.clear()
+        yield gitlab_provider
+        cache.clear()
 
     def test_get_file(self, mocker, gitlab_provider, gitlab_project):
         """Test that get_file returns the decoded file content."""
@@ -114,34 +120,79 @@ class TestGitlabProvider:
         gitlab_provider.get_tags.return_value = EXPECTED_RESULT_ARRAY[2:]
         assert gitlab_provider.get_refs() == EXPECTED_RESULT_ARRAY
 
-    def test_get_rev_sha_from_refs(self, mocker, gitlab_provider):
-        """Test that get_rev_sha returns the correct commit SHA from refs."""
-        revision1 = mocker.MagicMock()
-        revision1.name = 'other'
-        revision1.id = '1'
-
-        rev_name = 'test'
+    def test_get_rev_sha_from_branch(self, mocker, gitlab_provider, gitlab_project):
+        """Test that get_rev_sha resolves a branch with a single-ref request."""
         expected_rev_sha = '2'
-        revision2 = mocker.MagicMock()
-        revision2.name = rev_name
-        revision2.id = expected_rev_sha
-        revision2.commit = {'id': expected_rev_sha}
+        gitlab_project.branches.get.return_value = mocker.MagicMock(commit={'id': expected_rev_sha})
+
+        assert gitlab_provider.get_rev_sha('test') == expected_rev_sha
+        gitlab_project.branches.get.assert_called_once_with('test')
+        gitlab_project.branches.list.assert_not_called()
+        gitlab_project.tags.list.assert_not_called()
 
-        gitlab_provider.get_refs = mocker.MagicMock()
-        gitlab_provider.get_refs.return_value = [revision1, revision2]
-        assert gitlab_provider.get_rev_sha(rev_name) == expected_rev_sha
+    def test_get_rev_sha_from_tag(self, mocker, gitlab_provider, gitlab_project):
+        """Test that get_rev_sha falls back to tags when rev is not a branch."""
+        gitlab_project.branches.get.side_effect = GitlabGetError(response_code=404)
+        gitlab_project.tags.get.return_value = mocker.MagicMock(commit={'id': '3'})
+
+        assert gitlab_provider.get_rev_sha('v1.0') == '3'
 
     def test_get_rev_sha_from_commits(self, mocker, gitlab_provider, gitlab_project):
-        """Test that get_rev_sha falls back to commits when rev not found in refs."""
+        """Test that get_rev_sha falls back to commits when rev is not a branch or a tag."""
         expected_id = '1'
         commit = mocker.MagicMock()
         commit.id = expected_id
         gitlab_project.commits.get.return_value = commit
+        gitlab_project.branches.get.side_effect = GitlabGetError(response_code=404)
+        gitlab_project.tags.get.side_effect = GitlabGetError(response_code=404)
 
-        gitlab_provider.get_refs = mocker.MagicMock()
-        gitlab_provider.get_refs.return_value = []
         assert gitlab_provider.get_rev_sha('rev') == expected_id
 
+    def test_get_rev_sha_full_sha_without_api_call(self, gitlab_provider):
+        """Test that a full commit SHA is resolved without requesting the API."""
+        full_sha = 'a' * 40
+        assert gitlab_provider.get_rev_sha(full_sha) == full_sha
+        gitlab_provider.gl.projects.get.assert_not_called()
+
+    def test_get_rev_sha_cached(self, mocker, gitlab_provider, gitlab_project):
+        """Test that a resolved rev is served from the cache, also to other providers."""
+        gitlab_project.branches.get.return_value = mocker.MagicMock(commit={'id': '2'})
+        other_provider = GitlabProvider(self.URL1, self.CFG)
+
+        assert gitlab_provider.get_rev_sha('master') == '2'
+        assert other_provider.get_rev_sha('master') == '2'
+        gitlab_project.branches.get.assert_called_once()
+
+    def test_get_rev_sha_single_flight(self, mocker, gitlab_provider, gitlab_project):
+        """Test that concurrent resolutions of the same rev request the API once."""
+        release = threading.Event()
+
+        def get_branch(_rev):
+            release.wait(5)
+            return mocker.MagicMock(commit={'id': '2'})
+
+        gitlab_project.branches.get.side_effect = get_branch
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(gitlab_provider.get_rev_sha('master')))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == ['2'] * 4
+        gitlab_project.branches.get.assert_called_once()
+
+    def test_get_rev_sha_branch_request_error(self, gitlab_provider, gitlab_project):
+        """Test that an error other than not found is not treated as a missing branch."""
+        gitlab_project.branches.get.side_effect = GitlabGetError(response_code=500)
+        with pytest.raises(GitError):
+            gitlab_provider.get_rev_sha('rev')
+        gitlab_project.tags.get.assert_not_called()
+
     def test_get_rev_sha_project_not_found(self, gitlab_provider):
         """Test that a GitlabError from get_rev_sha raises GitError."""
         gitlab_provider.gl.projects.get.side_effect = GitlabError('project request mock error')
@@ -150,6 +201,8 @@ class TestGitlabProvider:
 
     def test_get_rev_sha_commit_not_found(self, gitlab_provider, gitlab_project):
         """Test that a RequestException from get_rev_sha raises GitError."""
+        gitlab_project.branches.get.side_effect = GitlabGetError(response_code=404)
+        gitlab_project.tags.get.side_effect = GitlabGetError(response_code=404)
         gitlab_project.commits.get.side_effect = requests.exceptions.RequestException(
             'commit request mock error'
         )
@@ -162,15 +215,30 @@ class TestGitHubProvider:
 
     URL = 'https://github.com/crczp/sandbox-service.git'
 
+    REPO_API_URL = 'https://api.github.com/repos/crczp/sandbox-service'
+
     @pytest.fixture
     def github_repo(self, mocker):
         """Return a mocked GitHub repository."""
-        return mocker.MagicMock()
+        repo = mocker.MagicMock()
+        repo.url = self.REPO_API_URL
+        return repo
+
+    @pytest.fixture
+    def mock_github(self, mocker):
+        """Return a mocked GitHub client."""
+        conditional_requests.RESPONSES.clear()
+        yield mocker.MagicMock()
+        conditional_requests.RESPONSES.clear()
 
     @pytest.fixture
-    def make_github_provider(self, mocker, github_repo):  # pylint: disable=redefined-outer-name
+    def request_json(self, mock_github):  # pylint: disable=redefined-outer-name
+        """Return the mocked requestJsonAndCheck of the GitHub client."""
+        return mock_github.requester.requestJsonAndCheck
+
+    @pytest.fixture
+    def make_github_provider(self, mocker, mock_github, github_repo):  # pylint: disable=redefined-outer-name
         """Return a factory building a GitHubProvider in a given topology cache mode."""
-        mock_github = mocker.MagicMock()
         mock_github.get_repo.return_value = github_repo
         mocker.patch(
             'crczp.sandbox_definition_app.lib.definition_providers.Github',
@@ -207,62 +275,93 @@ class TestGitHubProvider:
         with pytest.raises(GitError):
             github_provider.get_refs()
 
-    def test_get_file_raises_git_error_on_request_exception(self, github_provider, github_repo):
+    def test_get_file_raises_git_error_on_request_exception(self, github_provider, request_json):
         """Test that a network error from get_file raises GitError."""
-        github_repo.get_contents.side_effect = requests.exceptions.ConnectionError()
+        request_json.side_effect = requests.exceptions.ConnectionError()
         with pytest.raises(GitError):
             github_provider.get_file('topology.yml', 'main')
 
-    def test_get_rev_sha_fresh_resolves_ref_to_commit_sha(self, make_github_provider, github_repo):
+    def test_get_file_decodes_content(self, github_provider, request_json):
+        """Test that get_file requests the contents at the rev and decodes them."""
+        request_json.return_value = ({}, {'content': 'dGVzdA=='})
+        assert github_provider.get_file('topology.yml', 'main') == EXPECTED_RESULT_STR
+        request_json.assert_called_once_with(
+            'GET',
+            f'{self.REPO_API_URL}/contents/topology.yml',
+            parameters={'ref': 'main'},
+            headers=None,
+        )
+
+    def test_get_file_raises_git_error_on_directory(self, github_provider, request_json):
+        """Test that a directory listing from get_file raises GitError."""
+        request_json.return_value = ({}, [{'type': 'file'}])
+        with pytest.raises(GitError):
+            github_provider.get_file('docker', 'main')
+
+    def test_get_file_not_modified(self, github_provider, request_json):
+        """Test that a cached file is requested conditionally and reused on 304."""
+        request_json.return_value = ({'etag': '"abc"'}, {'content': 'dGVzdA=='})
+        github_provider.get_file('topology.yml', 'main')
+        request_json.return_value = ({'etag': '"abc"'}, None)
+
+        assert github_provider.get_file('topology.yml', 'main') == EXPECTED_RESULT_STR
+
+        assert request_json.call_args.kwargs['headers'] == {'If-None-Match': '"abc"'}
+        stats = conditional_requests.RESPONSES.get_stats()
+        assert (stats['ok'], stats['not_modified']) == (1, 1)
+
+    def test_get_rev_sha_fresh_resolves_ref_to_commit_sha(self, make_github_provider, request_json):
         """Test that FRESH mode resolves a branch/tag name to its commit SHA."""
         provider = make_github_provider(TopologyCacheMode.FRESH)
         expected_sha = 'a1b2c3d4e5f6a1b2c3d4e5f6a1b2c3d4e5f6a1b2'
-        github_repo.get_commit.return_value.sha = expected_sha
+        request_json.return_value = ({}, {'sha': expected_sha})
         assert provider.get_rev_sha('main') == expected_sha
-        github_repo.get_commit.assert_called_once_with('main')
+        request_json.assert_called_once_with(
+            'GET', f'{self.REPO_API_URL}/commits/main', parameters=None, headers=None
+        )
 
-    def test_get_rev_sha_fresh_idempotent_for_full_sha(self, make_github_provider, github_repo):
+    def test_get_rev_sha_fresh_idempotent_for_full_sha(self, make_github_provider, request_json):
         """Test that FRESH mode returns an already-resolved SHA unchanged."""
         provider = make_github_provider(TopologyCacheMode.FRESH)
         full_sha = 'a1b2c3d4e5f6a1b2c3d4e5f6a1b2c3d4e5f6a1b2'
-        github_repo.get_commit.return_value.sha = full_sha
+        request_json.return_value = ({}, {'sha': full_sha})
         assert provider.get_rev_sha(full_sha) == full_sha
 
     def test_get_rev_sha_fresh_raises_git_error_when_ref_not_found(
-        self, make_github_provider, github_repo
+        self, make_github_provider, request_json
     ):
         """Test that an UnknownObjectException in FRESH mode raises GitError."""
         provider = make_github_provider(TopologyCacheMode.FRESH)
-        github_repo.get_commit.side_effect = UnknownObjectException(status=404, data={})
+        request_json.side_effect = UnknownObjectException(status=404, data={})
         with pytest.raises(GitError):
             provider.get_rev_sha('nonexistent')
 
     def test_get_rev_sha_fresh_raises_git_error_on_github_exception(
-        self, make_github_provider, github_repo
+        self, make_github_provider, request_json
     ):
         """Test that a GithubException in FRESH mode raises GitError."""
         provider = make_github_provider(TopologyCacheMode.FRESH)
-        github_repo.get_commit.side_effect = GithubException(status=500, data={})
+        request_json.side_effect = GithubException(status=500, data={})
         with pytest.raises(GitError):
             provider.get_rev_sha('main')
 
     def test_get_rev_sha_fresh_raises_git_error_on_request_exception(
-        self, make_github_provider, github_repo
+        self, make_github_provider, request_json
     ):
         """Test that a network error in FRESH mode raises GitError."""
         provider = make_github_provider(TopologyCacheMode.FRESH)
-        github_repo.get_commit.side_effect = requests.exceptions.ConnectionError()
+        request_json.side_effect = requests.exceptions.ConnectionError()
         with pytest.raises(GitError):
             provider.get_rev_sha('main')
 
     @pytest.mark.parametrize('mode', [TopologyCacheMode.AGGRESSIVE, TopologyCacheMode.FRESH_IMPORT])
     def test_get_rev_sha_branch_keyed_returns_rev_unchanged(
-        self, make_github_provider, github_repo, mode
+        self, make_github_provider, request_json, mode
     ):
         """Test that AGGRESSIVE/FRESH_IMPORT return the rev unchanged with no GitHub call."""
         provider = make_github_provider(mode)
         assert provider.get_rev_sha('main') == 'main'
-        github_repo.get_commit.assert_not_called()
+        request_json.assert_not_called()
 
 
 @pytest.mark.integration
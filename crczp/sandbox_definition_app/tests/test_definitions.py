@@ -10,7 +10,7 @@ from yamlize import YamlizingError
 from crczp.sandbox_common_lib import exceptions
 from crczp.sandbox_common_lib.crczp_config import CrczpConfiguration, TopologyCacheMode
 from crczp.sandbox_definition_app.lib import definitions
-from crczp.sandbox_definition_app.lib.definition_providers import GitlabProvider
+from crczp.sandbox_definition_app.lib.definition_providers import GitlabProvider, ProviderRegistry
 from crczp.sandbox_definition_app.models import Definition
 
 pytestmark = pytest.mark.django_db
@@ -146,6 +146,7 @@ class TestGetDefinition:
     def test_get_definition(self, mocker):
         """Test that get_definition fetches the file, loads and returns the definition."""
         topology_provider = mocker.MagicMock()
+        topology_provider.get_rev_sha.return_value = 'sha'
         topology_provider.get_file.return_value = 'test1'
         mocker.patch(
             'crczp.sandbox_definition_app.lib.definitions.get_def_provider',
@@ -167,6 +168,7 @@ class TestGetDefinition:
     def test_get_definition_file_not_found(self, mocker):
         """Test that a GitError is raised when the definition file is not found."""
         topology_provider = mocker.MagicMock()
+        topology_provider.get_rev_sha.return_value = 'sha'
         topology_provider.get_file.side_effect = exceptions.GitError('file not found error')
         mocker.patch(
             'crczp.sandbox_definition_app.lib.definitions.get_def_provider',
@@ -213,14 +215,45 @@ class TestGetDefinition:
         assert cache.get(cache_key) == 'fresh-def'
 
 
-class TestGetDefProvider:  # pylint: disable=too-few-public-methods
+class TestGetDefProvider:
     """Tests for the get_def_provider factory function."""
 
+    URL = 'https://gitlab.com/crczp/backend-python/sandbox-service.git'
+
     def test_get_def_provider_gitlab(self):
         """Test that a Gitlab URL returns a GitlabProvider instance."""
-        url_git = 'https://gitlab.com/crczp/backend-python/sandbox-service.git'
         cfg_git = CrczpConfiguration()
-        assert isinstance(definitions.get_def_provider(url_git, cfg_git), GitlabProvider)
+        assert isinstance(definitions.get_def_provider(self.URL, cfg_git), GitlabProvider)
+
+    def test_provider_is_reused(self, mocker):
+        """Test that providers are reused for the same repository and token only."""
+        cfg = CrczpConfiguration()
+        get_git_token = mocker.patch(
+            'crczp.sandbox_definition_app.lib.definitions.git_config.get_git_token',
+            return_value=None,
+        )
+        provider = definitions.get_def_provider(self.URL, cfg)
+
+        assert definitions.get_def_provider(self.URL, cfg) is provider
+        get_git_token.return_value = 'token'
+        assert definitions.get_def_provider(self.URL, cfg) is not provider
+
+    def test_idle_provider_is_closed(self, mocker):
+        """Test that providers unused for the idle timeout are closed and recreated."""
+        registry = ProviderRegistry(idle_timeout=10)
+        monotonic = mocker.patch(
+            'crczp.sandbox_definition_app.lib.definition_providers.time.monotonic',
+            return_value=0,
+        )
+        factory = mocker.Mock(side_effect=lambda: mocker.Mock())
+        provider = registry.get(('key',), factory)
+
+        monotonic.return_value = 5
+        assert registry.get(('key',), factory) is provider
+        monotonic.return_value = 20
+        assert registry.get(('key',), factory) is not provider
+        provider.close.assert_called_once()
+        assert factory.call_count == 2
 
 
 class TestTopologyDefinitionValidation:
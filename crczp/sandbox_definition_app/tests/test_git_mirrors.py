@@ -0,0 +1,193 @@
+"""Tests for local mirrors of definition repositories and the mirror provider."""
+
+# pylint: disable=redefined-outer-name
+import base64
+
+import git
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+
+from crczp.sandbox_common_lib.exceptions import GitError
+from crczp.sandbox_definition_app.lib import definitions, git_mirrors
+from crczp.sandbox_definition_app.lib.definition_providers import MirrorProvider
+from crczp.sandbox_definition_app.models import Definition
+
+pytestmark = pytest.mark.django_db
+
+TOPOLOGY = 'name: mirrored\n'
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """Create an origin repository with a branch, a tag and a Dockerfile."""
+    repo = git.Repo.init(tmp_path / 'origin', initial_branch='master')
+    (tmp_path / 'origin' / 'topology.yml').write_text(TOPOLOGY)
+    (tmp_path / 'origin' / 'docker').mkdir()
+    (tmp_path / 'origin' / 'docker' / 'Dockerfile').write_text('FROM debian\n')
+    repo.index.add(['topology.yml', 'docker/Dockerfile'])
+    author = git.Actor('test', 'test@example.com')
+    repo.index.commit('init', author=author, committer=author)
+    repo.create_tag('v1.0')
+    return repo
+
+
+@pytest.fixture
+def url(origin):
+    """URL of the origin repository."""
+    return origin.working_dir
+
+
+@pytest.fixture
+def mirror_path(mocker, tmp_path):
+    """Enable the mirrors in a temporary directory."""
+    path = tmp_path / 'mirrors'
+    mocker.patch.object(settings.CRCZP_CONFIG, 'git_mirror_path', str(path))
+    return path
+
+
+@pytest.fixture
+def fallback(mocker):
+    """REST provider used for revs the mirror does not contain."""
+    return mocker.MagicMock()
+
+
+@pytest.fixture
+def provider(url, mirror_path, fallback):  # pylint: disable=unused-argument
+    """Mirror provider of the fetched origin repository."""
+    git_mirrors.fetch_mirror(url)
+    repo = git_mirrors.open_mirror(url, settings.CRCZP_CONFIG)
+    return MirrorProvider(url, settings.CRCZP_CONFIG, repo, lambda: fallback)
+
+
+class TestMirrorProvider:
+    """Tests for reading definitions from a mirror."""
+
+    def test_get_file(self, provider, fallback):
+        """Test that files are read from the mirror by branch and tag."""
+        assert provider.get_file('topology.yml', 'master') == TOPOLOGY
+        assert provider.get_file('docker//Dockerfile', 'v1.0') == 'FROM debian\n'
+        fallback.get_file.assert_not_called()
+
+    def test_get_file_missing(self, provider):
+        """Test that a missing file or a directory raises GitError."""
+        with pytest.raises(GitError):
+            provider.get_file('containers.yml', 'master')
+        with pytest.raises(GitError):
+            provider.get_file('docker', 'master')
+
+    def test_get_rev_sha_and_refs(self, provider, origin):
+        """Test that refs and commit SHAs are resolved locally."""
+        sha = origin.head.commit.hexsha
+        assert provider.get_rev_sha('master') == sha
+        assert provider.get_rev_sha('v1.0') == sha
+        assert provider.get_rev_sha(sha) == sha
+        assert {ref.name for ref in provider.get_refs()} == {'master', 'v1.0'}
+
+    def test_unknown_rev_uses_fallback(self, provider, fallback):
+        """Test that revs not fetched yet are served by the REST provider."""
+        fallback.get_rev_sha.return_value = 'b' * 40
+        fallback.get_file.return_value = 'remote'
+
+        assert provider.get_rev_sha('b' * 40) == 'b' * 40
+        assert provider.get_file('topology.yml', 'new-branch') == 'remote'
+        fallback.get_file.assert_called_once_with('topology.yml', 'new-branch')
+
+
+class TestGitMirrors:
+    """Tests for creating and fetching the mirrors."""
+
+    def test_fetch_picks_up_new_commits(self, provider, origin, url):
+        """Test that a fetch updates the branches of the mirror."""
+        author = git.Actor('test', 'test@example.com')
+        new_commit = origin.index.commit('second', author=author, committer=author)
+
+        git_mirrors.fetch_mirror(url)
+
+        assert provider.get_rev_sha('master') == new_commit.hexsha
+
+    def test_get_def_provider_prefers_mirror(self, mocker, url, mirror_path):  # pylint: disable=unused-argument
+        """Test that the REST provider is used only until the mirror exists."""
+        rest_provider = mocker.patch(
+            'crczp.sandbox_definition_app.lib.definitions.get_rest_provider'
+        )
+        assert definitions.get_def_provider(url, settings.CRCZP_CONFIG) is (
+            rest_provider.return_value
+        )
+
+        git_mirrors.fetch_mirror(url)
+
+        assert isinstance(definitions.get_def_provider(url, settings.CRCZP_CONFIG), MirrorProvider)
+
+    def test_fetch_failure_raises_git_error(self, tmp_path, mirror_path):
+        """Test that an unreachable repository raises GitError and leaves no mirror."""
+        with pytest.raises(GitError):
+            git_mirrors.fetch_mirror(str(tmp_path / 'missing'))
+        assert not mirror_path.exists() or not list(mirror_path.iterdir())
+
+    def test_sync_mirrors(self, url, mirror_path, created_by):  # pylint: disable=unused-argument
+        """Test that the mirrors of all definitions are fetched and failures reported."""
+        Definition.objects.create(name='ok', url=url, rev='master', created_by=created_by)
+        Definition.objects.create(
+            name='missing', url=url + '-missing', rev='master', created_by=created_by
+        )
+
+        failed = git_mirrors.sync_mirrors()
+
+        assert url + '-missing' in failed
+        assert url not in failed
+        assert git_mirrors.open_mirror(url, settings.CRCZP_CONFIG) is not None
+
+    def test_open_mirror_is_reused(self, url, mirror_path):  # pylint: disable=unused-argument
+        """Test that the mirror is opened once per thread."""
+        git_mirrors.fetch_mirror(url)
+
+        repo = git_mirrors.open_mirror(url, settings.CRCZP_CONFIG)
+        assert repo is not None
+        assert git_mirrors.open_mirror(url, settings.CRCZP_CONFIG) is repo
+
+    def test_credentials_are_not_on_command_line(self, mocker):
+        """Test that the token is passed to git in its environment."""
+        mocker.patch.object(git_mirrors.git_config, 'get_git_token', return_value='secret')
+        repo = mocker.MagicMock()
+
+        git_mirrors._fetch(  # pylint: disable=protected-access
+            repo, 'https://gitlab.example.com/group/repo.git', settings.CRCZP_CONFIG
+        )
+
+        args, kwargs = repo.git.fetch.call_args
+        assert not any('secret' in str(arg) for arg in args)
+        credentials = base64.b64encode(b'oauth2:secret').decode()
+        assert kwargs['env']['GIT_CONFIG_COUNT'] == '2'
+        assert kwargs['env']['GIT_CONFIG_KEY_1'] == 'http.extraHeader'
+        assert kwargs['env']['GIT_CONFIG_VALUE_1'] == f'Authorization: Basic {credentials}'
+
+
+class TestGitMirrorsSync:
+    """Tests for the periodic sync of the mirrors."""
+
+    @pytest.fixture
+    def queue(self, mocker):
+        """Mock the RQ queue."""
+        cache.delete(git_mirrors.GIT_MIRRORS_SYNC_LOCK_KEY)
+        return mocker.patch('django_rq.get_queue').return_value
+
+    def test_request_sync_enqueues_once(self, queue, mirror_path):  # pylint: disable=unused-argument
+        """Test that the sync is enqueued only if it is not scheduled yet."""
+        git_mirrors.request_sync()
+        git_mirrors.request_sync()
+
+        queue.enqueue.assert_called_once_with(
+            git_mirrors.sync_mirrors_job, job_id=git_mirrors.GIT_MIRRORS_SYNC_JOB_ID
+        )
+
+    def test_sync_job_reschedules_itself(self, mocker, queue, mirror_path):  # pylint: disable=unused-argument
+        """Test that the job fetches the mirrors and reschedules itself."""
+        sync_mirrors = mocker.patch.object(git_mirrors, 'sync_mirrors')
+
+        git_mirrors.sync_mirrors_job()
+        git_mirrors.request_sync()
+
+        sync_mirrors.assert_called_once()
+        queue.enqueue_in.assert_called_once()
+        queue.enqueue.assert_not_called()
@@ -0,0 +1,145 @@
+"""Tests for git push webhooks invalidating cached definitions."""
+
+import hashlib
+import hmac
+import json
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from crczp.sandbox_definition_app.lib import definitions, webhooks
+from crczp.sandbox_definition_app.lib.definition_providers import REV_SHA_CACHE_KEY
+from crczp.sandbox_definition_app.models import Definition
+
+pytestmark = pytest.mark.django_db
+
+SECRET = 'webhook-secret'
+GITLAB_URL = 'https://gitlab.example.com/group/repo.git'
+GITHUB_URL = 'https://github.com/org/repo.git'
+COMMIT_SHA = 'a' * 40
+
+
+@pytest.fixture(autouse=True)
+def webhook_secret(mocker):
+    """Enable the webhook and start with empty caches."""
+    mocker.patch.object(settings.CRCZP_CONFIG, 'git_webhook_secret', SECRET)
+    cache.clear()
+    caches['topology_cache'].clear()
+    yield
+    cache.clear()
+    caches['topology_cache'].clear()
+
+
+def fill_caches(url: str, rev: str, rest_server: str, project_path: str) -> None:
+    """Cache the resolved SHA of the rev and topologies keyed by the rev and by the SHA."""
+    cache.set(REV_SHA_CACHE_KEY.format(rest_server, project_path, rev), COMMIT_SHA)
+    caches['topology_cache'].set(definitions.DEFINITION_CACHE_KEY.format(url, rev), 'by-name')
+    caches['topology_cache'].set(definitions.DEFINITION_CACHE_KEY.format(url, COMMIT_SHA), 'by-sha')
+
+
+def post_gitlab(payload: dict, token: str = SECRET, event: str = 'Push Hook'):
+    """Send a GitLab webhook request."""
+    return APIClient().post(
+        reverse('definition-git-webhook'),
+        payload,
+        format='json',
+        headers={'X-Gitlab-Event': event, 'X-Gitlab-Token': token},
+    )
+
+
+def post_github(payload: dict, secret: str = SECRET, event: str = 'push'):
+    """Send a GitHub webhook request signed with the secret."""
+    body = json.dumps(payload).encode()
+    signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return APIClient().post(
+        reverse('definition-git-webhook'),
+        body,
+        content_type='application/json',
+        headers={'X-GitHub-Event': event, 'X-Hub-Signature-256': f'sha256={signature}'},
+    )
+
+
+class TestGitWebhook:
+    """Tests for the git webhook endpoint."""
+
+    def test_gitlab_push_invalidates_ref(self, created_by):
+        """Test that a GitLab branch push drops the entries of the branch only."""
+        Definition.objects.create(name='def', url=GITLAB_URL, rev='master', created_by=created_by)
+        fill_caches(GITLAB_URL, 'master', 'https://gitlab.example.com/', 'group/repo')
+        fill_caches(GITLAB_URL, 'devel', 'https://gitlab.example.com/', 'group/repo')
+
+        response = post_gitlab({
+            'ref': 'refs/heads/master',
+            'project': {'git_http_url': GITLAB_URL},
+        })
+
+        assert response.status_code == 204
+        topology_cache = caches['topology_cache']
+        assert (
+            topology_cache.get(definitions.DEFINITION_CACHE_KEY.format(GITLAB_URL, 'master'))
+            is None
+        )
+        assert (
+            cache.get(
+                REV_SHA_CACHE_KEY.format('https://gitlab.example.com/', 'group/repo', 'master')
+            )
+            is None
+        )
+        assert topology_cache.get(definitions.DEFINITION_CACHE_KEY.format(GITLAB_URL, COMMIT_SHA))
+        assert topology_cache.get(definitions.DEFINITION_CACHE_KEY.format(GITLAB_URL, 'devel'))
+
+    def test_github_tag_push_invalidates_definition_url(self, created_by):
+        """Test that entries keyed by the stored definition URL are dropped on a GitHub push."""
+        stored_url = 'https://github.com/Org/repo.git'
+        Definition.objects.create(name='def', url=stored_url, rev='v1.0', created_by=created_by)
+        fill_caches(stored_url, 'v1.0', 'https://github.com/', 'Org/repo')
+
+        response = post_github({'ref': 'refs/tags/v1.0', 'repository': {'clone_url': GITHUB_URL}})
+
+        assert response.status_code == 204
+        assert (
+            caches['topology_cache'].get(
+                definitions.DEFINITION_CACHE_KEY.format(stored_url, 'v1.0')
+            )
+            is None
+        )
+
+    def test_other_events_are_ignored(self, mocker):
+        """Test that verified events other than pushes are accepted without invalidation."""
+        handle_push_event = mocker.patch(
+            'crczp.sandbox_definition_app.lib.webhooks.handle_push_event'
+        )
+
+        response = post_github({'zen': 'Keep it simple.'}, event='ping')
+
+        assert response.status_code == 204
+        handle_push_event.assert_not_called()
+
+    @pytest.mark.parametrize(
+        'send',
+        [
+            lambda payload: post_gitlab(payload, token='wrong'),
+            lambda payload: post_github(payload, secret='wrong'),
+        ],
+    )
+    def test_invalid_secret_is_rejected(self, send):
+        """Test that requests not signed by the secret are rejected."""
+        payload = {'ref': 'refs/heads/master', 'repository': {'clone_url': GITHUB_URL}}
+        assert send(payload).status_code == 403
+
+    def test_disabled_without_secret(self):
+        """Test that the webhook is rejected if no secret is configured."""
+        with pytest.raises(AuthenticationFailed):
+            webhooks.verify_request(
+                {'X-Gitlab-Event': 'Push Hook', 'X-Gitlab-Token': ''}, b'', None
+            )
+
+    def test_invalid_payload(self):
+        """Test that a push event without a repository URL is refused."""
+        response = post_gitlab({'ref': 'refs/heads/master'})
+
+        assert response.status_code == 400
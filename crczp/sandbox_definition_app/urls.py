@@ -6,6 +6,11 @@ from crczp.sandbox_definition_app import views
 
 urlpatterns = [
     path('definitions', views.DefinitionListCreateView.as_view(), name='definition-list'),
+    path(
+        'definitions/git-webhook',
+        views.DefinitionGitWebhookView.as_view(),
+        name='definition-git-webhook',
+    ),
     path(
         'definitions/<int:definition_id>',
         views.DefinitionDetailDeleteView.as_view(),
@@ -21,6 +26,11 @@ urlpatterns = [
         views.DefinitionTopologyView.as_view(),
         name='definition-topology',
     ),
+    path(
+        'definitions/<int:definition_id>/capacity',
+        views.DefinitionCapacityView.as_view(),
+        name='definition-capacity',
+    ),
     path(
         'definitions/<int:definition_id>/local-variables',
         views.LocalSandboxVariablesView.as_view(),
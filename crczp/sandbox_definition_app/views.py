@@ -5,9 +5,11 @@ from typing import Any, override
 import structlog
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiRequest, OpenApiResponse, extend_schema
 from generator.var_generator import generate
 from rest_framework import generics, status
+from rest_framework.permissions import AllowAny
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -18,11 +20,11 @@ from crczp.sandbox_common_lib.swagger_typing import (
     SandboxDefinitionSerializer,
 )
 from crczp.sandbox_definition_app import serializers
-from crczp.sandbox_definition_app.lib import definitions
+from crczp.sandbox_definition_app.lib import definitions, webhooks
 from crczp.sandbox_definition_app.lib.definition_providers import DefinitionProvider
 from crczp.sandbox_definition_app.models import Definition
 from crczp.sandbox_instance_app import serializers as instance_serializers
-from crczp.sandbox_instance_app.lib import sandboxes
+from crczp.sandbox_instance_app.lib import reservations, sandboxes
 from crczp.sandbox_instance_app.lib.topology import Topology
 
 LOG = structlog.get_logger()
@@ -51,6 +53,8 @@ class DefinitionListCreateView(generics.ListCreateAPIView[Definition]):
 
     queryset = Definition.objects.all()
     serializer_class = serializers.DefinitionSerializer
+    # Creating a definition reads and validates its topology from git.
+    request_deadline = 120
 
     @extend_schema(
         request=OpenApiRequest(DefinitionRequestSerializer),
@@ -141,6 +145,36 @@ class DefinitionTopologyView(generics.RetrieveAPIView[Any]):
         return Topology(client.get_topology_instance(topology_definition, containers))
 
 
+@extend_schema(
+    methods=['GET'],
+    responses={
+        200: instance_serializers.CapacityProjectionSerializer(),
+        **COMMON_RESPONSE_PATTERNS,
+    },
+)
+class DefinitionCapacityView(generics.RetrieveAPIView[Any]):
+    """
+    get: Project how many more sandboxes of the definition fit into the cloud project,
+    given the resources reserved by all pools.
+    """
+
+    queryset = Definition.objects.all()
+    lookup_url_kwarg = 'definition_id'
+    serializer_class = instance_serializers.CapacityProjectionSerializer
+
+    @override
+    def get_object(self) -> Any:
+        definition = super().get_object()
+        topology_definition = definitions.get_definition(
+            definition.url, definition.rev, settings.CRCZP_CONFIG
+        )
+        client = utils.get_terraform_client()
+        hardware_usage = client.get_hardware_usage(
+            client.get_topology_instance(topology_definition)
+        )
+        return reservations.project_capacity(hardware_usage)
+
+
 @extend_schema(
     methods=['POST'],
     responses={201: serializers.LocalVariableSerializer(many=True), **COMMON_RESPONSE_PATTERNS},
@@ -190,3 +224,31 @@ class DefinitionVariablesView(APIView):
         except exceptions.GitError:
             pass
         return Response({'variables': variable_names})
+
+
+@extend_schema(
+    methods=['POST'],
+    request=OpenApiTypes.OBJECT,
+    responses={
+        204: OpenApiResponse(description='Cached definitions of the pushed ref invalidated'),
+        **{k: v for k, v in utils.ERROR_RESPONSES.items() if k in [400, 403, 500]},
+    },
+)
+class DefinitionGitWebhookView(APIView):
+    """View receiving push webhooks of GitLab and GitHub."""
+
+    # The request is authenticated by the webhook secret, not by a user token.
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    # noinspection PyMethodMayBeStatic
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:  # pylint: disable=unused-argument
+        """Invalidate cached topology definitions and commit SHAs of the pushed branch or tag.
+        Events other than pushes are ignored."""
+        webhooks.verify_request(
+            request.headers, request.body, settings.CRCZP_CONFIG.git_webhook_secret
+        )
+        event = webhooks.parse_push_event(request.headers, request.data)
+        if event is not None:
+            webhooks.handle_push_event(event)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -14,6 +14,7 @@ class ShowIdAdmin(admin.ModelAdmin):  # type: ignore[type-arg]
 
 admin.site.register(models.Pool, ShowIdAdmin)
 admin.site.register(models.SandboxAllocationUnit, ShowIdAdmin)
+admin.site.register(models.ResourceReservation, ShowIdAdmin)
 admin.site.register(models.SandboxLock, ShowIdAdmin)
 admin.site.register(models.PoolLock, ShowIdAdmin)
 admin.site.register(models.Sandbox, ShowIdAdmin)
@@ -0,0 +1,173 @@
+"""
+Access bundles of sandboxes.
+
+The access data of a sandbox served to its users (the topology visualization, the SSH
+configs, the user SSH access zip and the access data of its nodes) depend only on its
+topology instance, which does not change once the sandbox is ready. They are built once
+when the sandbox becomes ready, stored in the database and served from the topology cache,
+tagged with the digest of the bundle as their ETag.
+The bundle is deleted with the sandbox, i.e. when it is cleaned up or its allocation restarted,
+and rebuilt when its topology is refreshed.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any
+
+import structlog
+from asgiref.sync import sync_to_async
+
+from crczp.cloud_commons import TopologyInstance
+from crczp.sandbox_common_lib import common_cloud, exceptions
+from crczp.sandbox_instance_app import serializers
+from crczp.sandbox_instance_app.lib import nodes, pools, sandboxes
+from crczp.sandbox_instance_app.lib.topology import Topology
+from crczp.sandbox_instance_app.lib.topology_cache import get_topology_cache
+from crczp.sandbox_instance_app.models import Sandbox, SandboxAccessBundle
+
+ACCESS_BUNDLE_CACHE_PREFIX = 'access-bundle-{}'
+ACCESS_BUNDLE_CACHE_TIMEOUT = None  # Cache indefinitely, the bundle does not change
+
+LOG = structlog.get_logger()
+
+
+@dataclass(frozen=True)
+class AccessBundle:  # pylint: disable=too-many-instance-attributes
+    """
+    Access data of a sandbox.
+
+    Attributes:
+        sandbox_id (str): ID of the sandbox.
+        etag (str): Digest of the bundle content, unquoted.
+        topology (dict): Serialized topology visualization, see TopologySerializer.
+        user_ssh_config (str): User SSH config, with a placeholder of the private key path.
+        management_ssh_config (str): Management SSH config, as in the management SSH access
+            zip of the pool.
+        user_ssh_access (bytes): Zip of the user SSH config and keys.
+        node_access_data (dict): Serialized access data by node name,
+            see NodeAccessDataSerializer.
+    """
+
+    sandbox_id: str
+    etag: str
+    topology: dict[str, Any]
+    user_ssh_config: str
+    management_ssh_config: str
+    user_ssh_access: bytes
+    node_access_data: dict[str, dict[str, Any]]
+
+    @classmethod
+    def from_model(cls, model: SandboxAccessBundle) -> 'AccessBundle':
+        """Create the bundle from its database row."""
+        return cls(
+            sandbox_id=model.sandbox_id,
+            etag=model.etag,
+            topology=model.topology,
+            user_ssh_config=model.user_ssh_config,
+            management_ssh_config=model.management_ssh_config,
+            # Some database backends return a memoryview, which cannot be cached.
+            user_ssh_access=bytes(model.user_ssh_access),
+            node_access_data=model.node_access_data,
+        )
+
+
+def build(sandbox: Sandbox) -> AccessBundle:
+    """
+    Build the access bundle of the sandbox from its topology instance and store it,
+    replacing the previous one.
+
+    :param sandbox: Sandbox whose stack has already been created
+    :return: The new bundle
+    """
+    ti = sandboxes.get_topology_instance(sandbox)
+    images = common_cloud.get_image_catalog()
+    management_key_path = f'~/.ssh/{pools.get_management_key_name(sandbox.allocation_unit.pool)}'
+    content: dict[str, Any] = {
+        'topology': serializers.TopologySerializer(Topology(ti)).data,
+        'user_ssh_config': sandboxes.get_user_sshconfig(sandbox, topology_instance=ti).serialize(),
+        'management_ssh_config': sandboxes.get_management_sshconfig(
+            sandbox, management_key_path, ti
+        ).serialize(),
+        'node_access_data': _get_node_access_data(ti, images),
+    }
+    # Plain JSON values, the serializer data keep a reference to their serializer.
+    encoded = json.dumps(content, sort_keys=True)
+    content = json.loads(encoded)
+    user_ssh_access = sandboxes.get_user_ssh_access(sandbox, ti).getvalue()
+    digest = hashlib.sha256(encoded.encode())
+    digest.update(user_ssh_access)
+
+    model, _ = SandboxAccessBundle.objects.update_or_create(
+        sandbox_id=sandbox.id,
+        defaults={**content, 'etag': digest.hexdigest(), 'user_ssh_access': user_ssh_access},
+    )
+    bundle = AccessBundle.from_model(model)
+    clear_cache(sandbox)
+    LOG.info('Access bundle built', sandbox=sandbox.id, etag=bundle.etag)
+    return bundle
+
+
+def get(sandbox: Sandbox) -> AccessBundle:
+    """
+    Get the access bundle of the sandbox, building it if the sandbox has none yet.
+    This function is cached in memory and in Redis, in front of the database.
+    """
+    return get_topology_cache().get_or_set(  # type: ignore[no-any-return]
+        get_cache_key(sandbox), lambda: _load(sandbox), ACCESS_BUNDLE_CACHE_TIMEOUT
+    )
+
+
+async def aget(sandbox: Sandbox) -> AccessBundle:
+    """Asynchronous variant of get."""
+    return await get_topology_cache().aget_or_set(  # type: ignore[no-any-return]
+        get_cache_key(sandbox), sync_to_async(lambda: _load(sandbox)), ACCESS_BUNDLE_CACHE_TIMEOUT
+    )
+
+
+def get_cached(sandbox_list: list[Sandbox]) -> dict[str, AccessBundle]:
+    """
+    Get the cached access bundles of the sandboxes in a single cache round trip,
+    without building the missing ones.
+
+    :param sandbox_list: The sandboxes
+    :return: The cached bundles by sandbox ID
+    """
+    by_key = {get_cache_key(sandbox): sandbox for sandbox in sandbox_list}
+    bundles = get_topology_cache().get_or_set_many(
+        list(by_key), lambda _keys: {}, ACCESS_BUNDLE_CACHE_TIMEOUT
+    )
+    return {by_key[key].id: bundle for key, bundle in bundles.items()}
+
+
+def clear_cache(sandbox: Sandbox) -> None:
+    """Delete the cached bundle of this sandbox in all processes."""
+    get_topology_cache().delete(get_cache_key(sandbox))
+
+
+def get_cache_key(sandbox: Sandbox) -> str:
+    """Return the cache key of the bundle of the given sandbox."""
+    return ACCESS_BUNDLE_CACHE_PREFIX.format(sandbox.id)
+
+
+def _load(sandbox: Sandbox) -> AccessBundle:
+    model = SandboxAccessBundle.objects.filter(sandbox_id=sandbox.id).first()
+    if model is not None:
+        return AccessBundle.from_model(model)
+    # Sandboxes that became ready before the bundles were introduced.
+    return build(sandbox)
+
+
+def _get_node_access_data(
+    ti: TopologyInstance, images: common_cloud.ImageCatalog
+) -> dict[str, dict[str, Any]]:
+    """Return the serialized access data of the nodes, skipping the nodes without an image."""
+    access_data: dict[str, dict[str, Any]] = {}
+    for node in ti.get_nodes():
+        try:
+            data = nodes.get_node_access_data(ti, node, images)
+        except exceptions.ValidationError as ex:
+            LOG.warning('No access data of the node', node=node.name, error=str(ex))
+            continue
+        access_data[node.name] = serializers.NodeAccessDataSerializer(data).data
+    return access_data
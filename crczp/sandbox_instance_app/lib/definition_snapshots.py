@@ -0,0 +1,157 @@
+"""
+Definition snapshots of pools.
+
+The definition files of the pool revision are pinned in the database when the pool
+is created, so reading them later does not depend on the git provider.
+"""
+
+import io
+import os
+from collections.abc import Callable
+from typing import Any
+
+import structlog
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from generator.var_object import Variable
+
+from crczp.sandbox_common_lib import exceptions
+from crczp.sandbox_definition_app.lib import definitions
+from crczp.sandbox_definition_app.lib.definition_providers import DefinitionProvider
+from crczp.sandbox_definition_app.models import DefinitionFile
+from crczp.sandbox_instance_app.models import Pool, PoolDefinitionFile
+from crczp.topology_definition.models import DockerContainers, TopologyDefinition
+
+LOG = structlog.get_logger()
+
+PARSED_FILE_CACHE_KEY = 'definition-file-{}-{}'
+
+
+def create_snapshot(pool: Pool) -> None:
+    """
+    Pin topology.yml, containers.yml, variables.yml and the referenced Dockerfiles
+    of the pool revision.
+
+    :param pool: Pool whose definition is pinned
+    :raise: GitError if the topology definition or a referenced Dockerfile cannot be fetched
+    """
+    url, rev = pool.definition.url, pool.rev_sha
+    provider = definitions.get_def_provider(url, settings.CRCZP_CONFIG)
+    try:
+        files: dict[str, str | None] = {
+            definitions.SANDBOX_DEFINITION_FILENAME: provider.get_file(
+                definitions.SANDBOX_DEFINITION_FILENAME, rev
+            )
+        }
+    except exceptions.GitError as ex:
+        raise exceptions.GitError(
+            f'Failed to get sandbox definition file {definitions.SANDBOX_DEFINITION_FILENAME}.\n'
+            + str(ex)
+        ) from ex
+    files[definitions.VARIABLES_FILENAME] = _get_optional_file(
+        provider, definitions.VARIABLES_FILENAME, rev
+    )
+    containers_file = _get_optional_file(provider, definitions.DOCKER_CONTAINERS_FILENAME, rev)
+    files[definitions.DOCKER_CONTAINERS_FILENAME] = containers_file
+    if containers_file is not None:
+        containers = definitions.load_docker_containers(io.StringIO(containers_file))
+        for container in containers.containers:
+            if container.dockerfile:
+                path = _get_dockerfile_path(container.dockerfile)
+                files[path] = provider.get_file(path, rev)
+
+    with transaction.atomic():
+        for path, content in files.items():
+            PoolDefinitionFile.objects.update_or_create(
+                pool=pool,
+                path=path,
+                defaults={'file': definitions.store_file(content) if content is not None else None},
+            )
+    LOG.info('Definition snapshot created', pool=pool.id, files=list(files))
+
+
+def get_definition(pool: Pool) -> TopologyDefinition:
+    """
+    Get the pinned topology definition of the pool.
+
+    :raise: GitError if the pool has no topology definition
+    """
+    file = _get_pinned_file(pool, definitions.SANDBOX_DEFINITION_FILENAME)
+    if file is None:
+        raise exceptions.GitError(
+            f'Sandbox definition file {definitions.SANDBOX_DEFINITION_FILENAME} not found.'
+        )
+    return _load_file(file, 'topology', definitions.load_definition)  # type: ignore[no-any-return]
+
+
+def get_containers(pool: Pool) -> DockerContainers | None:
+    """Get the pinned Docker containers of the pool, None if the definition has none."""
+    file = _get_pinned_file(pool, definitions.DOCKER_CONTAINERS_FILENAME)
+    if file is None:
+        return None
+    return _load_file(file, 'containers', definitions.load_docker_containers)  # type: ignore[no-any-return]
+
+
+def get_dockerfile(pool: Pool, path: str) -> str:
+    """
+    Get the pinned Dockerfile from the given directory of the repository.
+
+    :raise: GitError if the Dockerfile is not pinned
+    """
+    dockerfile_path = _get_dockerfile_path(path)
+    file = _get_pinned_file(pool, dockerfile_path)
+    if file is None:
+        raise exceptions.GitError(f'Dockerfile {dockerfile_path} not found.')
+    return file.content
+
+
+def get_variables(pool: Pool) -> list[Variable]:
+    """
+    Get the pinned APG variables of the pool.
+
+    :raise: GitError if the definition has no variables.yml
+    """
+    file = _get_pinned_file(pool, definitions.VARIABLES_FILENAME)
+    if file is None:
+        raise exceptions.GitError(f'File {definitions.VARIABLES_FILENAME} not found.')
+    return _load_file(file, 'variables', definitions.load_variables)  # type: ignore[no-any-return]
+
+
+def _get_pinned_file(pool: Pool, path: str) -> DefinitionFile | None:
+    """
+    Return the pinned file, None if it does not exist in the repository.
+    Pools created before snapshots existed are pinned on first access.
+
+    :raise: GitError if the path is not part of the snapshot
+    """
+    pinned_files = PoolDefinitionFile.objects.select_related('file').filter(pool=pool)
+    pinned = pinned_files.filter(path=path).first()
+    if pinned is None and not pinned_files.exists():
+        create_snapshot(pool)
+        pinned = pinned_files.filter(path=path).first()
+    if pinned is None:
+        raise exceptions.GitError(f'File {path} is not part of the definition of pool {pool.id}.')
+    return pinned.file
+
+
+def _load_file(file: DefinitionFile, kind: str, loader: Callable[[io.StringIO], Any]) -> Any:
+    """Parse the file content; parsed objects are cached by the content digest."""
+    cache = caches['topology_cache']
+    cache_key = PARSED_FILE_CACHE_KEY.format(file.digest, kind)
+    loaded = cache.get(cache_key)
+    if loaded is None:
+        loaded = loader(io.StringIO(file.content))
+        cache.set(cache_key, loaded)
+    return loaded
+
+
+def _get_optional_file(provider: DefinitionProvider, path: str, rev: str) -> str | None:
+    try:
+        return provider.get_file(path, rev)
+    except exceptions.GitError:
+        return None
+
+
+def _get_dockerfile_path(path: str) -> str:
+    return os.path.join(path, definitions.DOCKERFILE_FILENAME)
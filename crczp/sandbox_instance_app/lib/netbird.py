@@ -13,7 +13,7 @@ from crczp.sandbox_common_lib.netbird_client import (
     NetbirdConfigError,
     get_netbird_client,
 )
-from crczp.sandbox_definition_app.lib import definitions
+from crczp.sandbox_instance_app.lib import definition_snapshots
 from crczp.sandbox_instance_app.models import Sandbox, SandboxNetbirdAccess, SandboxNetbirdResources
 
 LOG = structlog.get_logger()
@@ -64,8 +64,7 @@ def _get_vpn_entrypoints(sandbox: Sandbox) -> list[Any]:
 
 
 def _get_vpn_settings(sandbox: Sandbox) -> Any | None:
-    pool = sandbox.allocation_unit.pool
-    top_def = definitions.get_definition(pool.definition.url, pool.rev_sha, settings.CRCZP_CONFIG)
+    top_def = definition_snapshots.get_definition(sandbox.allocation_unit.pool)
     return getattr(top_def, 'vpn', None)
 
 
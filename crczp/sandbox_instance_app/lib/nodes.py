@@ -1,22 +1,30 @@
 """VM Service module for VM management."""
 
 import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 import django_rq
+import structlog
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.cache import cache
 
 from crczp.cloud_commons import Image, TopologyInstance
 from crczp.cloud_commons.topology_elements import Node
-from crczp.sandbox_common_lib import exceptions, utils
-from crczp.sandbox_common_lib.common_cloud import list_images
+from crczp.sandbox_common_lib import common_cloud, exceptions, utils
+from crczp.sandbox_common_lib.topology_graph import get_topology_graph
 from crczp.sandbox_instance_app.models import Sandbox
 from crczp.terraform_driver import TerraformInstance
 
-CACHE_CONSOLE_PREFIX = 'console-'
+CACHE_CONSOLES_KEY = 'consoles-{}'
+CACHE_CONSOLES_JOB_KEY = 'consoles-{}-running'
 CACHE_CONSOLE_TIMEOUT = 7200  # the console URLs can last for about 2-3 hours
 CACHE_JOB_WORKER_TIME = 300
+CONSOLE_FETCH_PARALLELISM = 5
+
+LOG = structlog.get_logger()
 
 
 class Protocol:
@@ -82,44 +90,140 @@ def get_node(sandbox: Sandbox, node_name: str) -> TerraformInstance:
     return client.get_node(sandbox.allocation_unit.get_stack_name(), node_name)
 
 
-def get_console_url_job(
-    stack_name: str,
-    node_name: str,
-    console_type: str,
-    console_cache_name: str,
-    job_cache_id_running: str,
-) -> None:
-    """Fetch and cache the console URL for the given node (runs as a background job)."""
+def get_console_urls_job(sandbox_id: int, stack_name: str, node_names: list[str]) -> None:
+    """
+    Fetch the console URLs of the nodes of the sandbox and merge them into its cache entry
+    (runs as a background job). The cloud is called for at most CONSOLE_FETCH_PARALLELISM
+    nodes at a time; nodes whose URL cannot be fetched are left out.
+    """
+    try:
+        _fetch_console_urls(sandbox_id, stack_name, node_names)
+    finally:
+        cache.delete(CACHE_CONSOLES_JOB_KEY.format(sandbox_id))
+
+
+def refresh_console_urls(sandbox: Sandbox, node_names: list[str], valid_for: int = 0) -> bool:
+    """
+    Fetch the console URLs of the nodes of the sandbox that are missing
+    or expire within valid_for seconds. Takes the same lock as get_console_urls_job,
+    so the cache entry of the sandbox is updated by one fetch at a time.
+
+    :param sandbox: The sandbox
+    :param node_names: Names of the nodes
+    :param valid_for: Seconds the cached URLs have to stay valid to be kept
+    :return: False if nothing was fetched because another fetch of the sandbox is running
+    """
+    consoles = _get_valid_consoles(sandbox.id, valid_for)
+    stale = [name for name in node_names if name not in consoles]
+    if not stale:
+        return True
+    job_key = CACHE_CONSOLES_JOB_KEY.format(sandbox.id)
+    if not cache.add(job_key, True, CACHE_JOB_WORKER_TIME):
+        return False
+    try:
+        _fetch_console_urls(sandbox.id, sandbox.allocation_unit.get_stack_name(), stale)
+    finally:
+        cache.delete(job_key)
+    return True
+
+
+def _fetch_console_urls(sandbox_id: int, stack_name: str, node_names: list[str]) -> None:
+    """Fetch the console URLs of the nodes and merge them into the cache entry of the sandbox."""
     client = utils.get_terraform_client()
-    console_url = client.get_console_url(stack_name, node_name, console_type)
-    cache.set(console_cache_name, console_url, CACHE_CONSOLE_TIMEOUT)
-    cache.delete(job_cache_id_running)
+    console_type = settings.CRCZP_CONFIG.os_console_type.value
+
+    def fetch(node_name: str) -> str | None:
+        try:
+            return client.get_console_url(stack_name, node_name, console_type)  # type: ignore[no-any-return]
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            LOG.warning(
+                'Failed to get console URL', sandbox_id=sandbox_id, node=node_name, error=str(ex)
+            )
+            return None
+
+    with ThreadPoolExecutor(max_workers=CONSOLE_FETCH_PARALLELISM) as executor:
+        urls = dict(zip(node_names, executor.map(fetch, node_names), strict=True))
+    expires_at = time.time() + CACHE_CONSOLE_TIMEOUT
+    consoles = _get_valid_consoles(sandbox_id)
+    consoles.update({name: (url, expires_at) for name, url in urls.items() if url})
+    cache.set(CACHE_CONSOLES_KEY.format(sandbox_id), consoles, CACHE_CONSOLE_TIMEOUT)
+
+
+def get_console_urls(sandbox: Sandbox, node_names: list[str]) -> dict[str, str] | None:
+    """
+    Get the console URLs of the nodes of the sandbox.
 
+    Missing or expired URLs are fetched by a single background job per sandbox;
+    concurrent requests for the same sandbox share the job.
 
-def get_console_url(sandbox: Sandbox, node_name: str) -> str:
-    """Get console URL for given VM."""
-    console_cache_name = CACHE_CONSOLE_PREFIX + str(sandbox.id) + '-' + node_name
-    job_cache_id_running = CACHE_CONSOLE_PREFIX + str(sandbox.id) + '-' + node_name + '-running'
-    console_url = cache.get(console_cache_name, None)
-    if console_url:
-        return console_url  # type: ignore[no-any-return]
-
-    job_running = cache.get(job_cache_id_running, False)
-    if not job_running:
-        cache.set(job_cache_id_running, True, CACHE_JOB_WORKER_TIME)
+    :param sandbox: The sandbox
+    :param node_names: Names of the nodes
+    :return: Console URLs by node name, None if some of them are not ready yet
+    """
+    consoles = _get_valid_consoles(sandbox.id)
+    missing = [name for name in node_names if name not in consoles]
+    if not missing:
+        return {name: consoles[name][0] for name in node_names}
+
+    if cache.add(CACHE_CONSOLES_JOB_KEY.format(sandbox.id), True, CACHE_JOB_WORKER_TIME):
         django_rq.enqueue(
-            get_console_url_job,
+            get_console_urls_job,
+            sandbox.id,
             sandbox.allocation_unit.get_stack_name(),
-            node_name,
-            settings.CRCZP_CONFIG.os_console_type.value,
-            console_cache_name,
-            job_cache_id_running,
+            missing,
         )
-    return ''
+    return None
+
 
+async def aget_console_urls(sandbox: Sandbox, node_names: list[str]) -> dict[str, str] | None:
+    """Asynchronous variant of get_console_urls."""
+    consoles = _filter_valid_consoles(await cache.aget(CACHE_CONSOLES_KEY.format(sandbox.id), {}))
+    missing = [name for name in node_names if name not in consoles]
+    if not missing:
+        return {name: consoles[name][0] for name in node_names}
 
-def get_node_access_data(topology_instance: TopologyInstance, node: Node) -> NodeAccessData:
-    """Return node access data containing management IP, port, host IP and available protocols."""
+    if await cache.aadd(CACHE_CONSOLES_JOB_KEY.format(sandbox.id), True, CACHE_JOB_WORKER_TIME):
+        await sync_to_async(django_rq.enqueue, thread_sensitive=False)(
+            get_console_urls_job,
+            sandbox.id,
+            sandbox.allocation_unit.get_stack_name(),
+            missing,
+        )
+    return None
+
+
+def get_console_url(sandbox: Sandbox, node_name: str) -> str:
+    """Get console URL for given VM, an empty string if it is not ready yet."""
+    consoles = get_console_urls(sandbox, [node_name])
+    return consoles[node_name] if consoles else ''
+
+
+def _get_valid_consoles(sandbox_id: int, valid_for: int = 0) -> dict[str, tuple[str, float]]:
+    """Return the cached console URLs of the sandbox that stay valid for valid_for seconds."""
+    return _filter_valid_consoles(cache.get(CACHE_CONSOLES_KEY.format(sandbox_id), {}), valid_for)
+
+
+def _filter_valid_consoles(
+    consoles: dict[str, tuple[str, float]], valid_for: int = 0
+) -> dict[str, tuple[str, float]]:
+    """Return the console URLs that stay valid for valid_for seconds."""
+    valid_until = time.time() + valid_for
+    return {name: console for name, console in consoles.items() if console[1] > valid_until}
+
+
+def get_node_access_data(
+    topology_instance: TopologyInstance,
+    node: Node,
+    images: common_cloud.ImageCatalog | None = None,
+) -> NodeAccessData:
+    """
+    Return node access data containing management IP, port, host IP and available protocols.
+
+    :param topology_instance: Topology instance of the sandbox
+    :param node: The node
+    :param images: Catalog of available images, the cached cloud catalog by default
+    :return: The access data
+    """
     if topology_instance is None:
         raise exceptions.ValidationError('Topology instance is None')
     if node is None:
@@ -131,31 +235,32 @@ def get_node_access_data(topology_instance: TopologyInstance, node: Node) -> Nod
         man_ip=topology_instance.ip,
         man_port=settings.CRCZP_CONFIG.man_port,
         host_ip=_get_node_ip(topology_instance, node),
-        protocols=get_node_available_protocols(node),
+        protocols=get_node_available_protocols(node, images),
     )
 
 
-def find_image_for_node(node: Node, images: list[Image] | None = None) -> Image:
+def find_image_for_node(node: Node, images: common_cloud.ImageCatalog | None = None) -> Image:
     """
     Find the image for a given node.
 
     :param node: The node object
-    :param images: List of available images
-    :type images: list
-    :return: The matching image object or None if not found
+    :param images: Catalog of available images, the cached cloud catalog by default
+    :return: The matching image object
+    :raise: ValidationError if there is no image of the node
     """
     if images is None:
-        images = list_images()
-    for image in images:
-        if image.name == node.base_box.image:
-            return image
-
-    raise exceptions.ValidationError(f'No image found for node {node.name}')
+        images = common_cloud.get_image_catalog()
+    image = images.get(node.base_box.image)
+    if image is None:
+        raise exceptions.ValidationError(f'No image found for node {node.name}')
+    return image
 
 
-def get_node_available_protocols(node: Node) -> list[Protocol]:
+def get_node_available_protocols(
+    node: Node, images: common_cloud.ImageCatalog | None = None
+) -> list[Protocol]:
     """Return the list of available access protocols for the given node."""
-    image = find_image_for_node(node)
+    image = find_image_for_node(node, images)
     protocols = [Protocol.ssh()]
     if get_node_image_has_gui_access(image):
         if image.os_type == 'linux':
@@ -174,8 +279,10 @@ def get_node_image_has_gui_access(image: Image) -> bool:
 
 def _get_node_ip(topology_instance: TopologyInstance, node: Node) -> str:
     """Get the IP address of a node from the topology instance."""
-    host_links = topology_instance.get_node_links(node, topology_instance.get_hosts_networks())
-    router_links = topology_instance.get_node_links(node, [topology_instance.wan])
+    graph = get_topology_graph(topology_instance)
+    host_links = graph.get_hosts_network_links(node)
+    wan_link = graph.get_link_between_node_and_network(node, topology_instance.wan)
+    router_links = [wan_link] if wan_link else []
 
     for link in itertools.chain(router_links, host_links):
         network = link.network
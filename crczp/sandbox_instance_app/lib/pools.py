@@ -4,8 +4,10 @@ Pool Service module for Pool management.
 
 import contextlib
 import io
+import itertools
 import zipfile
-from typing import Any
+from collections.abc import Iterator
+from typing import Any, override
 
 import structlog
 from django.conf import settings
@@ -19,13 +21,18 @@ from crczp.cloud_commons import (
     CrczpException,
     HardwareUsage,
     InvalidTopologyDefinition,
-    StackCreationFailed,
 )
-from crczp.sandbox_common_lib import exceptions, utils
+from crczp.sandbox_common_lib import common_cloud, exceptions, utils
 from crczp.sandbox_definition_app.lib import definitions
 from crczp.sandbox_definition_app.models import Definition
 from crczp.sandbox_instance_app import serializers
-from crczp.sandbox_instance_app.lib import requests, sandboxes
+from crczp.sandbox_instance_app.lib import (
+    access_bundles,
+    definition_snapshots,
+    requests,
+    reservations,
+    sandboxes,
+)
 from crczp.sandbox_instance_app.models import (
     Pool,
     PoolLock,
@@ -36,8 +43,9 @@ from crczp.sandbox_instance_app.models import (
 
 LOG = structlog.get_logger()
 POOL_CACHE_TIMEOUT = None
-PROJECT_LIMITS_CACHE_IDENTIFIER = 'project-limits'
 POOL_CACHE_PREFIX = 'hardware-usage-pool-{}'
+# Sandboxes whose management SSH configs are fetched and written at once.
+MANAGEMENT_SSH_ACCESS_BATCH_SIZE = 100
 
 
 def get_pool(pool_pk: int) -> Pool:
@@ -86,6 +94,7 @@ def create_pool(data: dict[str, Any], created_by: User | None) -> Pool:
                 definition.url, pool.rev_sha, settings.CRCZP_CONFIG
             )
         client.validate_topology_definition(top_def)
+        definition_snapshots.create_snapshot(pool)
     except (exceptions.GitError, exceptions.ValidationError, InvalidTopologyDefinition):
         pool.delete()
         raise
@@ -123,6 +132,7 @@ def delete_pool(pool: Pool) -> None:
     try:
         pool.delete()
         utils.clear_cache(pool_cache_key)
+        definitions.delete_unused_files()
     except ProtectedError as e:
         error_message = str(e)
         if 'PoolLock' in error_message:
@@ -152,38 +162,23 @@ def get_sandboxes_in_pool(pool: Pool) -> QuerySet[Sandbox, Sandbox]:
     return Sandbox.objects.all().filter(allocation_unit_id__in=alloc_unit_ids)
 
 
-def validate_hardware_usage_of_sandboxes(pool: Pool, count: int) -> None:
-    """
-    Validates Heat Stacks hardware usage of sandboxes against OpenStack limits.
-
-    :param pool: Pool in which sandboxes are built.
-    :param count: Number of sandboxes.
-    :return: None
-    :raise: StackError if limits are exceeded.
-    """
-    try:
-        top_def = definitions.get_definition(
-            pool.definition.url, pool.rev_sha, settings.CRCZP_CONFIG
-        )
-        client = utils.get_terraform_client()
-        topology_instance = client.get_topology_instance(top_def)
-        client.validate_hardware_usage_of_stacks(topology_instance, count)
-    except StackCreationFailed as exc:
-        raise exceptions.StackError(f'Cannot build {count} sandboxes: {exc}') from exc
-
-
 def create_sandboxes_in_pool(
     pool: Pool, created_by: User | None, count: int | None = None
 ) -> list[SandboxAllocationUnit]:
     """
-    Creates count sandboxes in given pool.
+    Creates count sandboxes in given pool and reserves their cloud resources.
 
     :param pool: Pool where to build sandbox
     :param created_by: User initiating the build.
     :param count: Count of sandboxes, None to build maximum
     :return: sandbox instance
+    :raise StackError: if the cloud limits would be exceeded
     """
+    # Resolved before locking, so the ledger and the pool are not locked during cloud calls.
+    hardware_usage = get_sandbox_hardware_usage(pool)
+    quota_set = common_cloud.get_quota_set()
     with transaction.atomic():
+        reservations.lock_ledger()
         pool = Pool.objects.select_for_update().get(pk=pool.id)
 
         current_size = pool.size
@@ -196,8 +191,9 @@ def create_sandboxes_in_pool(
                 f' cannot build {count} more sandboxes'
             )
 
-        validate_hardware_usage_of_sandboxes(pool, count)
+        reservations.check_capacity(hardware_usage, count, quota_set)
         units = requests.create_allocations_requests(pool, count, created_by)
+        reservations.reserve(units, hardware_usage)
         pool.size += count
         pool.save()
         return units
@@ -224,6 +220,7 @@ def get_unlocked_sandbox(pool: Pool, created_by: User | None) -> Sandbox | None:
         if not sandbox:
             return None
         SandboxLock.objects.create(sandbox=sandbox, created_by=created_by)
+        transaction.on_commit(lambda: sandboxes.prefetch_console_urls(sandbox))
         return sandbox
 
 
@@ -243,39 +240,116 @@ def lock_pool(pool: Pool, training_access_token: str | None = None) -> PoolLock:
         return PoolLock.objects.create(pool=pool, training_access_token=training_access_token)
 
 
-def get_management_ssh_access(pool: Pool) -> io.BytesIO:
-    """Get management SSH access files."""
-    ssh_access_name = f'pool-id-{pool.id}'
-    private_key_name = f'{ssh_access_name}-management-key'
-    public_key_name = f'{private_key_name}.pub'
-
-    in_memory_zip_file = io.BytesIO()
-    with zipfile.ZipFile(in_memory_zip_file, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for sandbox in get_sandboxes_in_pool(pool):
-            tmp = f'{ssh_access_name}-sandbox-id-{sandbox.id}-management'
-            ssh_config_name = f'{tmp}-config'
-
-            ssh_config = sandboxes.get_management_sshconfig(sandbox, f'~/.ssh/{private_key_name}')
+def get_management_key_name(pool: Pool) -> str:
+    """Return the file name of the management private key of the pool in its SSH access zip."""
+    return f'pool-id-{pool.id}-management-key'
 
-            zip_file.writestr(ssh_config_name, ssh_config.serialize())
 
-        zip_file.writestr(private_key_name, pool.private_management_key)
-        zip_file.writestr(public_key_name, pool.public_management_key)
+def get_management_ssh_access(pool: Pool) -> Iterator[bytes]:
+    """
+    Return the zip of the management SSH access files, streamed as it is written.
+
+    Sandboxes which are not ready and have no topology snapshot cannot be rendered without
+    the cloud, so they are refused by a single query before the zip is started. The sandboxes
+    are then read and written in batches of MANAGEMENT_SSH_ACCESS_BATCH_SIZE, so the memory
+    does not grow with the pool size: the SSH configs of ready sandboxes are taken from their
+    cached access bundles, the others are rendered from their topology instances (loaded in
+    a single cache round trip per batch). Rendering is CPU-bound, so it is not done by threads.
+
+    :param pool: The pool
+    :return: Iterator of the chunks of the zip
+    :raise ValidationError: Some sandbox of the pool is not ready and has no topology snapshot
+    """
+    not_ready = list(
+        get_sandboxes_in_pool(pool)
+        .filter(ready=False, topology_snapshot__isnull=True)
+        .values_list('id', flat=True)
+    )
+    if not_ready:
+        raise exceptions.ValidationError(
+            f'The topology of sandboxes {not_ready} is not known yet, try it again later.'
+        )
+    return _write_management_ssh_access(pool)
 
-    in_memory_zip_file.seek(0)
-    return in_memory_zip_file
 
+def _write_management_ssh_access(pool: Pool) -> Iterator[bytes]:
+    """Write the zip of the SSH configs by sandbox ID and the management keys by batches."""
+    ssh_access_name = f'pool-id-{pool.id}'
+    private_key_name = get_management_key_name(pool)
+    sandbox_list = (
+        get_sandboxes_in_pool(pool)
+        .select_related('allocation_unit__pool')
+        .iterator(chunk_size=MANAGEMENT_SSH_ACCESS_BATCH_SIZE)
+    )
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for batch in itertools.batched(sandbox_list, MANAGEMENT_SSH_ACCESS_BATCH_SIZE):
+            ssh_configs = _get_management_ssh_configs(list(batch), private_key_name)
+            for sandbox, ssh_config in zip(batch, ssh_configs, strict=True):
+                zip_file.writestr(
+                    f'{ssh_access_name}-sandbox-id-{sandbox.id}-management-config', ssh_config
+                )
+            yield stream.flush_chunk()
 
-def _get_hardware_usage(url: str, rev: str) -> HardwareUsage | None:
+        zip_file.writestr(private_key_name, pool.private_management_key)
+        zip_file.writestr(f'{private_key_name}.pub', pool.public_management_key)
+    yield stream.flush_chunk()
+
+
+def _get_management_ssh_configs(sandbox_list: list[Sandbox], private_key_name: str) -> list[str]:
+    """Return the serialized management SSH configs of the sandboxes, in their order."""
+    bundles = access_bundles.get_cached([sandbox for sandbox in sandbox_list if sandbox.ready])
+    ssh_configs = {
+        sandbox_id: bundle.management_ssh_config for sandbox_id, bundle in bundles.items()
+    }
+    missing = [sandbox for sandbox in sandbox_list if sandbox.id not in ssh_configs]
+    if missing:
+        topology_instances = sandboxes.get_topology_instances(missing)
+        for sandbox in missing:
+            ssh_configs[sandbox.id] = sandboxes.get_management_sshconfig(
+                sandbox, f'~/.ssh/{private_key_name}', topology_instances[sandbox.id]
+            ).serialize()
+    return [ssh_configs[sandbox.id] for sandbox in sandbox_list]
+
+
+class _ZipStream(io.RawIOBase):
+    """Unseekable file collecting the data written by ZipFile until they are flushed."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._buffer = bytearray()
+        self._position = 0
+
+    @override
+    def writable(self) -> bool:
+        return True
+
+    @override
+    def write(self, data: Any) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    @override
+    def tell(self) -> int:
+        return self._position
+
+    def flush_chunk(self) -> bytes:
+        """Return the data written since the last call."""
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        return chunk
+
+
+def _get_hardware_usage(pool: Pool) -> HardwareUsage | None:
     """
     Get Heat Stack hardware usage calculated from topology definition.
 
-    :param url: URL of git repository from which topology definition is downloaded
-    :param rev: Revision of git repository
+    :param pool: Pool whose pinned topology definition is used
     :return: Hardware usage or None if error occurs.
     """
     try:
-        top_def = definitions.get_definition(url, rev, settings.CRCZP_CONFIG)
+        top_def = definition_snapshots.get_definition(pool)
         client = utils.get_terraform_client()
         client.validate_topology_definition(top_def)
         top_instance = client.get_topology_instance(top_def)
@@ -290,6 +364,25 @@ def _get_hardware_usage(url: str, rev: str) -> HardwareUsage | None:
     return client.get_hardware_usage(top_instance)
 
 
+def get_sandbox_hardware_usage(pool: Pool) -> HardwareUsage:
+    """
+    Get Heat Stack hardware usage of a single sandbox in a pool, cached per pool.
+
+    :param pool: Pool whose pinned topology definition is used
+    :return: Hardware usage
+    :raise StackError: if the hardware usage cannot be calculated
+    """
+    hardware_usage = cache.get(get_cache_key(pool))
+    if hardware_usage is None:
+        hardware_usage = _get_hardware_usage(pool)
+        if hardware_usage is None:
+            raise exceptions.StackError(
+                f'Cannot calculate hardware usage of sandboxes of pool (ID="{pool.id}").'
+            )
+        cache.set(get_cache_key(pool), hardware_usage, POOL_CACHE_TIMEOUT)
+    return hardware_usage
+
+
 def get_hardware_usage_of_sandbox(pool: Pool) -> HardwareUsage | None:
     """
     Get Heat Stack hardware usage of a single sandbox in a pool, whether it is allocated or not.
@@ -299,16 +392,12 @@ def get_hardware_usage_of_sandbox(pool: Pool) -> HardwareUsage | None:
     """
     # sentinel object is used to differentiate between stored None and cache miss
     sentinel = object()
-    definition = pool.definition
 
     hardware_usage = cache.get(get_cache_key(pool), sentinel)
     if hardware_usage is sentinel:
-        hardware_usage = _get_hardware_usage(definition.url, definition.rev)
+        hardware_usage = _get_hardware_usage(pool)
 
-    limits = cache.get(PROJECT_LIMITS_CACHE_IDENTIFIER, sentinel)
-    if limits is sentinel:
-        client = utils.get_terraform_client()
-        limits = client.get_project_limits()
+    limits = common_cloud.get_project_limits()
 
     hardware_usage_pool = hardware_usage
     if hardware_usage_pool:
@@ -316,7 +405,6 @@ def get_hardware_usage_of_sandbox(pool: Pool) -> HardwareUsage | None:
         hardware_usage_pool /= limits
 
     cache.set(get_cache_key(pool), hardware_usage, POOL_CACHE_TIMEOUT)
-    cache.set(PROJECT_LIMITS_CACHE_IDENTIFIER, limits, POOL_CACHE_TIMEOUT)
 
     return hardware_usage_pool
 
@@ -13,6 +13,7 @@ from django.db import transaction
 from rq import Queue
 from rq.job import Job
 
+from crczp.sandbox_ansible_app.lib import ansible
 from crczp.sandbox_ansible_app.models import (
     AnsibleAllocationStage,
     NetworkingAnsibleAllocationStage,
@@ -21,7 +22,7 @@ from crczp.sandbox_ansible_app.models import (
     UserAnsibleCleanupStage,
 )
 from crczp.sandbox_common_lib import exceptions, utils
-from crczp.sandbox_instance_app.lib import netbird, pools, requests, sandboxes
+from crczp.sandbox_instance_app.lib import access_bundles, netbird, pools, requests, sandboxes
 from crczp.sandbox_instance_app.lib.stage_handlers import (
     AllocationAnsibleStageHandler,
     AllocationStackStageHandler,
@@ -272,6 +273,9 @@ class AllocationRequestHandler(RequestHandler):
         # (cleanup would never find them again). Re-provisioning for the new
         # sandbox is handled by _enqueue_stages below.
         netbird.destroy_netbird_for_sandbox(old_sandbox)
+        sandboxes.clear_cache(old_sandbox)
+        access_bundles.clear_cache(old_sandbox)
+        ansible.clear_inventory_cache(old_sandbox)
         old_sandbox.delete()
         pri_key, pub_key = utils.generate_ssh_keypair()
         sandbox = Sandbox(
@@ -397,10 +401,17 @@ class AllocationRequestHandler(RequestHandler):
         """
         Named method used as finalizing stage function.
 
-        Sets sandbox.ready to True, meaning it can be used for trainings.
+        Sets sandbox.ready to True, meaning it can be used for trainings,
+        builds the access bundle and prefetches the console URLs of the sandbox.
         """
         sandbox.ready = True
         sandbox.save()
+        try:
+            access_bundles.build(sandbox)
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            # The bundle is built on its first use instead.
+            LOG.warning('Failed to build the access bundle', sandbox_id=sandbox.id, error=str(ex))
+        sandboxes.prefetch_console_urls(sandbox)
 
 
 class CleanupRequestHandler(RequestHandler):
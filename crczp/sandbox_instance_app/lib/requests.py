@@ -10,8 +10,9 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
 
+from crczp.sandbox_ansible_app.lib import ansible
 from crczp.sandbox_common_lib import exceptions
-from crczp.sandbox_instance_app.lib import netbird, request_handlers, sandboxes
+from crczp.sandbox_instance_app.lib import access_bundles, netbird, request_handlers, sandboxes
 from crczp.sandbox_instance_app.models import (
     AllocationRequest,
     CleanupRequest,
@@ -106,6 +107,8 @@ def create_cleanup_request_force(allocation_unit: SandboxAllocationUnit, delete_
 
     if sandbox:
         sandboxes.clear_cache(sandbox)
+        access_bundles.clear_cache(sandbox)
+        ansible.clear_inventory_cache(sandbox)
         netbird.destroy_netbird_for_sandbox(sandbox)
         sandbox.delete()
 
@@ -149,6 +152,8 @@ def create_cleanup_request(allocation_unit: SandboxAllocationUnit) -> None:
 
     if sandbox:
         sandboxes.clear_cache(sandbox)
+        access_bundles.clear_cache(sandbox)
+        ansible.clear_inventory_cache(sandbox)
         netbird.destroy_netbird_for_sandbox(sandbox)
         sandbox.delete()
 
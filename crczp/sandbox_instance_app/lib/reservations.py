@@ -0,0 +1,136 @@
+"""
+Ledger of the cloud resources reserved by allocation units.
+
+Resources are reserved when the allocation requests are created and released when the
+allocation units are deleted after their cleanup. Capacity checks are local arithmetic:
+the quota set of the project comes from the periodically refreshed cloud catalog, and the
+usage is the larger of the usage reported by the cloud and the reserved resources, so stacks
+still being built and resources not created by this service are both accounted for.
+
+Allocation units created before the ledger was introduced have no reservations. Their built
+stacks are accounted for by the usage reported by the cloud, only the stacks which were still
+being built when the ledger was introduced are not accounted for until they finish.
+"""
+
+from collections.abc import Iterable
+from typing import Any
+
+from django.db import connection
+from django.db.models import Sum
+
+from crczp.cloud_commons import HardwareUsage, QuotaSet
+from crczp.sandbox_common_lib import common_cloud, exceptions
+from crczp.sandbox_instance_app.models import ResourceReservation, SandboxAllocationUnit
+
+RESOURCES = ('vcpu', 'ram', 'instances', 'network', 'subnet', 'port')
+# Key of the advisory lock of the ledger, unique among the advisory locks of the database.
+LEDGER_LOCK_KEY = 1_804_289_383
+
+
+def lock_ledger() -> None:
+    """
+    Lock the ledger until the end of the current transaction, so that concurrent
+    reservations are checked one after another. No rows are locked.
+
+    PostgreSQL takes a transaction-level advisory lock; other databases, such as SQLite
+    used in development, serialize write transactions themselves.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [LEDGER_LOCK_KEY])
+
+
+def get_reserved() -> HardwareUsage:
+    """Get the sum of all reserved resources."""
+    totals = ResourceReservation.objects.aggregate(**{
+        resource: Sum(resource) for resource in RESOURCES
+    })
+    return HardwareUsage(**{resource: totals[resource] or 0 for resource in RESOURCES})
+
+
+def get_available(quota_set: QuotaSet | None = None) -> dict[str, float | None]:
+    """
+    Get the resources still available in the cloud project.
+
+    :param quota_set: Quota set of the project, the cached one by default
+    :return: Available amount by resource, None if the resource is unlimited
+    """
+    quota_set = quota_set or common_cloud.get_quota_set()
+    reserved = get_reserved()
+    available: dict[str, float | None] = {}
+    for resource in RESOURCES:
+        quota = getattr(quota_set, resource)
+        if quota.limit < 0:
+            available[resource] = None
+            continue
+        used = max(quota.in_use, getattr(reserved, resource))
+        available[resource] = max(quota.limit - used, 0)
+    return available
+
+
+def count_fitting(hardware_usage: HardwareUsage, available: dict[str, float | None]) -> int | None:
+    """
+    Count how many more sandboxes of the hardware usage fit into the available resources.
+
+    :param hardware_usage: Hardware usage of a single sandbox
+    :param available: Available resources, see get_available
+    :return: The number of sandboxes, None if there is no limit
+    """
+    counts = [
+        int(amount // getattr(hardware_usage, resource))
+        for resource, amount in available.items()
+        if amount is not None and getattr(hardware_usage, resource) > 0
+    ]
+    return min(counts, default=None)
+
+
+def project_capacity(hardware_usage: HardwareUsage) -> dict[str, Any]:
+    """
+    Project how many more sandboxes of the hardware usage can be built.
+
+    :param hardware_usage: Hardware usage of a single sandbox
+    :return: The number of sandboxes (None if there is no limit), the hardware usage
+        of a sandbox and the available resources
+    """
+    available = get_available()
+    return {
+        'sandboxes': count_fitting(hardware_usage, available),
+        'hardware_usage': hardware_usage,
+        'available': available,
+    }
+
+
+def check_capacity(hardware_usage: HardwareUsage, count: int, quota_set: QuotaSet) -> None:
+    """
+    Check that count sandboxes of the hardware usage fit into the available resources.
+    Makes no cloud calls, so it can run while the ledger is locked.
+
+    :param hardware_usage: Hardware usage of a single sandbox
+    :param count: Number of sandboxes
+    :param quota_set: Quota set of the project, resolved before locking the ledger
+    :raise StackError: The cloud limits would be exceeded
+    """
+    available = get_available(quota_set)
+    for resource, amount in available.items():
+        required = getattr(hardware_usage, resource) * count
+        if amount is not None and required > amount:
+            raise exceptions.StackError(
+                f'Cannot build {count} sandboxes: Cloud limits will be exceeded'
+                f' (required: {required}, available: {amount} [{resource}]).'
+            )
+
+
+def reserve(
+    units: Iterable[SandboxAllocationUnit], hardware_usage: HardwareUsage
+) -> list[ResourceReservation]:
+    """
+    Reserve the resources of a sandbox of the hardware usage for each of the units.
+
+    :param units: Allocation units to reserve the resources for
+    :param hardware_usage: Hardware usage of a single sandbox
+    :return: The created reservations
+    """
+    usage = {resource: getattr(hardware_usage, resource) for resource in RESOURCES}
+    return ResourceReservation.objects.bulk_create(
+        ResourceReservation(allocation_unit=unit, **usage) for unit in units
+    )
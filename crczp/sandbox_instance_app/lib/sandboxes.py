@@ -5,34 +5,44 @@ Sandbox Service module for Sandbox management.
 import io
 import json
 import os
+import pickle  # nosec B403
 import uuid
 import zipfile
+from datetime import timedelta
 from typing import Any
 
+import django_rq
+import redis
 import requests
 import structlog
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.cache import cache
 from django.db import transaction
+from django.http import Http404
 from rest_framework.generics import get_object_or_404
 
 from crczp.cloud_commons import TopologyInstance
-from crczp.sandbox_common_lib import exceptions, utils
-from crczp.sandbox_definition_app.lib import definitions
+from crczp.sandbox_ansible_app.lib import ansible
+from crczp.sandbox_common_lib import exceptions, http_client, utils
+from crczp.sandbox_instance_app.lib import definition_snapshots, nodes
 from crczp.sandbox_instance_app.lib.sshconfig import (
     CrczpAnsibleSSHConfig,
     CrczpMgmtSSHConfig,
     CrczpUserSSHConfig,
 )
 from crczp.sandbox_instance_app.lib.topology import Topology
-from crczp.sandbox_instance_app.models import Sandbox, SandboxLock
+from crczp.sandbox_instance_app.lib.topology_cache import get_topology_cache
+from crczp.sandbox_instance_app.models import Sandbox, SandboxLock, SandboxTopologySnapshot
 from crczp.topology_definition.models import DockerContainers, Host, Router, TopologyDefinition
 
 SANDBOX_CACHE_TIMEOUT = None  # Cache indefinitely
 SANDBOX_CACHE_PREFIX = 'terraformstack-{}'
 TEMPLATE_DIR_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'assets')
 HEADERS = {'accept': 'application/json', 'Content-Type': 'application/json'}
+CONSOLE_PREFETCH_JOB_ID = 'console-prefetch-{}'
+CONSOLE_REFRESH_MARGIN = 600  # refresh the console URLs of locked sandboxes before they expire
+CONSOLE_PREFETCH_RETRY_DELAY = 30  # retry the prefetch while another fetch of the URLs runs
 LOG = structlog.getLogger()
 
 
@@ -60,8 +70,8 @@ def post_answers(user_id: int, access_token: str, generated_variables: Any) -> N
         answers_storage_endpoint = (
             settings.CRCZP_CONFIG.answers_storage_api.rstrip('/') + '/sandboxes'
         )
-        post_response = requests.post(
-            answers_storage_endpoint, data=post_data_json, headers=HEADERS, timeout=30
+        post_response = http_client.post(
+            answers_storage_endpoint, data=post_data_json, headers=HEADERS
         )
         post_response.raise_for_status()
     except requests.HTTPError as exc:
@@ -83,15 +93,29 @@ def get_sandbox(sb_pk: int | str, include_unfinished: bool = False) -> Sandbox:
     return get_object_or_404(Sandbox, pk=sb_pk, ready=True)
 
 
+async def aget_sandbox(sb_pk: int | str) -> Sandbox:
+    """
+    Asynchronous variant of get_sandbox, retrieving the sandbox
+    with its allocation unit and pool.
+
+    :param sb_pk: Sandbox primary key (ID)
+    :return: Ready sandbox instance from DB
+    :raise Http404: if sandbox does not exist
+    """
+    try:
+        return await Sandbox.objects.select_related('allocation_unit__pool').aget(
+            pk=sb_pk, ready=True
+        )
+    except (Sandbox.DoesNotExist, TypeError, ValueError):
+        raise Http404(f'No sandbox matches the ID {sb_pk}.') from None
+
+
 def get_topology_definition_and_containers(
     sandbox: Sandbox,
 ) -> tuple[TopologyDefinition, DockerContainers]:
-    """Create topology definition for given sandbox."""
+    """Create topology definition for given sandbox from the definition pinned by its pool."""
     pool = sandbox.allocation_unit.pool
-    definition = pool.definition
-    return definitions.get_definition(
-        definition.url, pool.rev_sha, settings.CRCZP_CONFIG
-    ), definitions.get_containers(definition.url, pool.rev_sha, settings.CRCZP_CONFIG)
+    return definition_snapshots.get_definition(pool), definition_snapshots.get_containers(pool)
 
 
 def lock_sandbox(sandbox: Sandbox, created_by: User | None) -> SandboxLock:
@@ -100,7 +124,68 @@ def lock_sandbox(sandbox: Sandbox, created_by: User | None) -> SandboxLock:
         sandbox = Sandbox.objects.select_for_update().get(pk=sandbox.id)
         if hasattr(sandbox, 'lock'):
             raise exceptions.ValidationError('Sandbox already locked.')
-        return SandboxLock.objects.create(sandbox=sandbox, created_by=created_by)
+        lock = SandboxLock.objects.create(sandbox=sandbox, created_by=created_by)
+        transaction.on_commit(lambda: prefetch_console_urls(sandbox))
+        return lock
+
+
+def get_console_node_names(sandbox: Sandbox) -> list[str]:
+    """Get the names of the nodes of the sandbox that have a console: visible hosts and routers."""
+    return _get_console_node_names(get_topology_instance(sandbox))
+
+
+async def aget_console_node_names(sandbox: Sandbox) -> list[str]:
+    """Asynchronous variant of get_console_node_names."""
+    return _get_console_node_names(await aget_topology_instance(sandbox))
+
+
+def _get_console_node_names(topology_instance: TopologyInstance) -> list[str]:
+    return [host.name for host in topology_instance.get_hosts() if not host.hidden] + [
+        router.name for router in topology_instance.get_routers()
+    ]
+
+
+def prefetch_console_urls(sandbox: Sandbox) -> None:
+    """
+    Enqueue fetching of the console URLs of the sandbox, so they are ready for the first
+    request. Failures to enqueue are logged, not raised.
+    """
+    try:
+        django_rq.get_queue().enqueue(
+            prefetch_console_urls_job, sandbox.id, job_id=CONSOLE_PREFETCH_JOB_ID.format(sandbox.id)
+        )
+    except redis.exceptions.RedisError as ex:
+        LOG.warning(
+            'Failed to enqueue the console URLs prefetch', sandbox_id=sandbox.id, error=str(ex)
+        )
+
+
+def prefetch_console_urls_job(sandbox_id: int) -> None:
+    """
+    RQ job fetching the console URLs of the sandbox that are missing or about to expire.
+    While the sandbox is locked, the job reschedules itself ahead of the expiry of the URLs.
+    If another fetch of the URLs is running, the job is retried after
+    CONSOLE_PREFETCH_RETRY_DELAY seconds instead.
+    """
+    sandbox = Sandbox.objects.filter(pk=sandbox_id).select_related('allocation_unit').first()
+    if sandbox is None:
+        return
+    delay = None
+    try:
+        if not nodes.refresh_console_urls(
+            sandbox, get_console_node_names(sandbox), valid_for=CONSOLE_REFRESH_MARGIN
+        ):
+            delay = CONSOLE_PREFETCH_RETRY_DELAY
+    finally:
+        if delay is None and SandboxLock.objects.filter(sandbox_id=sandbox_id).exists():
+            delay = nodes.CACHE_CONSOLE_TIMEOUT - CONSOLE_REFRESH_MARGIN
+        if delay is not None:
+            django_rq.get_queue().enqueue_in(
+                timedelta(seconds=delay),
+                prefetch_console_urls_job,
+                sandbox_id,
+                job_id=CONSOLE_PREFETCH_JOB_ID.format(sandbox_id),
+            )
 
 
 def get_sandbox_topology(sandbox: Sandbox) -> Topology:
@@ -111,10 +196,12 @@ def get_sandbox_topology(sandbox: Sandbox) -> Topology:
 
 
 def get_user_sshconfig(
-    sandbox: Sandbox, sandbox_private_key_path: str = '<path_to_sandbox_private_key>'
+    sandbox: Sandbox,
+    sandbox_private_key_path: str = '<path_to_sandbox_private_key>',
+    topology_instance: TopologyInstance | None = None,
 ) -> CrczpUserSSHConfig:
-    """Get user SSH config."""
-    ti = get_topology_instance(sandbox)
+    """Get user SSH config, of the cached topology instance of the sandbox by default."""
+    ti = topology_instance or get_topology_instance(sandbox)
     # Sandbox jump host name is stack name
     stack_name = sandbox.allocation_unit.get_stack_name()
     proxy_jump = settings.CRCZP_CONFIG.proxy_jump_to_man
@@ -123,14 +210,16 @@ def get_user_sshconfig(
     )
 
 
-def get_user_ssh_access(sandbox: Sandbox) -> io.BytesIO:
-    """Get user SSH access files."""
+def get_user_ssh_access(
+    sandbox: Sandbox, topology_instance: TopologyInstance | None = None
+) -> io.BytesIO:
+    """Get user SSH access files, of the cached topology instance of the sandbox by default."""
     ssh_access_name = f'pool-id-{sandbox.allocation_unit.pool.id}-sandbox-id-{sandbox.id}-user'
     ssh_config_name = f'{ssh_access_name}-config'
     private_key_name = f'{ssh_access_name}-key'
     public_key_name = f'{private_key_name}.pub'
 
-    ssh_config = get_user_sshconfig(sandbox, f'~/.ssh/{private_key_name}')
+    ssh_config = get_user_sshconfig(sandbox, f'~/.ssh/{private_key_name}', topology_instance)
 
     in_memory_zip_file = io.BytesIO()
     with zipfile.ZipFile(in_memory_zip_file, 'w', zipfile.ZIP_DEFLATED) as zip_file:
@@ -143,10 +232,12 @@ def get_user_ssh_access(sandbox: Sandbox) -> io.BytesIO:
 
 
 def get_management_sshconfig(
-    sandbox: Sandbox, pool_private_key_path: str = '<path_to_pool_private_key>'
+    sandbox: Sandbox,
+    pool_private_key_path: str = '<path_to_pool_private_key>',
+    topology_instance: TopologyInstance | None = None,
 ) -> CrczpMgmtSSHConfig:
-    """Get management SSH config."""
-    ti = get_topology_instance(sandbox)
+    """Get management SSH config, of the cached topology instance of the sandbox by default."""
+    ti = topology_instance or get_topology_instance(sandbox)
     proxy_jump_host = settings.CRCZP_CONFIG.proxy_jump_to_man.Host
     proxy_jump_user = sandbox.allocation_unit.pool.get_pool_prefix()
     proxy_jump_port = settings.CRCZP_CONFIG.proxy_jump_to_man.Port
@@ -172,19 +263,110 @@ def get_ansible_sshconfig(
 
 
 def get_topology_instance(sandbox: Sandbox) -> TopologyInstance:
-    """Get topology instance object. This function is cached."""
-    client = utils.get_terraform_client()
-    topology_definition, containers = get_topology_definition_and_containers(sandbox)
-    ti = cache.get_or_set(
+    """
+    Get topology instance object. This function is cached in memory and in Redis,
+    in front of the snapshot stored in the database.
+
+    The definition is fetched from git and the cloud queried only when there is no snapshot.
+    """
+    ti = get_topology_cache().get_or_set(
+        get_cache_key(sandbox), lambda: _load_topology_instance(sandbox), SANDBOX_CACHE_TIMEOUT
+    )
+    return ti
+
+
+def get_topology_instances(sandbox_list: list[Sandbox]) -> dict[str, TopologyInstance]:
+    """
+    Batched variant of get_topology_instance. The cache is read in a single round trip
+    and the snapshots of the sandboxes missing from it in a single database query.
+
+    :param sandbox_list: The sandboxes
+    :return: Topology instances by sandbox ID
+    """
+    by_key = {get_cache_key(sandbox): sandbox for sandbox in sandbox_list}
+    instances = get_topology_cache().get_or_set_many(
+        list(by_key),
+        lambda keys: {
+            get_cache_key(sandbox): ti
+            for sandbox, ti in _load_topology_instances([by_key[key] for key in keys])
+        },
+        SANDBOX_CACHE_TIMEOUT,
+    )
+    return {by_key[key].id: ti for key, ti in instances.items()}
+
+
+async def aget_topology_instance(sandbox: Sandbox) -> TopologyInstance:
+    """Asynchronous variant of get_topology_instance."""
+    return await get_topology_cache().aget_or_set(  # type: ignore[no-any-return]
         get_cache_key(sandbox),
-        lambda: client.get_enriched_topology_instance(
-            sandbox.allocation_unit.get_stack_name(), topology_definition, containers
-        ),
+        sync_to_async(lambda: _load_topology_instance(sandbox)),
         SANDBOX_CACHE_TIMEOUT,
     )
+
+
+def save_topology_snapshot(sandbox: Sandbox) -> TopologyInstance:
+    """
+    Create the enriched topology instance of the sandbox from the cloud
+    and store it in the database.
+
+    :param sandbox: Sandbox whose stack has already been created
+    :return: The new topology instance
+    """
+    client = utils.get_terraform_client()
+    topology_definition, containers = get_topology_definition_and_containers(sandbox)
+    ti = client.get_enriched_topology_instance(
+        sandbox.allocation_unit.get_stack_name(), topology_definition, containers
+    )
+    SandboxTopologySnapshot.objects.update_or_create(
+        sandbox_id=sandbox.id, defaults={'data': pickle.dumps(ti)}
+    )
     return ti
 
 
+def refresh_topology_instance(sandbox: Sandbox) -> TopologyInstance:
+    """Re-create the topology snapshot from the cloud and drop its cached copies
+    and the Ansible inventory built from it."""
+    ti = save_topology_snapshot(sandbox)
+    clear_cache(sandbox)
+    ansible.clear_inventory_cache(sandbox)
+    return ti
+
+
+def _load_topology_instance(sandbox: Sandbox) -> TopologyInstance:
+    snapshot = SandboxTopologySnapshot.objects.filter(sandbox_id=sandbox.id).first()
+    return _load_snapshot(sandbox, snapshot) or save_topology_snapshot(sandbox)
+
+
+def _load_topology_instances(
+    sandbox_list: list[Sandbox],
+) -> list[tuple[Sandbox, TopologyInstance]]:
+    snapshots = {
+        snapshot.sandbox_id: snapshot
+        for snapshot in SandboxTopologySnapshot.objects.filter(
+            sandbox_id__in=[sandbox.id for sandbox in sandbox_list]
+        )
+    }
+    return [
+        (
+            sandbox,
+            _load_snapshot(sandbox, snapshots.get(sandbox.id)) or save_topology_snapshot(sandbox),
+        )
+        for sandbox in sandbox_list
+    ]
+
+
+def _load_snapshot(
+    sandbox: Sandbox, snapshot: SandboxTopologySnapshot | None
+) -> TopologyInstance | None:
+    if snapshot is not None:
+        try:
+            # The snapshot is written only by this service.
+            return pickle.loads(snapshot.data)  # type: ignore[no-any-return]  # nosec B301
+        except (pickle.UnpicklingError, AttributeError, ImportError, EOFError) as exc:
+            LOG.warning('Invalid topology snapshot, re-creating it', sandbox=sandbox.id, exc=exc)
+    return None
+
+
 def get_topology_host(sandbox: Sandbox, host_name: str) -> Host | Router:
     """Get specific host from topology instance."""
     ti = get_topology_instance(sandbox)
@@ -197,8 +379,8 @@ def get_topology_host(sandbox: Sandbox, host_name: str) -> Host | Router:
 
 
 def clear_cache(sandbox: Sandbox) -> None:
-    """Delete cached entries for this sandbox."""
-    cache.delete(get_cache_key(sandbox))
+    """Delete cached entries for this sandbox in all processes."""
+    get_topology_cache().delete(get_cache_key(sandbox))
 
 
 def get_cache_key(sandbox: Sandbox) -> str:
@@ -6,6 +6,7 @@ import structlog
 from ssh_config.client import Host, parse_config  # Don't import SSHConfig unless reading from file
 
 from crczp.cloud_commons import Link, TopologyInstance
+from crczp.sandbox_common_lib.topology_graph import get_topology_graph
 
 LOG = structlog.getLogger()
 
@@ -163,7 +164,7 @@ class CrczpUserSSHConfig(CrczpSSHConfig):
         man_proxy_jump = f'{SSH_PROXY_USERNAME}@{top_ins.man.name}'
 
         # Create an entry for user-accessible nodes of a sandbox.
-        for link in top_ins.get_links_to_user_accessible_nodes():
+        for link in get_topology_graph(top_ins).get_links_to_user_accessible_nodes():
             self.add_host(
                 link.ip,
                 SSH_PROXY_USERNAME,
@@ -232,10 +233,7 @@ class CrczpMgmtSSHConfig(CrczpSSHConfig):
         """
         Get links for MAN-accessible nodes using Management network.
         """
-        return [
-            link_pair.second
-            for link_pair in top_ins.get_link_pairs_man_to_nodes_over_management_network()
-        ]
+        return get_topology_graph(top_ins).get_management_links()
 
 
 class CrczpAnsibleSSHConfig(CrczpMgmtSSHConfig):
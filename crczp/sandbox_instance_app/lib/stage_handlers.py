@@ -25,7 +25,7 @@ from crczp.sandbox_ansible_app.models import (
     UserAnsibleCleanupStage,
 )
 from crczp.sandbox_common_lib import exceptions, utils
-from crczp.sandbox_definition_app.lib import definitions
+from crczp.sandbox_instance_app.lib import definition_snapshots, sandboxes
 from crczp.sandbox_instance_app.lib.jump_proxy_cleanup import delete_jump_ssh_key
 from crczp.sandbox_instance_app.models import (
     AllocationRQJob,
@@ -260,9 +260,7 @@ class AllocationStackStageHandler(StackStageHandler):
         """
         allocation_unit = self.stage.allocation_request.allocation_unit
         stack_name = allocation_unit.get_stack_name()
-        pool = allocation_unit.pool
-        definition = pool.definition
-        top_def = definitions.get_definition(definition.url, pool.rev_sha, settings.CRCZP_CONFIG)
+        top_def = definition_snapshots.get_definition(allocation_unit.pool)
         try:
             self.process = self._client.create_stack(
                 top_def,
@@ -284,6 +282,22 @@ class AllocationStackStageHandler(StackStageHandler):
                 self.process.terminate()
             super()._delete_stack(allocation_unit, log_output=False)
             raise StackCreationFailed(f'Sandbox build failed: {exc}') from exc
+        self._save_topology_snapshot(allocation_unit)
+
+    @staticmethod
+    def _save_topology_snapshot(allocation_unit: SandboxAllocationUnit) -> None:
+        """
+        Store the enriched topology instance of the created stack in the DB.
+        On failure, it is created on the first access to the sandbox topology instead.
+        """
+        if not hasattr(allocation_unit, 'sandbox'):
+            return
+        try:
+            sandboxes.refresh_topology_instance(allocation_unit.sandbox)
+        except (CrczpException, exceptions.ApiException) as exc:
+            LOG.warning(
+                'Topology snapshot was not saved', allocation_unit=allocation_unit.id, exc=exc
+            )
 
     @override
     def _cancel(self) -> None:
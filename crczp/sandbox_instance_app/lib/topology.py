@@ -4,7 +4,8 @@ from typing import Any
 
 import structlog
 
-from crczp.sandbox_common_lib.common_cloud import list_images
+from crczp.sandbox_common_lib import common_cloud
+from crczp.sandbox_common_lib.topology_graph import TopologyGraph, get_topology_graph
 from crczp.sandbox_instance_app.lib.nodes import find_image_for_node, get_node_image_has_gui_access
 
 LOG = structlog.getLogger()
@@ -89,54 +90,56 @@ class Topology:  # pylint: disable=too-few-public-methods
 
         :param TopologyInstance top_inst: The topology instance to build from
         """
-        images = list_images()
-        subnets_dict = self._create_subnets_with_hosts(top_inst, images)
-        self._create_routers_with_subnets(top_inst, images, subnets_dict)
+        images = common_cloud.get_image_catalog()
+        graph = get_topology_graph(top_inst)
+        subnets_dict = self._create_subnets_with_hosts(graph, images)
+        self._create_routers_with_subnets(graph, images, subnets_dict)
 
     def _create_subnets_with_hosts(
-        self, top_inst: Any, images: Any
+        self, graph: TopologyGraph, images: Any
     ) -> dict[str, 'Topology.Subnet']:
         """
         Create all subnets and populate them with hosts.
 
-        :param TopologyInstance top_inst: The topology instance
-        :param images: List of available images
-        :type images: list
+        :param TopologyGraph graph: The graph of the topology instance
+        :param images: Catalog of available images
+        :type images: ImageCatalog
         :return: Dictionary mapping subnet names to subnet objects
         :rtype: dict[str, Topology.Subnet]
         """
         subnets_dict = {}
 
-        for network in top_inst.get_visible_networks():
+        for network in graph.get_visible_networks():
             if self._is_wan_network(network):
                 continue
 
-            hosts_in_network = self._get_hosts_for_network(network, top_inst, images)
+            hosts_in_network = self._get_hosts_for_network(network, graph, images)
             subnet = self.Subnet(name=network.name, cidr=network.cidr, hosts=hosts_in_network)
             subnets_dict[network.name] = subnet
 
         return subnets_dict
 
     def _create_routers_with_subnets(
-        self, top_inst: Any, images: Any, subnets_dict: dict[str, 'Topology.Subnet']
+        self, graph: TopologyGraph, images: Any, subnets_dict: dict[str, 'Topology.Subnet']
     ) -> None:
         """
         Create routers and assign their connected subnets.
 
-        :param TopologyInstance top_inst: The topology instance
-        :param images: List of available images
-        :type images: list
+        :param TopologyGraph graph: The graph of the topology instance
+        :param images: Catalog of available images
+        :type images: ImageCatalog
         :param subnets_dict: Dictionary mapping subnet names to subnet objects
         :type subnets_dict: dict[str, Topology.Subnet]
         """
+        top_inst = graph.topology_instance
         for router_node in top_inst.get_visible_routers():
             router_image = find_image_for_node(router_node, images)
             if router_image is None:
                 continue
 
-            router_subnets = self._get_subnets_for_router(router_node, top_inst, subnets_dict)
+            router_subnets = self._get_subnets_for_router(router_node, graph, subnets_dict)
 
-            wan_link = top_inst.get_link_between_node_and_network(router_node, top_inst.wan)
+            wan_link = graph.get_link_between_node_and_network(router_node, top_inst.wan)
             wan_ip = wan_link.ip if wan_link else None
 
             router = self.RouterNode(
@@ -160,21 +163,21 @@ class Topology:  # pylint: disable=too-few-public-methods
         return network.name.lower() == 'wan'  # type: ignore[no-any-return]
 
     def _get_hosts_for_network(
-        self, network: Any, top_inst: Any, images: Any
+        self, network: Any, graph: TopologyGraph, images: Any
     ) -> list['Topology.HostNode']:
         """
-        Get all hosts connected to a specific network.
+        Get all visible hosts connected to a specific network.
 
         :param network: The network object
-        :param TopologyInstance top_inst: The topology instance
-        :param images: List of available images
-        :type images: list
+        :param TopologyGraph graph: The graph of the topology instance
+        :param images: Catalog of available images
+        :type images: ImageCatalog
         :return: List of host nodes in the network
         :rtype: list[Topology.HostNode]
         """
         hosts_in_network = []
 
-        for link in top_inst.get_network_links(network, top_inst.get_visible_hosts()):
+        for link in graph.get_network_host_links(network, visible_only=True):
             host_node = link.node
             host_image = find_image_for_node(host_node, images)
 
@@ -193,13 +196,13 @@ class Topology:  # pylint: disable=too-few-public-methods
         return hosts_in_network
 
     def _get_subnets_for_router(
-        self, router_node: Any, top_inst: Any, subnets_dict: dict[str, 'Topology.Subnet']
+        self, router_node: Any, graph: TopologyGraph, subnets_dict: dict[str, 'Topology.Subnet']
     ) -> list['Topology.Subnet']:
         """
         Get all subnets connected to a specific router.
 
         :param router_node: The router node object
-        :param TopologyInstance top_inst: The topology instance
+        :param TopologyGraph graph: The graph of the topology instance
         :param subnets_dict: Dictionary mapping subnet names to subnet objects
         :type subnets_dict: dict[str, Topology.Subnet]
         :return: List of subnets connected to the router
@@ -207,12 +210,12 @@ class Topology:  # pylint: disable=too-few-public-methods
         """
         router_subnets = []
 
-        for link in top_inst.get_node_links(router_node, top_inst.get_hosts_networks()):
-            if self._is_wan_network(link.network):
+        for network in graph.get_router_networks(router_node):
+            if self._is_wan_network(network):
                 continue
 
-            if link.network.name in subnets_dict:
-                router_subnets.append(subnets_dict[link.network.name])
+            if network.name in subnets_dict:
+                router_subnets.append(subnets_dict[network.name])
 
         return router_subnets
 
@@ -0,0 +1,362 @@
+"""
+Two-tier cache of sandbox topology instances.
+
+The first tier is a size-bounded LRU kept in the memory of each process, the second one
+is the shared (Redis) Django cache. Deletions are broadcast over Redis pub/sub, so every
+process evicts its local copy when a sandbox entry is invalidated.
+
+The local tier returns the same object to every caller of the process, callers must not
+mutate the returned topology instances.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import django_rq
+import redis
+import structlog
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import BaseCache
+
+LOG = structlog.get_logger()
+
+INVALIDATION_CHANNEL = 'sandbox-service:topology-cache:invalidate'
+LISTENER_POLL_TIMEOUT = 1.0
+LISTENER_RECONNECT_DELAY = 5.0
+LOCAL_TIER = 'local'
+SHARED_TIER = 'shared'
+
+_MISSING = object()
+
+
+class LocalLRUCache:
+    """
+    Thread-safe, size-bounded LRU mapping with expiring entries.
+
+    Each key has an invalidation generation, advanced when the key is deleted. A value
+    read from elsewhere is stored only if the generation of its key recorded before
+    the read is still current, so a value invalidated meanwhile is not stored.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Generations of the deleted keys, reset (advancing the epoch) when it grows too big.
+        self._generations: dict[str, int] = {}
+        self._epoch = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value of the key and mark it as the most recently used."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def generation(self, key: str) -> tuple[int, int]:
+        """Return the invalidation generation of the key, see set."""
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        timeout: float | None = None,
+        generation: tuple[int, int] | None = None,
+    ) -> None:
+        """
+        Store the value, evicting the least recently used entries over the size limit.
+
+        :param key: The key
+        :param value: The value
+        :param timeout: Seconds until the entry expires, None if it does not expire
+        :param generation: Generation of the key recorded before the value was read,
+            the value is not stored if the key has been invalidated since
+        """
+        if self.max_size <= 0:
+            return
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            if generation is not None and generation != (
+                self._epoch,
+                self._generations.get(key, 0),
+            ):
+                return
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Remove the key if present and advance its generation."""
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._generations) >= 4 * self.max_size:
+                self._advance_epoch()
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self) -> None:
+        """Remove all entries and advance the generations of all keys."""
+        with self._lock:
+            self._data.clear()
+            self._advance_epoch()
+
+    def _advance_epoch(self) -> None:
+        self._epoch += 1
+        self._generations.clear()
+
+
+class TierStats:
+    """Hit and miss counters of a single cache tier."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool) -> None:
+        """Count one lookup."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def hit_rate(self) -> float:
+        """Return the ratio of hits to all lookups (0.0 if there were none)."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        """Return the counters as a dictionary."""
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+
+class TopologyInstanceCache:
+    """
+    In-process LRU tier in front of the shared cache, invalidated over Redis pub/sub.
+    Local entries expire with the timeout of the shared entries.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        shared: BaseCache = cache,
+        channel: str = INVALIDATION_CHANNEL,
+    ) -> None:
+        self.local = LocalLRUCache(max_size)
+        self.shared = shared
+        self.channel = channel
+        self.stats = {LOCAL_TIER: TierStats(), SHARED_TIER: TierStats()}
+        self._listener: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._subscribed = threading.Event()
+
+    @property
+    def local_enabled(self) -> bool:
+        """Whether the in-process tier is configured."""
+        return self.local.max_size > 0
+
+    @property
+    def local_active(self) -> bool:
+        """Whether the in-process tier is used, i.e. invalidations can be received."""
+        return self.local_enabled and self._subscribed.is_set()
+
+    def get_or_set(self, key: str, default: Callable[[], Any], timeout: int | None) -> Any:
+        """
+        Return the cached value of the key, computing and storing it on a miss of both tiers.
+
+        :param key: The cache key
+        :param default: Callable producing the value on a miss
+        :param timeout: Timeout of the entries
+        :return: The cached or computed value, shared by the callers, it must not be mutated
+        """
+        if self.local_active:
+            value = self.local.get(key, _MISSING)
+            self.stats[LOCAL_TIER].record(value is not _MISSING)
+            if value is not _MISSING:
+                return value
+        generation = self.local.generation(key)
+
+        value = self.shared.get(key)
+        self.stats[SHARED_TIER].record(value is not None)
+        if value is None:
+            value = default()
+            self.shared.set(key, value, timeout)
+
+        if self.local_active:
+            self.local.set(key, value, timeout, generation)
+        return value
+
+    def get_or_set_many(
+        self,
+        keys: list[str],
+        default: Callable[[list[str]], dict[str, Any]],
+        timeout: int | None,
+    ) -> dict[str, Any]:
+        """
+        Batched variant of get_or_set, reading the shared tier in a single round trip.
+
+        :param keys: The cache keys
+        :param default: Callable producing the values of the keys missed by both tiers
+        :param timeout: Timeout of the entries
+        :return: The cached or computed values by key, shared by the callers,
+            they must not be mutated
+        """
+        values: dict[str, Any] = {}
+        if self.local_active:
+            for key in keys:
+                value = self.local.get(key, _MISSING)
+                self.stats[LOCAL_TIER].record(value is not _MISSING)
+                if value is not _MISSING:
+                    values[key] = value
+
+        missing = [key for key in keys if key not in values]
+        generations = {key: self.local.generation(key) for key in missing}
+        shared = self.shared.get_many(missing) if missing else {}
+        for key in missing:
+            self.stats[SHARED_TIER].record(shared.get(key) is not None)
+        misses = [key for key in missing if shared.get(key) is None]
+        loaded = default(misses) if misses else {}
+        if loaded:
+            self.shared.set_many(loaded, timeout)
+
+        fetched = {**shared, **loaded}
+        if self.local_active:
+            for key, value in fetched.items():
+                self.local.set(key, value, timeout, generations[key])
+        return {**values, **fetched}
+
+    async def aget_or_set(
+        self, key: str, default: Callable[[], Awaitable[Any]], timeout: int | None
+    ) -> Any:
+        """
+        Asynchronous variant of get_or_set. The in-process tier is read without leaving
+        the event loop.
+
+        :param key: The cache key
+        :param default: Coroutine function producing the value on a miss
+        :param timeout: Timeout of the entries
+        :return: The cached or computed value, shared by the callers, it must not be mutated
+        """
+        if self.local_active:
+            value = self.local.get(key, _MISSING)
+            self.stats[LOCAL_TIER].record(value is not _MISSING)
+            if value is not _MISSING:
+                return value
+        generation = self.local.generation(key)
+
+        value = await self.shared.aget(key)
+        self.stats[SHARED_TIER].record(value is not None)
+        if value is None:
+            value = await default()
+            await self.shared.aset(key, value, timeout)
+
+        if self.local_active:
+            self.local.set(key, value, timeout, generation)
+        return value
+
+    def delete(self, key: str) -> None:
+        """Delete the key from both tiers and tell other processes to evict it."""
+        self.local.delete(key)
+        self.shared.delete(key)
+        self.publish_invalidation(key)
+
+    def publish_invalidation(self, key: str) -> None:
+        """Broadcast the invalidation of the key. Failures are logged, not raised."""
+        if not self.local_enabled:
+            return
+        try:
+            django_rq.get_connection().publish(self.channel, key)
+        except redis.RedisError as exc:
+            LOG.warning('Topology cache invalidation was not published', key=key, error=str(exc))
+
+    def get_stats(self) -> dict[str, Any]:
+        """Return hit/miss counters of both tiers and the local tier occupancy."""
+        return {
+            **{tier: stats.as_dict() for tier, stats in self.stats.items()},
+            'local_size': len(self.local),
+            'local_max_size': self.local.max_size,
+        }
+
+    def start_listener(self) -> None:
+        """Start the daemon thread evicting local entries invalidated by other processes."""
+        if not self.local_enabled or (self._listener and self._listener.is_alive()):
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(
+            target=self._listen, name='topology-cache-invalidation', daemon=True
+        )
+        self._listener.start()
+
+    def stop_listener(self) -> None:
+        """Stop the invalidation listener thread."""
+        self._stop.set()
+        if self._listener:
+            self._listener.join(LISTENER_POLL_TIMEOUT * 2)
+        self._listener = None
+
+    def handle_message(self, message: dict[str, Any]) -> None:
+        """Evict the key carried by a pub/sub message."""
+        if message.get('type') != 'message':
+            return
+        key = message['data']
+        self.local.delete(key.decode() if isinstance(key, bytes) else key)
+
+    def _listen(self) -> None:
+        while not self._stop.is_set():
+            try:
+                pubsub = django_rq.get_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Invalidations sent while we were not subscribed are lost.
+                self.local.clear()
+                self._subscribed.set()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=LISTENER_POLL_TIMEOUT)
+                    if message:
+                        self.handle_message(message)
+                pubsub.close()
+            except redis.RedisError as exc:
+                LOG.warning('Topology cache invalidation listener failed', error=str(exc))
+            finally:
+                self._subscribed.clear()
+                self.local.clear()
+            if not self._stop.is_set():
+                self._stop.wait(LISTENER_RECONNECT_DELAY)
+
+
+_topology_cache: TopologyInstanceCache | None = None
+_topology_cache_lock = threading.Lock()
+
+
+def get_topology_cache() -> TopologyInstanceCache:
+    """Return the process-wide topology instance cache, starting its listener on first use."""
+    global _topology_cache  # pylint: disable=global-statement
+    if _topology_cache is None:
+        with _topology_cache_lock:
+            if _topology_cache is None:
+                _topology_cache = TopologyInstanceCache(
+                    settings.CRCZP_CONFIG.redis.topology_local_cache_size
+                )
+                _topology_cache.start_listener()
+    return _topology_cache
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('sandbox_instance_app', '0014_sandboxnetbirdresources'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SandboxTopologySnapshot',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('data', models.BinaryField(help_text='Pickled enriched topology instance.')),
+                (
+                    'updated',
+                    models.DateTimeField(auto_now=True, help_text='Time of the last refresh.'),
+                ),
+                (
+                    'sandbox',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='topology_snapshot',
+                        to='sandbox_instance_app.sandbox',
+                    ),
+                ),
+            ],
+        ),
+    ]
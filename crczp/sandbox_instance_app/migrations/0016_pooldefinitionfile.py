@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('sandbox_definition_app', '0004_definitionfile'),
+        ('sandbox_instance_app', '0015_sandboxtopologysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PoolDefinitionFile',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                (
+                    'path',
+                    models.CharField(
+                        help_text='Path of the file in the repository.', max_length=255
+                    ),
+                ),
+                (
+                    'file',
+                    models.ForeignKey(
+                        help_text='Content of the file, null if the file does not exist.',
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to='sandbox_definition_app.definitionfile',
+                    ),
+                ),
+                (
+                    'pool',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='definition_files',
+                        to='sandbox_instance_app.pool',
+                    ),
+                ),
+            ],
+            options={
+                'unique_together': {('pool', 'path')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('sandbox_instance_app', '0016_pooldefinitionfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceReservation',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('vcpu', models.PositiveIntegerField(help_text='Reserved virtual CPUs.')),
+                ('ram', models.FloatField(help_text='Reserved RAM.')),
+                ('instances', models.PositiveIntegerField(help_text='Reserved instances.')),
+                ('network', models.PositiveIntegerField(help_text='Reserved networks.')),
+                ('subnet', models.PositiveIntegerField(help_text='Reserved subnets.')),
+                ('port', models.PositiveIntegerField(help_text='Reserved ports.')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    'allocation_unit',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='resource_reservation',
+                        to='sandbox_instance_app.sandboxallocationunit',
+                    ),
+                ),
+            ],
+        ),
+    ]
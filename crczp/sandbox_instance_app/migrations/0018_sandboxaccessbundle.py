@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('sandbox_instance_app', '0017_resourcereservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SandboxAccessBundle',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                (
+                    'etag',
+                    models.CharField(help_text='Digest of the bundle content.', max_length=64),
+                ),
+                ('topology', models.JSONField(help_text='Serialized topology visualization.')),
+                ('user_ssh_config', models.TextField(help_text='User SSH config.')),
+                ('management_ssh_config', models.TextField(help_text='Management SSH config.')),
+                (
+                    'user_ssh_access',
+                    models.BinaryField(help_text='Zip of the user SSH config and keys.'),
+                ),
+                (
+                    'node_access_data',
+                    models.JSONField(help_text='Serialized access data by node name.'),
+                ),
+                (
+                    'created',
+                    models.DateTimeField(auto_now_add=True, help_text='Time of the build.'),
+                ),
+                (
+                    'sandbox',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='access_bundle',
+                        to='sandbox_instance_app.sandbox',
+                    ),
+                ),
+            ],
+        ),
+    ]
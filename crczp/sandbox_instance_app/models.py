@@ -10,7 +10,7 @@ from django.db import models, transaction
 from django.utils import timezone
 
 from crczp.sandbox_common_lib import utils
-from crczp.sandbox_definition_app.models import Definition
+from crczp.sandbox_definition_app.models import Definition, DefinitionFile
 from crczp.sandbox_instance_app.lib.email_notifications import send_email, validate_emails_enabled
 
 DEFAULT_SANDBOX_UUID = '1'
@@ -85,6 +85,32 @@ class Pool(models.Model):
         return self.get_keypair_name() + '-cert'
 
 
+class PoolDefinitionFile(models.Model):
+    """A file of the sandbox definition pinned when the pool was created."""
+
+    pool = models.ForeignKey(
+        Pool,
+        on_delete=models.CASCADE,
+        related_name='definition_files',
+    )
+    path = models.CharField(max_length=255, help_text='Path of the file in the repository.')
+    file = models.ForeignKey(
+        DefinitionFile,
+        on_delete=models.PROTECT,
+        null=True,
+        help_text='Content of the file, null if the file does not exist.',
+    )
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """Meta options for PoolDefinitionFile model."""
+
+        unique_together = [('pool', 'path')]
+
+    @override
+    def __str__(self) -> str:
+        return f'POOL: {self.pool_id}, PATH: {self.path}, FILE: {self.file_id}'
+
+
 class SandboxAllocationUnit(models.Model):
     """Represents a single sandbox allocation unit within a pool."""
 
@@ -108,6 +134,32 @@ class SandboxAllocationUnit(models.Model):
         return f'{self.pool.get_pool_prefix()}-s{self.id:010d}'
 
 
+class ResourceReservation(models.Model):
+    """
+    Cloud resources reserved for the stack of an allocation unit.
+
+    Created together with the allocation request and released (deleted) with the allocation
+    unit once its cleanup finishes, so the ledger also covers stacks that are still being built.
+    """
+
+    allocation_unit = models.OneToOneField(
+        SandboxAllocationUnit,
+        on_delete=models.CASCADE,
+        related_name='resource_reservation',
+    )
+    vcpu = models.PositiveIntegerField(help_text='Reserved virtual CPUs.')
+    ram = models.FloatField(help_text='Reserved RAM.')
+    instances = models.PositiveIntegerField(help_text='Reserved instances.')
+    network = models.PositiveIntegerField(help_text='Reserved networks.')
+    subnet = models.PositiveIntegerField(help_text='Reserved subnets.')
+    port = models.PositiveIntegerField(help_text='Reserved ports.')
+    created = models.DateTimeField(default=timezone.now)
+
+    @override
+    def __str__(self) -> str:
+        return f'ALLOCATION_UNIT: {self.allocation_unit_id}, VCPU: {self.vcpu}, RAM: {self.ram}'
+
+
 class Sandbox(models.Model):
     """Represents an allocated sandbox with user access keys."""
 
@@ -159,6 +211,52 @@ class SandboxLock(models.Model):
         return f'ID: {self.id}, Sandbox: {self.sandbox.id}'
 
 
+class SandboxTopologySnapshot(models.Model):
+    """
+    Durable copy of the enriched topology instance of a sandbox.
+
+    Written once the stack is created, so that losing the Redis cache does not
+    require a cloud round-trip for every sandbox.
+    """
+
+    sandbox = models.OneToOneField(
+        Sandbox,
+        on_delete=models.CASCADE,
+        related_name='topology_snapshot',
+    )
+    data = models.BinaryField(help_text='Pickled enriched topology instance.')
+    updated = models.DateTimeField(auto_now=True, help_text='Time of the last refresh.')
+
+    @override
+    def __str__(self) -> str:
+        return f'Sandbox: {self.sandbox_id}, UPDATED: {self.updated}'
+
+
+class SandboxAccessBundle(models.Model):
+    """
+    Access data of a ready sandbox served to its users, built once from its topology instance.
+
+    Deleted with the sandbox, i.e. when the sandbox is cleaned up or its allocation restarted.
+    """
+
+    sandbox = models.OneToOneField(
+        Sandbox,
+        on_delete=models.CASCADE,
+        related_name='access_bundle',
+    )
+    etag = models.CharField(max_length=64, help_text='Digest of the bundle content.')
+    topology = models.JSONField(help_text='Serialized topology visualization.')
+    user_ssh_config = models.TextField(help_text='User SSH config.')
+    management_ssh_config = models.TextField(help_text='Management SSH config.')
+    user_ssh_access = models.BinaryField(help_text='Zip of the user SSH config and keys.')
+    node_access_data = models.JSONField(help_text='Serialized access data by node name.')
+    created = models.DateTimeField(auto_now_add=True, help_text='Time of the build.')
+
+    @override
+    def __str__(self) -> str:
+        return f'Sandbox: {self.sandbox_id}, ETAG: {self.etag}'
+
+
 class PoolLock(models.Model):
     """Represents a lock on a pool used during active training sessions."""
 
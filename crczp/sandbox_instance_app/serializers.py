@@ -468,6 +468,27 @@ class HardwareUsageSerializer(serializers.Serializer[Any]):
     port = serializers.DecimalField(decimal_places=3, max_digits=7)
 
 
+class AvailableResourcesSerializer(serializers.Serializer[Any]):
+    """Serializer for resources available in the cloud project, null if unlimited."""
+
+    vcpu = serializers.FloatField(allow_null=True)
+    ram = serializers.FloatField(allow_null=True)
+    instances = serializers.FloatField(allow_null=True)
+    network = serializers.FloatField(allow_null=True)
+    subnet = serializers.FloatField(allow_null=True)
+    port = serializers.FloatField(allow_null=True)
+
+
+class CapacityProjectionSerializer(serializers.Serializer[Any]):
+    """Serializer for the projection of how many more sandboxes can be built."""
+
+    sandboxes = serializers.IntegerField(
+        allow_null=True, help_text='Number of sandboxes that fit, null if there is no limit.'
+    )
+    hardware_usage = HardwareUsageSerializer(help_text='Hardware usage of a single sandbox.')
+    available = AvailableResourcesSerializer()
+
+
 class ProtocolSerializer(serializers.Serializer[Any]):
     """Serializer for a network protocol with port."""
 
@@ -23,6 +23,7 @@ from crczp.sandbox_ansible_app.models import (
     UserAnsibleAllocationStage,
     UserAnsibleCleanupStage,
 )
+from crczp.sandbox_common_lib import common_cloud
 from crczp.sandbox_definition_app.lib.definitions import load_docker_containers
 from crczp.sandbox_definition_app.models import Definition
 from crczp.sandbox_instance_app.lib import pools
@@ -85,6 +86,7 @@ def get_terraform_client(mocker, image, flavor_dict):
     mock_client.list_images.return_value = [image]
 
     mocker.patch('crczp.sandbox_common_lib.utils.get_terraform_client', return_value=mock_client)
+    common_cloud.clear_catalog()
     return mock_client
 
 
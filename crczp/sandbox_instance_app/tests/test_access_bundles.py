@@ -0,0 +1,90 @@
+"""Tests for the access bundles of sandboxes."""
+
+import zipfile
+from io import BytesIO
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from crczp.sandbox_instance_app.lib import access_bundles, request_handlers
+from crczp.sandbox_instance_app.models import SandboxAccessBundle
+
+pytestmark = pytest.mark.django_db
+
+
+class TestAccessBundles:
+    """Tests for building, caching and serving the access bundles."""
+
+    @pytest.fixture(autouse=True)
+    def set_up(self, mocker, top_ins, get_terraform_client):
+        """Clear the shared cache and mock the topology instance of the sandbox."""
+        cache.clear()
+        self.mock_get_top_ins = mocker.patch(
+            'crczp.sandbox_instance_app.lib.sandboxes.get_topology_instance',
+            return_value=top_ins,
+        )
+        self.client = get_terraform_client
+        yield
+        cache.clear()
+
+    def test_build(self, sandbox, top_ins):
+        """Test that the bundle contains all access data of the sandbox."""
+        bundle = access_bundles.build(sandbox)
+
+        assert bundle.topology['routers']
+        assert 'Host ' in bundle.user_ssh_config
+        assert 'Host ' in bundle.management_ssh_config
+        with zipfile.ZipFile(BytesIO(bundle.user_ssh_access)) as zip_file:
+            assert sandbox.private_user_key in [
+                zip_file.read(name).decode() for name in zip_file.namelist()
+            ]
+        assert set(bundle.node_access_data) == {node.name for node in top_ins.get_nodes()}
+        assert SandboxAccessBundle.objects.get(sandbox=sandbox).etag == bundle.etag
+
+    def test_get_is_cached(self, sandbox):
+        """Test that the bundle is built once and then served from the cache."""
+        first = access_bundles.get(sandbox)
+        second = access_bundles.get(sandbox)
+
+        assert first == second
+        self.mock_get_top_ins.assert_called_once()
+
+    def test_built_when_ready(self, sandbox, mocker):
+        """Test that the bundle is built when the sandbox becomes ready."""
+        mocker.patch('crczp.sandbox_instance_app.lib.sandboxes.prefetch_console_urls')
+        sandbox.ready = False
+
+        request_handlers.AllocationRequestHandler._mark_sandbox_as_ready(sandbox)  # pylint: disable=protected-access
+
+        assert SandboxAccessBundle.objects.filter(sandbox=sandbox).exists()
+
+    def test_rebuild_changes_etag(self, sandbox):
+        """Test that a rebuilt bundle of changed content replaces the cached one."""
+        etag = access_bundles.get(sandbox).etag
+        sandbox.public_user_key = 'new-public-key'
+
+        access_bundles.build(sandbox)
+
+        assert access_bundles.get(sandbox).etag != etag
+
+    @pytest.mark.parametrize(
+        'url_name, kwargs',
+        [
+            ('sandbox-topology', {}),
+            ('sandbox-user-ssh-access', {}),
+            ('topology-node-connection-data', {'node_name': 'man'}),
+        ],
+    )
+    def test_conditional_requests(self, client, sandbox, url_name, kwargs):
+        """Test that the responses are tagged and not sent again to clients that have them."""
+        url = reverse(url_name, kwargs={'sandbox_uuid': sandbox.id, **kwargs})
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response['ETag'] == f'"{access_bundles.get(sandbox).etag}"'
+
+        response = client.get(url, headers={'If-None-Match': response['ETag']})
+        assert response.status_code == 304
+        assert not response.content
+        self.mock_get_top_ins.assert_called_once()
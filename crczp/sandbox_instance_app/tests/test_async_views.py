@@ -0,0 +1,174 @@
+"""Tests for the sandbox endpoints served asynchronously."""
+
+import asyncio
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework.response import Response
+
+from crczp.sandbox_instance_app.lib import sandboxes
+
+pytestmark = pytest.mark.django_db
+
+SANDBOX_UUID = '1'
+
+
+@async_to_sync
+async def get_all(*urls):
+    """Request the URLs concurrently through the ASGI handler, return the responses."""
+    client = AsyncClient()
+    return await asyncio.gather(*(client.get(url) for url in urls))
+
+
+@async_to_sync
+async def get_all_timed(*urls):
+    """
+    Request the URLs concurrently through the ASGI handler served by the ASGI server,
+    return the status codes and the seconds until each response started.
+    """
+    handler = ASGIHandler()
+    start = time.monotonic()
+
+    async def get(url):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': url,
+            'query_string': b'',
+            'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 1024),
+            'server': ('localhost', 80),
+        }
+        communicator = ApplicationCommunicator(handler, scope)
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        response_start = await communicator.receive_output(10)
+        elapsed = time.monotonic() - start
+        await communicator.wait(10)
+        return response_start['status'], elapsed
+
+    return await asyncio.gather(*(get(url) for url in urls))
+
+
+class TestAsyncSandboxViews:
+    """Tests for the topology, console and VM endpoints served over ASGI."""
+
+    @pytest.fixture(autouse=True)
+    def set_up(self, mocker, top_ins, get_terraform_client):
+        """Clear the shared cache and mock the git fetch, the terraform client and RQ."""
+        cache.clear()
+        self.mock_get_definition = mocker.patch(
+            'crczp.sandbox_instance_app.lib.sandboxes.get_topology_definition_and_containers',
+            return_value=(mocker.Mock(), mocker.Mock()),
+        )
+        self.client = get_terraform_client
+        self.client.get_enriched_topology_instance.return_value = top_ins
+        self.mock_enqueue = mocker.patch('crczp.sandbox_instance_app.lib.nodes.django_rq.enqueue')
+        yield
+        cache.clear()
+
+    def test_topology(self):
+        """Test that the topology is served and its instance cached."""
+        url = reverse('sandbox-topology', kwargs={'sandbox_uuid': SANDBOX_UUID})
+
+        first, second = get_all(url, url)
+
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json()
+        assert first.json()['routers']
+        calls = self.mock_get_definition.call_count
+        get_all(url)
+        assert self.mock_get_definition.call_count == calls
+
+    def test_sandbox_not_found(self):
+        """Test that requests of a missing sandbox are answered with 404."""
+        responses = get_all(
+            reverse('sandbox-topology', kwargs={'sandbox_uuid': '-1'}),
+            reverse('consoles', kwargs={'sandbox_uuid': '-1'}),
+            reverse('sandbox-user-ssh-access', kwargs={'sandbox_uuid': '-1'}),
+        )
+
+        assert [response.status_code for response in responses] == [404, 404, 404]
+
+    def test_consoles_are_fetched_in_background(self):
+        """Test that consoles not yet known are fetched by a single RQ job."""
+        url = reverse('consoles', kwargs={'sandbox_uuid': SANDBOX_UUID})
+
+        responses = get_all(url, url, url)
+
+        assert [response.status_code for response in responses] == [202, 202, 202]
+        self.mock_enqueue.assert_called_once()
+        assert sorted(self.mock_enqueue.call_args.args[3]) == sorted(
+            sandboxes.get_console_node_names(sandboxes.get_sandbox(SANDBOX_UUID))
+        )
+
+    def test_node_connection_data(self, top_ins):
+        """Test that the connection data of a node are served."""
+        node = next(iter(top_ins.get_hosts()))
+        url = reverse(
+            'topology-node-connection-data',
+            kwargs={'sandbox_uuid': SANDBOX_UUID, 'node_name': node.name},
+        )
+        missing = reverse(
+            'topology-node-connection-data',
+            kwargs={'sandbox_uuid': SANDBOX_UUID, 'node_name': 'missing'},
+        )
+
+        found, not_found = get_all(url, missing)
+
+        assert found.status_code == 200
+        assert not_found.status_code == 404
+
+    def test_vm_requests_are_concurrent(self, mocker):
+        """Test that slow cloud calls of concurrent requests overlap."""
+        delay, count = 0.2, 8
+
+        def get_node(*_args):
+            time.sleep(delay)
+            return mocker.MagicMock()
+
+        mocker.patch('crczp.sandbox_instance_app.views.nodes.get_node', side_effect=get_node)
+        mocker.patch(
+            'crczp.sandbox_instance_app.views.serializers.NodeSerializer',
+            return_value=mocker.Mock(data={}),
+        )
+        url = reverse('sandbox-vm-detail', kwargs={'sandbox_uuid': SANDBOX_UUID, 'vm_name': 'vm'})
+
+        start = time.monotonic()
+        responses = get_all(*[url] * count)
+
+        assert {response.status_code for response in responses} == {200}
+        assert time.monotonic() - start < delay * count / 2
+
+    def test_async_views_overlap_slow_sync_view(self, mocker):
+        """Test that the async endpoints are served while a slow sync view is in flight."""
+        delay = 1
+
+        def list_pools(*_args, **_kwargs):
+            time.sleep(delay)
+            return Response([])
+
+        mocker.patch(
+            'crczp.sandbox_instance_app.views.PoolListCreateView.list', side_effect=list_pools
+        )
+        mocker.patch('crczp.sandbox_instance_app.views.nodes.get_node')
+        mocker.patch(
+            'crczp.sandbox_instance_app.views.serializers.NodeSerializer',
+            return_value=mocker.Mock(data={}),
+        )
+        vm = reverse('sandbox-vm-detail', kwargs={'sandbox_uuid': SANDBOX_UUID, 'vm_name': 'vm'})
+
+        (slow, slow_elapsed), *responses = get_all_timed(reverse('pool-list'), *[vm] * 4)
+
+        assert slow == 200
+        assert slow_elapsed >= delay
+        assert {status for status, _ in responses} == {200}
+        assert max(elapsed for _, elapsed in responses) < delay / 2
@@ -0,0 +1,145 @@
+"""Tests for the pinned definition snapshots of pools."""
+
+import pytest
+from django.core.cache import caches
+
+from crczp.sandbox_common_lib import exceptions
+from crczp.sandbox_definition_app.lib import definitions
+from crczp.sandbox_definition_app.models import DefinitionFile
+from crczp.sandbox_instance_app.lib import definition_snapshots
+from crczp.sandbox_instance_app.models import PoolDefinitionFile
+from crczp.sandbox_instance_app.tests.conftest import TESTING_DEFINITION, data_path_join
+
+pytestmark = pytest.mark.django_db
+
+VARIABLES = """
+username:
+  type: username
+"""
+DOCKERFILE = 'FROM debian\n'
+
+
+@pytest.fixture
+def topology_file() -> str:
+    """Content of topology.yml of the definition repository."""
+    with open(data_path_join(TESTING_DEFINITION), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def provider(mocker, topology_file, containers):
+    """Definition provider serving a repository with topology, containers and a Dockerfile."""
+    repository = {
+        definitions.SANDBOX_DEFINITION_FILENAME: topology_file,
+        definitions.DOCKER_CONTAINERS_FILENAME: containers,
+        'docker2/Dockerfile': DOCKERFILE,
+    }
+
+    def get_file(path, _rev):
+        if path not in repository:
+            raise exceptions.GitError(f'File {path} not found.')
+        return repository[path]
+
+    mock_provider = mocker.MagicMock()
+    mock_provider.get_file.side_effect = get_file
+    mocker.patch(
+        'crczp.sandbox_definition_app.lib.definitions.get_def_provider',
+        return_value=mock_provider,
+    )
+    caches['topology_cache'].clear()
+    return mock_provider
+
+
+class TestCreateSnapshot:
+    """Tests for pinning the definition files of a pool."""
+
+    def test_create_snapshot_pins_files(self, pool, provider, topology_file):
+        """Test that present files are stored and absent optional files are pinned as null."""
+        definition_snapshots.create_snapshot(pool)
+
+        pinned = {f.path: f.file for f in PoolDefinitionFile.objects.filter(pool=pool)}
+        assert pinned[definitions.SANDBOX_DEFINITION_FILENAME].content == topology_file
+        assert pinned['docker2/Dockerfile'].content == DOCKERFILE
+        assert pinned[definitions.VARIABLES_FILENAME] is None
+        assert provider.get_file.call_count == 4
+
+    def test_identical_files_are_stored_once(self, pool, provider, definition, created_by):
+        """Test that pools of the same revision share the stored file contents."""
+        other_pool = type(pool).objects.create(
+            definition=definition,
+            max_size=1,
+            private_management_key='key',
+            public_management_key='key',
+            uuid='1fb3160d',
+            created_by=created_by,
+        )
+
+        definition_snapshots.create_snapshot(pool)
+        definition_snapshots.create_snapshot(other_pool)
+
+        assert DefinitionFile.objects.count() == 3
+        assert PoolDefinitionFile.objects.filter(pool=other_pool).count() == 4
+
+    def test_missing_topology_raises(self, pool, provider):
+        """Test that a revision without topology.yml cannot be pinned."""
+        provider.get_file.side_effect = exceptions.GitError('not found')
+
+        with pytest.raises(exceptions.GitError):
+            definition_snapshots.create_snapshot(pool)
+        assert not PoolDefinitionFile.objects.filter(pool=pool).exists()
+
+
+class TestReadSnapshot:
+    """Tests for reading the pinned definition files."""
+
+    def test_readers_do_not_use_provider(self, pool, provider):
+        """Test that pinned files are served from the database."""
+        definition_snapshots.create_snapshot(pool)
+        provider.get_file.reset_mock()
+
+        assert definition_snapshots.get_definition(pool).name
+        assert len(definition_snapshots.get_containers(pool).containers) == 2
+        assert definition_snapshots.get_dockerfile(pool, 'docker2/') == DOCKERFILE
+        provider.get_file.assert_not_called()
+
+    def test_absent_optional_files(self, pool, provider):
+        """Test the readers of files the revision does not contain."""
+        definition_snapshots.create_snapshot(pool)
+
+        with pytest.raises(exceptions.GitError):
+            definition_snapshots.get_variables(pool)
+        with pytest.raises(exceptions.GitError):
+            definition_snapshots.get_dockerfile(pool, 'unknown/')
+
+    def test_variables(self, pool, provider, mocker):
+        """Test that the pinned variables are parsed."""
+        provider.get_file.side_effect = None
+        provider.get_file.return_value = VARIABLES
+        mocker.patch(
+            'crczp.sandbox_definition_app.lib.definitions.load_docker_containers',
+            return_value=mocker.MagicMock(containers=[]),
+        )
+        definition_snapshots.create_snapshot(pool)
+
+        variables = definition_snapshots.get_variables(pool)
+
+        assert [variable.name for variable in variables] == ['username']
+
+    def test_legacy_pool_is_pinned_on_first_access(self, pool, provider):
+        """Test that a pool without a snapshot is pinned when it is read."""
+        assert definition_snapshots.get_definition(pool).name
+        assert PoolDefinitionFile.objects.filter(pool=pool).count() == 4
+
+
+class TestDeleteUnusedFiles:
+    """Tests for removing file contents no pool refers to."""
+
+    def test_delete_unused_files(self, pool, provider):
+        """Test that only unreferenced contents are deleted."""
+        definition_snapshots.create_snapshot(pool)
+        orphan = definitions.store_file('orphan')
+
+        definitions.delete_unused_files()
+
+        assert not DefinitionFile.objects.filter(digest=orphan.digest).exists()
+        assert DefinitionFile.objects.count() == 3
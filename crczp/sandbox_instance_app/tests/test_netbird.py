@@ -10,6 +10,7 @@ from types import SimpleNamespace
 from unittest.mock import MagicMock, call
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import AnonymousUser
 from rest_framework.response import Response
 from rest_framework.test import APIRequestFactory
@@ -149,7 +150,7 @@ class TestGetVpnEntrypoints:
         """Entrypoints declared on the definition's vpn block are returned."""
         ep = FakeEntrypoint('server', ['10.0.0.0/24'])
         mocker.patch(
-            f'{NETBIRD_MODULE}.definitions.get_definition',
+            f'{NETBIRD_MODULE}.definition_snapshots.get_definition',
             return_value=SimpleNamespace(vpn=SimpleNamespace(entrypoints=[ep])),
         )
         assert netbird._get_vpn_entrypoints(sandbox) == [ep]
@@ -157,7 +158,7 @@ class TestGetVpnEntrypoints:
     def test_returns_empty_when_vpn_none(self, mocker, sandbox):
         """A null vpn attribute yields an empty list."""
         mocker.patch(
-            f'{NETBIRD_MODULE}.definitions.get_definition',
+            f'{NETBIRD_MODULE}.definition_snapshots.get_definition',
             return_value=SimpleNamespace(vpn=None),
         )
         assert netbird._get_vpn_entrypoints(sandbox) == []
@@ -165,7 +166,7 @@ class TestGetVpnEntrypoints:
     def test_returns_empty_when_entrypoints_none(self, mocker, sandbox):
         """A vpn block with a null entrypoints attribute yields an empty list."""
         mocker.patch(
-            f'{NETBIRD_MODULE}.definitions.get_definition',
+            f'{NETBIRD_MODULE}.definition_snapshots.get_definition',
             return_value=SimpleNamespace(vpn=SimpleNamespace(entrypoints=None)),
         )
         assert netbird._get_vpn_entrypoints(sandbox) == []
@@ -173,7 +174,7 @@ class TestGetVpnEntrypoints:
     def test_returns_empty_when_attribute_missing(self, mocker, sandbox):
         """A definition without a vpn attribute yields an empty list."""
         mocker.patch(
-            f'{NETBIRD_MODULE}.definitions.get_definition',
+            f'{NETBIRD_MODULE}.definition_snapshots.get_definition',
             return_value=SimpleNamespace(),
         )
         assert netbird._get_vpn_entrypoints(sandbox) == []
@@ -186,7 +187,7 @@ class TestGetVpnDns:
         """The dns block declared on the definition's vpn block is returned."""
         dns = FakeDns(['10.0.0.5'])
         mocker.patch(
-            f'{NETBIRD_MODULE}.definitions.get_definition',
+            f'{NETBIRD_MODULE}.definition_snapshots.get_definition',
             return_value=SimpleNamespace(vpn=SimpleNamespace(dns=dns)),
         )
         assert netbird._get_vpn_dns(sandbox) is dns
@@ -194,7 +195,7 @@ class TestGetVpnDns:
     def test_returns_none_when_vpn_none(self, mocker, sandbox):
         """A null vpn attribute yields None."""
         mocker.patch(
-            f'{NETBIRD_MODULE}.definitions.get_definition',
+            f'{NETBIRD_MODULE}.definition_snapshots.get_definition',
             return_value=SimpleNamespace(vpn=None),
         )
         assert netbird._get_vpn_dns(sandbox) is None
@@ -202,7 +203,7 @@ class TestGetVpnDns:
     def test_returns_none_when_dns_absent(self, mocker, sandbox):
         """A vpn block without a dns attribute yields None."""
         mocker.patch(
-            f'{NETBIRD_MODULE}.definitions.get_definition',
+            f'{NETBIRD_MODULE}.definition_snapshots.get_definition',
             return_value=SimpleNamespace(vpn=SimpleNamespace(dns=None)),
         )
         assert netbird._get_vpn_dns(sandbox) is None
@@ -787,7 +788,9 @@ class TestSandboxVpnView:
         """Patch sandbox lookup and the client management URL for the view."""
         # pylint: disable-next=attribute-defined-outside-init
         self.factory = APIRequestFactory()
-        mocker.patch('crczp.sandbox_instance_app.views.sandboxes.get_sandbox', return_value=sandbox)
+        mocker.patch(
+            'crczp.sandbox_instance_app.views.sandboxes.aget_sandbox', return_value=sandbox
+        )
         mocker.patch(
             'crczp.sandbox_instance_app.views.get_client_management_url',
             return_value='https://client.example.com',
@@ -798,7 +801,7 @@ class TestSandboxVpnView:
         request.user = AnonymousUser()
         view = SandboxVpnView()
         view.kwargs = {'sandbox_uuid': sandbox.id}
-        return view.get(request)
+        return async_to_sync(view.get)(request)
 
     def test_returns_single_key_and_union_of_routes(self, sandbox):
         """The view returns the shared key and the de-duplicated route union."""
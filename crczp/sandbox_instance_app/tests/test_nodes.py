@@ -1,6 +1,9 @@
 """Tests for VM node actions and retrieval."""
 
+import time
+
 import pytest
+from django.core.cache import cache
 
 from crczp.sandbox_common_lib import exceptions
 from crczp.sandbox_instance_app.lib import nodes
@@ -48,3 +51,95 @@ class TestGetNode:  # pylint: disable=too-few-public-methods
         mock_client = mocker.patch('crczp.terraform_driver.CrczpTerraformClient.get_node')
         result = nodes.get_node(mocker.MagicMock(), 'node_name')
         assert result == mock_client.return_value
+
+
+class TestConsoleUrls:
+    """Tests for fetching the console URLs of a sandbox in one job."""
+
+    SANDBOX_ID = 4242
+
+    @pytest.fixture
+    def sandbox(self, mocker):
+        """Return a mocked sandbox and start with no cached consoles."""
+        sandbox = mocker.MagicMock(id=self.SANDBOX_ID)
+        sandbox.allocation_unit.get_stack_name.return_value = 'stack'
+        cache.delete_many([
+            nodes.CACHE_CONSOLES_KEY.format(self.SANDBOX_ID),
+            nodes.CACHE_CONSOLES_JOB_KEY.format(self.SANDBOX_ID),
+        ])
+        return sandbox
+
+    @pytest.fixture
+    def client(self, mocker):
+        """Mock the terraform client returning a console URL per node."""
+        client = mocker.patch('crczp.sandbox_common_lib.utils.get_terraform_client').return_value
+        client.get_console_url.side_effect = lambda stack, node, console_type: f'url-{node}'
+        return client
+
+    @pytest.fixture
+    def enqueue(self, mocker):
+        """Mock enqueueing of the RQ jobs."""
+        return mocker.patch('django_rq.enqueue')
+
+    def test_one_job_per_sandbox(self, sandbox, client, enqueue):
+        """Test that concurrent requests enqueue a single job fetching all nodes."""
+        assert nodes.get_console_urls(sandbox, ['a', 'b', 'c']) is None
+        assert nodes.get_console_urls(sandbox, ['a', 'b', 'c']) is None
+        assert nodes.get_console_url(sandbox, 'a') == ''
+        enqueue.assert_called_once()
+
+        job, *args = enqueue.call_args.args
+        job(*args)
+
+        assert nodes.get_console_urls(sandbox, ['a', 'b', 'c']) == {
+            'a': 'url-a',
+            'b': 'url-b',
+            'c': 'url-c',
+        }
+        assert nodes.get_console_url(sandbox, 'b') == 'url-b'
+        assert client.get_console_url.call_count == 3
+
+    def test_only_missing_nodes_are_fetched(self, sandbox, client, enqueue):
+        """Test that failed and expired nodes are fetched again, valid ones are kept."""
+
+        def get_console_url(stack, node, console_type):
+            if node == 'b':
+                raise ConnectionError()
+            return f'url-{node}'
+
+        client.get_console_url.side_effect = get_console_url
+        nodes.get_console_urls_job(self.SANDBOX_ID, 'stack', ['a', 'b', 'c'])
+        key = nodes.CACHE_CONSOLES_KEY.format(self.SANDBOX_ID)
+        consoles = cache.get(key)
+        cache.set(key, {**consoles, 'c': ('url-c', time.time() - 1)})
+
+        assert nodes.get_console_urls(sandbox, ['a', 'b', 'c']) is None
+
+        enqueue.assert_called_once_with(
+            nodes.get_console_urls_job, self.SANDBOX_ID, 'stack', ['b', 'c']
+        )
+
+    def test_refresh_fetches_expiring_nodes(self, sandbox, client):
+        """Test that the refresh fetches the nodes whose URLs expire within the margin."""
+        key = nodes.CACHE_CONSOLES_KEY.format(self.SANDBOX_ID)
+        cache.set(key, {'a': ('old-a', time.time() + 60), 'b': ('old-b', time.time() + 3600)})
+
+        nodes.refresh_console_urls(sandbox, ['a', 'b', 'c'], valid_for=600)
+
+        assert nodes.get_console_urls(sandbox, ['a', 'b', 'c']) == {
+            'a': 'url-a',
+            'b': 'old-b',
+            'c': 'url-c',
+        }
+        assert client.get_console_url.call_count == 2
+
+    def test_refresh_skipped_while_job_runs(self, sandbox, client):
+        """Test that the refresh does not fetch while the console URLs job of the sandbox runs."""
+        cache.add(nodes.CACHE_CONSOLES_JOB_KEY.format(self.SANDBOX_ID), True)
+
+        assert not nodes.refresh_console_urls(sandbox, ['a'])
+        client.get_console_url.assert_not_called()
+
+        cache.delete(nodes.CACHE_CONSOLES_JOB_KEY.format(self.SANDBOX_ID))
+        assert nodes.refresh_console_urls(sandbox, ['a'])
+        assert cache.get(nodes.CACHE_CONSOLES_JOB_KEY.format(self.SANDBOX_ID)) is None
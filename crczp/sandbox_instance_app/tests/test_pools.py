@@ -1,19 +1,32 @@
 """Tests for sandbox instance pool operations."""
 
+import io
+import pickle  # nosec B403
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from django.http import Http404
+from django.test import AsyncClient
 from rest_framework.exceptions import ValidationError
 from rest_framework.reverse import reverse
 from rest_framework.test import APIRequestFactory
 
-from crczp.cloud_commons import HardwareUsage, exceptions
+from crczp.cloud_commons import HardwareUsage, Quota, QuotaSet
+from crczp.sandbox_common_lib import common_cloud, exceptions
 from crczp.sandbox_common_lib.exceptions import ApiException, StackError
-from crczp.sandbox_instance_app.lib import pools, sshconfig
-from crczp.sandbox_instance_app.models import Sandbox, SandboxAllocationUnit
+from crczp.sandbox_common_lib.tests.topologies import create_topology_instance, measure
+from crczp.sandbox_instance_app.lib import access_bundles, pools, sandboxes, sshconfig
+from crczp.sandbox_instance_app.models import (
+    Pool,
+    Sandbox,
+    SandboxAllocationUnit,
+    SandboxTopologySnapshot,
+)
 from crczp.sandbox_instance_app.views import PoolListCreateView, SandboxGetAndLockView
 
 pytestmark = pytest.mark.django_db
@@ -24,20 +37,28 @@ FULL_POOL_ID = 2
 SANDBOX_UUID = '1'
 
 
+def quota_set(vcpu: float) -> QuotaSet:
+    """Return a quota set limiting only the vCPUs, with nothing in use."""
+    unlimited = Quota(-1, 0)
+    return QuotaSet(Quota(vcpu, 0), unlimited, unlimited, unlimited, unlimited, unlimited)
+
+
 class TestCreatePool:
     """Tests for pool creation."""
 
     MAX_SIZE = 10
 
     @pytest.fixture(autouse=True)
-    def set_up(self, mocker, image):  # pylint: disable=attribute-defined-outside-init
+    def set_up(self, mocker):  # pylint: disable=attribute-defined-outside-init
         """Set up mocks for pool creation tests."""
         self.client = mocker.patch('crczp.sandbox_common_lib.utils.get_terraform_client')
-        mocker.patch('crczp.sandbox_cloud_app.lib.projects.list_images', return_value=[image])
         mocker.patch('crczp.sandbox_definition_app.lib.definitions.get_definition')
         mocker.patch('crczp.sandbox_definition_app.lib.definitions.get_containers')
         mock_repo = mocker.patch('crczp.sandbox_definition_app.lib.definitions.get_def_provider')
         mock_repo.return_value.get_rev_sha = mocker.MagicMock(return_value='sha')
+        self.mock_create_snapshot = mocker.patch(
+            'crczp.sandbox_instance_app.lib.definition_snapshots.create_snapshot'
+        )
         self.arf = APIRequestFactory()
         yield
 
@@ -50,6 +71,7 @@ class TestCreatePool:
         assert pool.max_size == self.MAX_SIZE
         assert pool.rev == definition.rev
         assert pool.definition.id == DEFINITION_ID
+        self.mock_create_snapshot.assert_called_once_with(pool)
 
     def test_create_pool_invalid_definition(self, created_by):
         """Test that pool creation raises Http404 for an invalid definition ID."""
@@ -99,22 +121,33 @@ class TestSandboxAllocationUnit:  # pylint: disable=too-few-public-methods
 class TestCreateSandboxesInPool:
     """Tests for creating sandboxes within a pool."""
 
+    HARDWARE_USAGE = HardwareUsage(vcpu=2, ram=4.0, instances=2, network=1, subnet=1, port=4)
+
     @pytest.fixture(autouse=True)
     def set_up(self, mocker, definition):  # pylint: disable=attribute-defined-outside-init,unused-argument
         """Set up mocks for sandbox creation tests."""
         self.client = mocker.MagicMock()
         mock_get_client = mocker.patch('crczp.sandbox_common_lib.utils.get_terraform_client')
         mock_get_client.return_value = self.client
-        mocker.patch('crczp.sandbox_definition_app.lib.definitions.get_definition')
+        self.client.get_hardware_usage.return_value = self.HARDWARE_USAGE
+        self.client.get_quota_set.return_value = quota_set(vcpu=100)
+        common_cloud.clear_catalog()
+        cache.delete_many([pools.get_cache_key(pool) for pool in Pool.objects.all()])
+        mocker.patch('crczp.sandbox_instance_app.lib.definition_snapshots.get_definition')
         self.fake_create_allocation_requests = mocker.patch(
-            'crczp.sandbox_instance_app.lib.requests.create_allocations_requests'
+            'crczp.sandbox_instance_app.lib.requests.create_allocations_requests',
+            side_effect=lambda pool, count, created_by: [
+                SandboxAllocationUnit.objects.create(pool=pool, created_by=created_by)
+                for _ in range(count)
+            ],
         )
 
     def test_create_sandboxes_in_pool_success_one(self, created_by):
         """Test creating a single sandbox in a pool."""
         pool = pools.get_pool(POOL_ID)
-        pools.create_sandboxes_in_pool(pool, created_by, 1)
+        [unit] = pools.create_sandboxes_in_pool(pool, created_by, 1)
         self.fake_create_allocation_requests.assert_called_once_with(pool, 1, created_by)
+        assert unit.resource_reservation.vcpu == self.HARDWARE_USAGE.vcpu
 
     def test_create_sandboxes_in_pool_success_all(self, created_by):
         """Test filling a pool with sandboxes up to its max size."""
@@ -134,13 +167,23 @@ class TestCreateSandboxesInPool:
 
     def test_create_sandboxes_in_pool_limits_exceeded(self, created_by):
         """Test that sandbox creation fails when hardware limits are exceeded."""
-        self.client.validate_hardware_usage_of_stacks.side_effect = exceptions.StackCreationFailed(
-            'testException'
-        )
+        self.client.get_quota_set.return_value = quota_set(vcpu=3)
         pool = pools.get_pool(POOL_ID)
 
         with pytest.raises(StackError):
-            pools.create_sandboxes_in_pool(pool, created_by)
+            pools.create_sandboxes_in_pool(pool, created_by, 2)
+        self.fake_create_allocation_requests.assert_not_called()
+
+    def test_create_sandboxes_in_pool_counts_reservations(self, created_by):
+        """Test that resources reserved by earlier requests are not available anymore."""
+        self.client.get_quota_set.return_value = quota_set(vcpu=4)
+        pool = pools.get_pool(POOL_ID)
+        pools.create_sandboxes_in_pool(pool, created_by, 1)
+
+        with pytest.raises(StackError):
+            pools.create_sandboxes_in_pool(pool, created_by, 2)
+        pools.create_sandboxes_in_pool(pool, created_by, 1)
+        self.client.validate_hardware_usage_of_stacks.assert_not_called()
 
 
 class TestGetUnlockedSandbox:
@@ -178,27 +221,28 @@ class TestGetUnlockedSandbox:
 class TestGetManagementSSHAccess:
     """Tests for generating management SSH access configuration."""
 
-    mock_get_top_ins = None
-    mock_get_sandboxes_in_pool = None
-
     @pytest.fixture(autouse=True)
-    def set_up(self, mocker, top_ins, sandbox):  # pylint: disable=attribute-defined-outside-init
-        """Set up mocks for management SSH access tests."""
-        self.mock_get_top_ins = mocker.patch(
-            'crczp.sandbox_instance_app.lib.sandboxes.get_topology_instance'
-        )
-        self.mock_get_top_ins.return_value = top_ins
-
-        self.mock_get_sandboxes_in_pool = mocker.patch(
-            'crczp.sandbox_instance_app.lib.pools.get_sandboxes_in_pool'
+    def set_up(self, mocker, top_ins, get_terraform_client):  # pylint: disable=attribute-defined-outside-init
+        """Clear the shared cache and mock the git fetch and the terraform client."""
+        cache.clear()
+        mocker.patch(
+            'crczp.sandbox_instance_app.lib.sandboxes.get_topology_definition_and_containers',
+            return_value=(mocker.Mock(), mocker.Mock()),
         )
-        self.mock_get_sandboxes_in_pool.return_value = [sandbox]
+        get_terraform_client.get_enriched_topology_instance.return_value = top_ins
+        mocker.patch.object(Pool, 'get_pool_prefix', return_value='pool-prefix')
+        self.get_topology_instances = mocker.spy(sandboxes, 'get_topology_instances')
         yield
+        cache.clear()
 
-    def test_get_management_ssh_access_success(self, pool, sandbox, management_ssh_config, mocker):
+    @staticmethod
+    def read_zip(pool):
+        """Return the streamed zip of the pool and the number of its chunks."""
+        chunks = list(pools.get_management_ssh_access(pool))
+        return zipfile.ZipFile(io.BytesIO(b''.join(chunks))), len(chunks)
+
+    def test_get_management_ssh_access_success(self, pool, sandbox, management_ssh_config):
         """Test that management SSH access returns a ZIP file with keys and config."""
-        pool.get_pool_prefix = mocker.MagicMock()
-        pool.get_pool_prefix.return_value = 'pool-prefix'
         ssh_access_name = f'pool-id-{pool.id}'
         ssh_config_name = f'{ssh_access_name}-sandbox-id-{sandbox.id}-management-config'
         private_key = f'{ssh_access_name}-management-key'
@@ -210,9 +254,9 @@ class TestGetManagementSSHAccess:
                 identity_file.replace('<path_to_pool_private_key>', f'~/.ssh/{private_key}'),
             )
 
-        in_memory_zip_file = pools.get_management_ssh_access(pool)
+        zip_file, _ = self.read_zip(pool)
 
-        with zipfile.ZipFile(in_memory_zip_file, 'r', zipfile.ZIP_DEFLATED) as zip_file:
+        with zip_file:
             with zip_file.open(ssh_config_name) as file:
                 assert (
                     sshconfig.CrczpSSHConfig.from_str(file.read().decode('utf-8')).asdict()
@@ -223,6 +267,96 @@ class TestGetManagementSSHAccess:
             with zip_file.open(f'{private_key}.pub') as file:
                 assert file.read().decode('utf-8') == pool.public_management_key
 
+    @staticmethod
+    def create_not_ready_sandboxes(pool, created_by, top_ins, count):
+        """Create sandboxes which are not ready yet and have their topology snapshot."""
+        sandbox_list = [
+            Sandbox.objects.create(
+                id=f'sandbox-{i}',
+                allocation_unit=SandboxAllocationUnit.objects.create(
+                    pool=pool, created_by=created_by
+                ),
+                ready=False,
+            )
+            for i in range(count)
+        ]
+        for other in sandbox_list:
+            SandboxTopologySnapshot.objects.create(sandbox=other, data=pickle.dumps(top_ins))
+        return sandbox_list
+
+    def test_streamed_in_batches(self, mocker, pool, sandbox, created_by, top_ins):
+        """Test that the zip is streamed by batches, using the cached access bundles."""
+        mocker.patch.object(pools, 'MANAGEMENT_SSH_ACCESS_BATCH_SIZE', 2)
+        others = self.create_not_ready_sandboxes(pool, created_by, top_ins, 2)
+        bundle = access_bundles.get(sandbox)
+        self.get_topology_instances.reset_mock()
+
+        zip_file, chunks = self.read_zip(pool)
+
+        with zip_file:
+            assert zip_file.testzip() is None
+            configs = [name for name in zip_file.namelist() if name.endswith('-config')]
+            assert len(configs) == 3
+            assert (
+                zip_file.read(f'pool-id-{pool.id}-sandbox-id-{sandbox.id}-management-config')
+                == bundle.management_ssh_config.encode()
+            )
+        assert chunks == 3
+        rendered = [
+            sb.id for call in self.get_topology_instances.call_args_list for sb in call.args[0]
+        ]
+        assert sorted(rendered) == sorted(other.id for other in others)
+
+    def test_sandbox_without_topology_refused_before_streaming(self, pool, sandbox, created_by):  # pylint: disable=unused-argument
+        """Test that a sandbox with unknown topology fails the call, not the streamed zip."""
+        Sandbox.objects.create(
+            id='sandbox-allocating',
+            allocation_unit=SandboxAllocationUnit.objects.create(pool=pool, created_by=created_by),
+            ready=False,
+        )
+
+        with pytest.raises(exceptions.ValidationError, match='sandbox-allocating'):
+            pools.get_management_ssh_access(pool)
+        self.get_topology_instances.assert_not_called()
+
+    def test_streamed_under_asgi(self, pool, sandbox, created_by, top_ins):
+        """Test that the zip is streamed through an async iterator under ASGI."""
+        self.create_not_ready_sandboxes(pool, created_by, top_ins, 2)
+
+        @async_to_sync
+        async def get_chunks():
+            response = await AsyncClient().get(
+                reverse('pool-management-ssh-access', kwargs={'pool_id': pool.id})
+            )
+            assert response.status_code == 200
+            assert response.is_async
+            return [chunk async for chunk in response.streaming_content]
+
+        with zipfile.ZipFile(io.BytesIO(b''.join(get_chunks()))) as zip_file:
+            assert zip_file.testzip() is None
+            assert len([name for name in zip_file.namelist() if name.endswith('-config')]) == 3
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('routers, hosts_per_router', [(2, 4), (10, 9)])
+def test_management_ssh_configs_rendering(mocker, sandbox, routers, hosts_per_router):
+    """Benchmark rendering the management SSH configs of 20 sandboxes serially and by threads."""
+    mocker.patch.object(Pool, 'get_pool_prefix', return_value='pool-prefix')
+    topology_instances = [create_topology_instance(routers, hosts_per_router) for _ in range(20)]
+
+    def render(topology_instance):
+        return sandboxes.get_management_sshconfig(
+            sandbox, '~/.ssh/key', topology_instance
+        ).serialize()
+
+    serial = measure(lambda: [render(ti) for ti in topology_instances], repeat=3)
+    with ThreadPoolExecutor(4) as executor:
+        threads = measure(lambda: list(executor.map(render, topology_instances)), repeat=3)
+    print(
+        f'\n{len(topology_instances[0].get_nodes())} nodes: serial {serial * 1000:.1f} ms,'
+        f' 4 threads {threads * 1000:.1f} ms'
+    )
+
 
 class TestPoolLock:
     """Tests for pool lock and sandbox access views."""
@@ -1,21 +1,31 @@
-"""Tests for image listing and caching via common_cloud."""
+"""Tests for the cloud catalog in common_cloud."""
 
+import time
 from unittest import mock
 
 import pytest
 from django.core.cache import cache
+from django.urls import reverse
 
-from crczp.sandbox_common_lib.common_cloud import list_images
+from crczp.cloud_commons import Image
+from crczp.sandbox_common_lib import common_cloud
+from crczp.sandbox_common_lib.common_cloud import CatalogEntry, CatalogSection, list_images
 
-IMAGE_LIST_CACHE_KEY = 'image_list'
+
+@pytest.fixture
+def images(image):
+    """Return two images of different names."""
+    return [image, Image(**{**vars(image), 'name': 'ubuntu-24'})]
 
 
 @pytest.fixture
-def mock_terraform_client():
+def mock_terraform_client(images):  # pylint: disable=redefined-outer-name
     """Create a mock Terraform client that returns a fixed image list."""
     client = mock.Mock()
-    client.list_images.return_value = ['image1', 'image2', 'image3']
-    return client
+    client.list_images.return_value = images[:1]
+    client.get_flavors_dict.return_value = {'standard.small': ''}
+    with mock.patch('crczp.sandbox_common_lib.utils.get_terraform_client', return_value=client):
+        yield client
 
 
 @pytest.fixture
@@ -26,35 +36,243 @@ def setup_cache():
     cache.clear()
 
 
+@pytest.fixture
+def queue(mocker):
+    """Mock the RQ queue the refresh jobs are enqueued to."""
+    return mocker.patch('django_rq.get_queue').return_value
+
+
+def make_stale(section: CatalogSection) -> None:
+    """Age the cached section past the refresh interval."""
+    key = common_cloud.CLOUD_CATALOG_CACHE_KEY.format(section.value)
+    entry = CatalogEntry(cache.get(key).value, fetched_at=time.time() - 3600)
+    cache.set(key, entry, None)
+    cache.set(common_cloud.CLOUD_CATALOG_FETCHED_AT_KEY.format(section.value), entry.fetched_at)
+
+
 @pytest.mark.django_db
 def test_list_images_cached(  # pylint: disable=unused-argument,redefined-outer-name
-    mock_terraform_client, setup_cache
+    mock_terraform_client, images, setup_cache
 ):
     """Test that list_images returns cached results on second call when cached=True."""
-    with mock.patch(
-        'crczp.sandbox_common_lib.utils.get_terraform_client', return_value=mock_terraform_client
-    ):
-        images = list_images(cached=True)
-        assert images == ['image1', 'image2', 'image3']
+    assert list_images(cached=True) == images[:1]
 
-        mock_terraform_client.list_images.return_value = ['image4', 'image5']
+    mock_terraform_client.list_images.return_value = images
 
-        images = list_images(cached=True)
-        assert images == ['image1', 'image2', 'image3']
+    assert list_images(cached=True) == images[:1]
 
 
 @pytest.mark.django_db
 def test_list_images_not_cached(  # pylint: disable=unused-argument,redefined-outer-name
-    mock_terraform_client, setup_cache
+    mock_terraform_client, images, setup_cache
 ):
     """Test that list_images fetches fresh results on each call when cached=False."""
-    with mock.patch(
-        'crczp.sandbox_common_lib.utils.get_terraform_client', return_value=mock_terraform_client
-    ):
-        images = list_images(cached=False)
-        assert images == ['image1', 'image2', 'image3']
+    assert list_images(cached=False) == images[:1]
+
+    mock_terraform_client.list_images.return_value = images
+
+    assert list_images(cached=False) == images
+    assert list_images() == images
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    ('cached', 'names'),
+    [('true', ['debian-12-x86_64']), ('false', ['debian-12-x86_64', 'ubuntu-24'])],
+)
+def test_images_view_cached(  # pylint: disable=unused-argument,redefined-outer-name
+    client, mock_terraform_client, images, setup_cache, cached, names
+):
+    """Test that the images endpoint lists the images from the cloud unless cached=true."""
+    list_images()
+    mock_terraform_client.list_images.return_value = images
+
+    response = client.get(reverse('project-images'), {'cached': cached})
+
+    assert response.status_code == 200
+    assert [image['name'] for image in response.data['results']] == names
+
+
+@pytest.mark.django_db
+def test_image_catalog_by_name(  # pylint: disable=unused-argument,redefined-outer-name
+    mock_terraform_client, images, setup_cache
+):
+    """Test that images are looked up by name and other sections are not fetched."""
+    mock_terraform_client.list_images.return_value = images
+
+    image_catalog = common_cloud.get_image_catalog()
+
+    assert image_catalog.get('ubuntu-24') is images[1]
+    assert image_catalog.get('missing') is None
+    mock_terraform_client.get_flavors_dict.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_stale_section_served_while_refreshed(  # pylint: disable=unused-argument,redefined-outer-name
+    mock_terraform_client, queue, setup_cache
+):
+    """Test that a stale section is returned and a single refresh is enqueued."""
+    assert common_cloud.get_flavors() == {'standard.small': ''}
+    make_stale(CatalogSection.FLAVORS)
+    mock_terraform_client.get_flavors_dict.return_value = {'standard.large': ''}
+
+    assert common_cloud.get_flavors() == {'standard.small': ''}
+    assert common_cloud.get_flavors() == {'standard.small': ''}
+
+    queue.enqueue.assert_called_once_with(
+        common_cloud.refresh_catalog_job, job_id=common_cloud.CLOUD_CATALOG_REFRESH_JOB_ID
+    )
+    mock_terraform_client.get_flavors_dict.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_refresh_job(  # pylint: disable=unused-argument,redefined-outer-name
+    mock_terraform_client, queue, setup_cache
+):
+    """Test that the job refreshes the sections, keeps failed ones and reschedules itself."""
+    common_cloud.get_flavors()
+    mock_terraform_client.get_flavors_dict.side_effect = ConnectionError()
+    mock_terraform_client.get_project_name.return_value = 'project'
+
+    common_cloud.refresh_catalog_job()
+
+    assert common_cloud.get_flavors() == {'standard.small': ''}
+    assert common_cloud.get_project_name() == 'project'
+    queue.enqueue_in.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_no_refresh_requested_while_scheduled(  # pylint: disable=unused-argument,redefined-outer-name
+    mock_terraform_client, queue, setup_cache
+):
+    """Test that stale sections do not enqueue another job once the periodic one is scheduled."""
+    common_cloud.refresh_catalog_job()
+    make_stale(CatalogSection.FLAVORS)
+
+    common_cloud.get_flavors()
+
+    queue.enqueue.assert_not_called()
+    queue.enqueue_in.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_image_catalog_built_once_per_fetch(  # pylint: disable=unused-argument,redefined-outer-name
+    mock_terraform_client, images, setup_cache, mocker
+):
+    """Test that the cache holds the plain images and the catalog is rebuilt only after a fetch."""
+    image_catalog = common_cloud.get_image_catalog()
+    cache_get = mocker.spy(cache, 'get')
+
+    assert common_cloud.get_image_catalog() is image_catalog
+    cache_get.assert_called_once_with(
+        common_cloud.CLOUD_CATALOG_FETCHED_AT_KEY.format(CatalogSection.IMAGES.value)
+    )
+    entry = cache.get(common_cloud.CLOUD_CATALOG_CACHE_KEY.format(CatalogSection.IMAGES.value))
+    assert entry.value == images[:1]
+
+    # Another process refreshes the images.
+    refreshed_entry = CatalogEntry(images, fetched_at=entry.fetched_at + 1)
+    cache.set_many(
+        {
+            common_cloud.CLOUD_CATALOG_CACHE_KEY.format(
+                CatalogSection.IMAGES.value
+            ): refreshed_entry,
+            common_cloud.CLOUD_CATALOG_FETCHED_AT_KEY.format(
+                CatalogSection.IMAGES.value
+            ): refreshed_entry.fetched_at,
+        },
+        None,
+    )
+
+    refreshed = common_cloud.get_image_catalog()
+    assert refreshed is not image_catalog
+    assert refreshed.images == images
+    assert common_cloud.get_image_catalog() is refreshed
+
+
+def make_image(image: Image, name: str, **attributes) -> Image:
+    """Return a copy of the image with another name and attributes."""
+    return Image(**{**vars(image), 'name': name, **attributes})
+
+
+class TestImageCatalog:
+    """Tests for filtering and sorting the indexed image catalog."""
+
+    @pytest.fixture
+    def image_catalog(self, image):
+        """Return a catalog of images with various attributes."""
+        return common_cloud.ImageCatalog([
+            make_image(image, 'debian-12', os_type='linux', size=300, tags=['base']),
+            make_image(
+                image,
+                'windows-10',
+                os_type='windows',
+                size=None,
+                owner_specified={
+                    common_cloud.OWNER_SPECIFIED_GUI_ACCESS: 'true',
+                    common_cloud.OWNER_SPECIFIED_CUSTOM: 'true',
+                },
+            ),
+            make_image(image, 'debian-11', os_type='linux', size=100),
+            make_image(image, 'kali', os_type='linux', size=300),
+        ])
+
+    @staticmethod
+    def names(images: list[Image]) -> list[str]:
+        """Return the names of the images."""
+        return [image.name for image in images]
+
+    def test_filters(self, image_catalog):
+        """Test that substring, tag and owner flag filters are combined."""
+        assert self.names(image_catalog.select({'name': 'debian', 'os_type': 'lin'})) == [
+            'debian-12',
+            'debian-11',
+        ]
+        assert self.names(image_catalog.select({'tags': 'base'})) == ['debian-12']
+        assert self.names(image_catalog.select({}, only_custom=True, gui_access=True)) == [
+            'windows-10'
+        ]
+        assert not image_catalog.select({'name': 'debian'}, gui_access=True)
+        assert not image_catalog.select({'os_distro': 'missing'})
+
+    def test_sorting(self, image_catalog):
+        """Test the pre-sorted orderings, ties keep the catalog order in both directions."""
+        assert self.names(image_catalog.select({}, sort_by='name')) == [
+            'debian-11',
+            'debian-12',
+            'kali',
+            'windows-10',
+        ]
+        assert self.names(image_catalog.select({}, sort_by='size', descending=True)) == [
+            'windows-10',
+            'debian-12',
+            'kali',
+            'debian-11',
+        ]
+        assert self.names(image_catalog.select({'os_type': 'linux'}, sort_by='unknown')) == [
+            'debian-12',
+            'debian-11',
+            'kali',
+        ]
 
-        mock_terraform_client.list_images.return_value = ['image4', 'image5']
+    def test_sorting_missing_attribute(self, image):
+        """Test that images missing the sort attribute are sorted last in ascending order."""
+        image_catalog = common_cloud.ImageCatalog([
+            make_image(image, 'kali', os_distro=None),
+            make_image(image, 'debian-12', os_distro='debian'),
+            make_image(image, 'windows-10', os_distro=None),
+            make_image(image, 'alpine', os_distro='alpine'),
+        ])
 
-        images = list_images(cached=False)
-        assert images == ['image4', 'image5']
+        assert self.names(image_catalog.select({}, sort_by='os_distro')) == [
+            'alpine',
+            'debian-12',
+            'kali',
+            'windows-10',
+        ]
+        assert self.names(image_catalog.select({}, sort_by='os_distro', descending=True)) == [
+            'kali',
+            'windows-10',
+            'debian-12',
+            'alpine',
+        ]
@@ -155,6 +155,7 @@ class TestAllocationRequestHandlerUnit:
         fake_sandbox_class = mocker.patch(
             'crczp.sandbox_instance_app.lib.request_handlers.Sandbox', return_value=fake_sandbox
         )
+        fake_sandbox_class.objects.get.return_value.id = '122'
 
         units = [SandboxAllocationUnit.objects.create(pool=pool) for _ in range(2)]
 
@@ -187,6 +188,7 @@ class TestAllocationRequestHandlerUnit:
         fake_sandbox_class = mocker.patch(
             'crczp.sandbox_instance_app.lib.request_handlers.Sandbox', return_value=fake_sandbox
         )
+        fake_sandbox_class.objects.get.return_value.id = '122'
         fake_destroy = mocker.patch(
             'crczp.sandbox_instance_app.lib.request_handlers.netbird.destroy_netbird_for_sandbox'
         )
@@ -0,0 +1,129 @@
+"""Tests for the ledger of reserved cloud resources."""
+
+import pytest
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory
+
+from crczp.cloud_commons import HardwareUsage, Quota, QuotaSet
+from crczp.sandbox_common_lib import common_cloud
+from crczp.sandbox_definition_app.views import DefinitionCapacityView
+from crczp.sandbox_instance_app.lib import reservations
+from crczp.sandbox_instance_app.models import ResourceReservation, SandboxAllocationUnit
+
+pytestmark = pytest.mark.django_db
+
+POOL_ID = 1
+DEFINITION_ID = 1
+HARDWARE_USAGE = HardwareUsage(vcpu=2, ram=4.0, instances=2, network=1, subnet=1, port=4)
+
+
+@pytest.fixture
+def client(mocker):
+    """Mock the terraform client with a project of 10 vCPUs, 32 RAM and 10 instances."""
+    client = mocker.patch('crczp.sandbox_common_lib.utils.get_terraform_client').return_value
+    unlimited = Quota(-1, 0)
+    client.get_quota_set.return_value = QuotaSet(
+        Quota(10, 0), Quota(32.0, 8.0), Quota(10, 0), unlimited, unlimited, unlimited
+    )
+    client.get_hardware_usage.return_value = HARDWARE_USAGE
+    common_cloud.clear_catalog()
+    return client
+
+
+def create_units(count, created_by=None):
+    """Create allocation units in the pool."""
+    return [
+        SandboxAllocationUnit.objects.create(pool_id=POOL_ID, created_by=created_by)
+        for _ in range(count)
+    ]
+
+
+class TestLedger:
+    """Tests for reserving resources and checking the capacity."""
+
+    def test_reserved_resources_are_summed(self, client):  # pylint: disable=unused-argument
+        """Test that the reservations of all units are summed."""
+        reservations.reserve(create_units(3), HARDWARE_USAGE)
+
+        assert reservations.get_reserved() == HARDWARE_USAGE * 3
+
+    def test_available_uses_larger_of_in_use_and_reserved(self, client):  # pylint: disable=unused-argument
+        """Test that the cloud usage counts while it is larger than the reservations."""
+        available = reservations.get_available()
+        assert available == {
+            'vcpu': 10,
+            'ram': 24.0,
+            'instances': 10,
+            'network': None,
+            'subnet': None,
+            'port': None,
+        }
+
+        reservations.reserve(create_units(3), HARDWARE_USAGE)
+
+        available = reservations.get_available()
+        assert available['vcpu'] == 4
+        assert available['ram'] == 20.0
+
+    def test_check_capacity(self, client):  # pylint: disable=unused-argument
+        """Test that a request exceeding the available resources is refused."""
+        reservations.reserve(create_units(4), HARDWARE_USAGE)
+
+        quota_set = common_cloud.get_quota_set()
+
+        reservations.check_capacity(HARDWARE_USAGE, 1, quota_set)
+        with pytest.raises(reservations.exceptions.StackError, match=r'\[vcpu\]'):
+            reservations.check_capacity(HARDWARE_USAGE, 2, quota_set)
+
+    def test_check_capacity_does_not_call_cloud(self, client):
+        """Test that the capacity check uses the given quota set, even if none is cached."""
+        quota_set = common_cloud.get_quota_set()
+        common_cloud.clear_catalog()
+        client.reset_mock()
+
+        reservations.check_capacity(HARDWARE_USAGE, 1, quota_set)
+        client.get_quota_set.assert_not_called()
+
+    def test_reservation_released_with_unit(self, client):  # pylint: disable=unused-argument
+        """Test that deleting the allocation unit after its cleanup releases its resources."""
+        [unit] = create_units(1)
+        reservations.reserve([unit], HARDWARE_USAGE)
+
+        unit.delete()
+
+        assert not ResourceReservation.objects.exists()
+        assert reservations.get_available()['vcpu'] == 10
+
+    def test_count_fitting_ignores_unlimited_and_unused(self):
+        """Test that only limited resources the sandbox uses bound the count."""
+        usage = HardwareUsage(vcpu=3, ram=0.0, instances=1, network=0, subnet=0, port=0)
+        available = {
+            'vcpu': 10,
+            'ram': 0.0,
+            'instances': None,
+            'network': 0,
+            'subnet': None,
+            'port': None,
+        }
+
+        assert reservations.count_fitting(usage, available) == 3
+        assert reservations.count_fitting(usage, dict.fromkeys(available)) is None
+
+
+class TestDefinitionCapacityView:  # pylint: disable=too-few-public-methods
+    """Tests for the projection of the capacity of a definition."""
+
+    def test_projection(self, mocker, client, definition):  # pylint: disable=unused-argument
+        """Test that the projection accounts for the reservations of all pools."""
+        mocker.patch('crczp.sandbox_definition_app.lib.definitions.get_definition')
+        reservations.reserve(create_units(2), HARDWARE_USAGE)
+
+        request = APIRequestFactory().get(
+            reverse('definition-capacity', kwargs={'definition_id': DEFINITION_ID})
+        )
+        response = DefinitionCapacityView.as_view()(request, definition_id=DEFINITION_ID)
+
+        assert response.status_code == 200
+        assert response.data['sandboxes'] == 3
+        assert response.data['available']['vcpu'] == 6
+        assert response.data['available']['port'] is None
@@ -1,16 +1,23 @@
 """Tests for sandbox management functions."""
 
+import copy
 import zipfile
 from unittest import mock
 
 import pytest
+from django.core.cache import cache
 from django.db import IntegrityError
 from django.http import Http404
 
+from crczp.sandbox_ansible_app.lib import ansible
 from crczp.sandbox_common_lib import exceptions
 from crczp.sandbox_instance_app import serializers
-from crczp.sandbox_instance_app.lib import sandboxes, sshconfig
-from crczp.sandbox_instance_app.models import Sandbox, SandboxAllocationUnit
+from crczp.sandbox_instance_app.lib import nodes, sandboxes, sshconfig
+from crczp.sandbox_instance_app.models import (
+    Sandbox,
+    SandboxAllocationUnit,
+    SandboxTopologySnapshot,
+)
 
 pytestmark = pytest.mark.django_db
 
@@ -150,3 +157,123 @@ class TestSandboxesManipulation:
             mocker.Mock(), mng_key='/root/.ssh/pool_mng_key', proxy_key='/root/.ssh/id_rsa'
         )
         assert ssh_conf.asdict() == ansible_ssh_config.asdict()
+
+
+class TestConsolePrefetch:
+    """Tests for prefetching the console URLs of ready and locked sandboxes."""
+
+    @pytest.fixture(autouse=True)
+    def set_up(self, mocker, top_ins):
+        """Patch the topology instance, the console URLs refresh and the RQ queue."""
+        mocker.patch(
+            'crczp.sandbox_instance_app.lib.sandboxes.get_topology_instance', return_value=top_ins
+        )
+        self.refresh = mocker.patch('crczp.sandbox_instance_app.lib.nodes.refresh_console_urls')
+        self.queue = mocker.patch('django_rq.get_queue').return_value
+
+    def test_lock_sandbox_prefetches(self, django_capture_on_commit_callbacks):
+        """Test that locking a sandbox enqueues the prefetch once the lock is committed."""
+        sandbox = sandboxes.get_sandbox(SANDBOX_ID)
+        with django_capture_on_commit_callbacks(execute=True):
+            sandboxes.lock_sandbox(sandbox, None)
+
+        self.queue.enqueue.assert_called_once_with(
+            sandboxes.prefetch_console_urls_job,
+            sandbox.id,
+            job_id=sandboxes.CONSOLE_PREFETCH_JOB_ID.format(sandbox.id),
+        )
+
+    def test_job_reschedules_while_locked(self, top_ins):
+        """Test that the job refreshes the URLs and reschedules itself for a locked sandbox."""
+        sandbox = sandboxes.get_sandbox(SANDBOX_ID)
+        sandboxes.lock_sandbox(sandbox, None)
+
+        sandboxes.prefetch_console_urls_job(sandbox.id)
+
+        node_names = self.refresh.call_args.args[1]
+        assert set(node_names) == {
+            *(host.name for host in top_ins.get_hosts() if not host.hidden),
+            *(router.name for router in top_ins.get_routers()),
+        }
+        assert self.refresh.call_args.kwargs == {'valid_for': sandboxes.CONSOLE_REFRESH_MARGIN}
+        delay, job, sandbox_id = self.queue.enqueue_in.call_args.args
+        assert delay.total_seconds() < nodes.CACHE_CONSOLE_TIMEOUT
+        assert (job, sandbox_id) == (sandboxes.prefetch_console_urls_job, sandbox.id)
+
+    def test_job_stops_when_unlocked(self):
+        """Test that the job of an unlocked sandbox does not reschedule itself."""
+        sandboxes.prefetch_console_urls_job(SANDBOX_ID)
+
+        self.refresh.assert_called_once()
+        self.queue.enqueue_in.assert_not_called()
+
+    def test_job_retries_while_another_fetch_runs(self):
+        """Test that the job is retried shortly if the URLs are being fetched by another job."""
+        self.refresh.return_value = False
+
+        sandboxes.prefetch_console_urls_job(SANDBOX_ID)
+
+        delay, job, sandbox_id = self.queue.enqueue_in.call_args.args
+        assert delay.total_seconds() == sandboxes.CONSOLE_PREFETCH_RETRY_DELAY
+        assert (job, sandbox_id) == (sandboxes.prefetch_console_urls_job, SANDBOX_ID)
+
+
+class TestGetTopologyInstance:
+    """Tests for the cached retrieval of sandbox topology instances."""
+
+    @pytest.fixture(autouse=True)
+    def set_up(self, mocker, top_ins):
+        """Clear the shared cache and mock the git fetch and the terraform client."""
+        cache.clear()
+        self.mock_get_definition = mocker.patch(
+            'crczp.sandbox_instance_app.lib.sandboxes.get_topology_definition_and_containers',
+            return_value=(mocker.Mock(), mocker.Mock()),
+        )
+        self.client = mocker.MagicMock()
+        self.client.get_enriched_topology_instance.return_value = top_ins
+        mocker.patch(
+            'crczp.sandbox_common_lib.utils.get_terraform_client', return_value=self.client
+        )
+        yield
+        cache.clear()
+
+    def test_cache_miss_fetches_definition(self, top_ins):
+        """Test that a cache miss fetches the definition and builds the topology instance."""
+        sandbox = sandboxes.get_sandbox(SANDBOX_ID)
+        assert sandboxes.get_topology_instance(sandbox).name == top_ins.name
+        self.mock_get_definition.assert_called_once_with(sandbox)
+        self.client.get_enriched_topology_instance.assert_called_once()
+
+    def test_cache_hit_skips_definition_fetch(self):
+        """Test that a cached topology instance is returned without contacting git."""
+        sandbox = sandboxes.get_sandbox(SANDBOX_ID)
+        sandboxes.get_topology_instance(sandbox)
+        sandboxes.get_topology_instance(sandbox)
+        self.mock_get_definition.assert_called_once()
+        self.client.get_enriched_topology_instance.assert_called_once()
+
+    def test_snapshot_survives_cache_loss(self):
+        """Test that the DB snapshot is used instead of the cloud when the cache is lost."""
+        sandbox = sandboxes.get_sandbox(SANDBOX_ID)
+        sandboxes.get_topology_instance(sandbox)
+        cache.clear()
+
+        sandboxes.get_topology_instance(sandbox)
+
+        assert SandboxTopologySnapshot.objects.filter(sandbox=sandbox).exists()
+        self.client.get_enriched_topology_instance.assert_called_once()
+
+    def test_refresh_rebuilds_snapshot(self, top_ins):
+        """Test that refreshing re-reads the cloud and drops the cached instance and inventory."""
+        sandbox = sandboxes.get_sandbox(SANDBOX_ID)
+        sandboxes.get_topology_instance(sandbox)
+        cache.set(ansible.get_inventory_cache_key(sandbox), {'all': {}})
+        changed_top_ins = copy.deepcopy(top_ins)
+        changed_top_ins.ip = '10.10.10.11'
+        self.client.get_enriched_topology_instance.return_value = changed_top_ins
+
+        sandboxes.refresh_topology_instance(sandbox)
+
+        assert sandboxes.get_topology_instance(sandbox).ip == '10.10.10.11'
+        assert self.client.get_enriched_topology_instance.call_count == 2
+        assert cache.get(ansible.get_inventory_cache_key(sandbox)) is None
@@ -37,7 +37,9 @@ class TestAllocationStackStageHandler:
     def set_up(self, mocker, process):
         """Patch stage handler internals and return a mock process."""
         mocker.patch('crczp.sandbox_instance_app.lib.stage_handlers.LOG')
-        mocker.patch('crczp.sandbox_instance_app.lib.stage_handlers.definitions.get_definition')
+        mocker.patch(
+            'crczp.sandbox_instance_app.lib.stage_handlers.definition_snapshots.get_definition'
+        )
         mocker.patch('crczp.sandbox_instance_app.lib.stage_handlers.utils.get_terraform_client')
         stage_handlers.AllocationStackStageHandler._client = mocker.Mock()
         stage_handlers.AllocationStackStageHandler._client.get_process_output.return_value = [
@@ -55,6 +57,17 @@ class TestAllocationStackStageHandler:
         assert allocation_stage_stack.terraformstack.stack_id == process.pid
         assert_db_stage(allocation_stage_stack, now, failed=False)
 
+    def test_execute_saves_topology_snapshot(self, mocker, allocation_stage_stack, sandbox):
+        """Test that a successful allocation stores the topology snapshot of the sandbox."""
+        mock_refresh = mocker.patch(
+            'crczp.sandbox_instance_app.lib.stage_handlers.sandboxes.refresh_topology_instance'
+        )
+        handler = stage_handlers.AllocationStackStageHandler(allocation_stage_stack)
+
+        handler.execute()
+
+        mock_refresh.assert_called_once_with(sandbox)
+
     def test_execute_failed_creation_request(self, now, allocation_stage_stack):
         """Test that a failed stack creation request marks the stage as failed."""
         handler = stage_handlers.AllocationStackStageHandler(allocation_stage_stack)
@@ -0,0 +1,87 @@
+"""Tests for the endpoint exposing the statistics of the service caches."""
+
+# pylint: disable=redefined-outer-name
+import pytest
+from django.core.cache import caches
+from django.urls import reverse
+from rest_framework import status
+
+from crczp.sandbox_common_lib.http_client import DestinationMetrics
+from crczp.sandbox_definition_app.lib.conditional_requests import (
+    NOT_MODIFIED,
+    OK,
+    ResponseCache,
+)
+from crczp.sandbox_instance_app.lib.topology_cache import SHARED_TIER, TopologyInstanceCache
+from crczp.sandbox_uag.permissions import EndpointPermissionClass
+
+
+@pytest.fixture
+def topology_cache(mocker):
+    """Serve the statistics of a fresh topology cache."""
+    topology_cache = TopologyInstanceCache(4, shared=caches['default'])
+    mocker.patch('crczp.sandbox_instance_app.views.get_topology_cache', return_value=topology_cache)
+    yield topology_cache
+    caches['default'].clear()
+
+
+def test_topology_cache_stats(client, topology_cache):
+    """Test that the hit rate of the topology cache tiers is exposed."""
+    topology_cache.get_or_set('key', lambda: 'value', None)
+    topology_cache.get_or_set('key', lambda: 'value', None)
+
+    response = client.get(reverse('service-stats'))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['topology_cache'][SHARED_TIER] == {
+        'hits': 1,
+        'misses': 1,
+        'hit_rate': 0.5,
+    }
+
+
+def test_definition_responses_stats(client, mocker, topology_cache):  # pylint: disable=unused-argument
+    """Test that the counts of full and revalidated definition responses are exposed."""
+    responses = mocker.patch(
+        'crczp.sandbox_instance_app.views.conditional_requests.RESPONSES', ResponseCache()
+    )
+    responses.record(OK)
+    responses.record(NOT_MODIFIED)
+    responses.record(NOT_MODIFIED)
+
+    response = client.get(reverse('service-stats'))
+
+    assert response.data['definition_responses'] == {OK: 1, NOT_MODIFIED: 2, 'entries': 0}
+
+
+def test_http_destinations_stats(client, mocker, topology_cache):  # pylint: disable=unused-argument
+    """Test that the latency and errors of the outgoing requests are exposed by destination."""
+    metrics = mocker.patch(
+        'crczp.sandbox_instance_app.views.http_client.METRICS', DestinationMetrics()
+    )
+    metrics.record('https://gitlab.example.com', 0.5, error=False)
+    metrics.record('https://gitlab.example.com', 1.5, error=True)
+
+    response = client.get(reverse('service-stats'))
+
+    assert response.data['http_destinations'] == {
+        'https://gitlab.example.com': {
+            'requests': 2,
+            'errors': 1,
+            'latency_total': 2.0,
+            'latency_max': 1.5,
+            'latency_mean': 1.0,
+        }
+    }
+
+
+def test_stats_admin_only(client, mocker, topology_cache):  # pylint: disable=unused-argument
+    """Test that the statistics are refused to users without the admin role."""
+    has_access_level = mocker.patch.object(
+        EndpointPermissionClass, 'has_access_level', return_value=False
+    )
+
+    response = client.get(reverse('service-stats'))
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    has_access_level.assert_called_once_with(mocker.ANY, EndpointPermissionClass.AccessLevel.ADMIN)
@@ -0,0 +1,221 @@
+"""Tests for the two-tier topology instance cache."""
+
+# pylint: disable=redefined-outer-name
+import time
+
+import fakeredis
+import pytest
+import redis
+from django.core.cache import caches
+
+from crczp.sandbox_instance_app.lib import sandboxes
+from crczp.sandbox_instance_app.lib.topology_cache import (
+    LOCAL_TIER,
+    SHARED_TIER,
+    LocalLRUCache,
+    TopologyInstanceCache,
+)
+
+KEY = 'terraformstack-1'
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    """Poll the condition until it holds or the timeout elapses."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def shared_cache():
+    """Return the LocMem default cache, cleared around the test."""
+    shared = caches['default']
+    shared.clear()
+    yield shared
+    shared.clear()
+
+
+@pytest.fixture
+def redis_connection(mocker):
+    """Route the pub/sub traffic of the cache module to a fake Redis server."""
+    connection = fakeredis.FakeRedis()
+    mocker.patch(
+        'crczp.sandbox_instance_app.lib.topology_cache.django_rq.get_connection',
+        return_value=connection,
+    )
+    return connection
+
+
+@pytest.fixture
+def make_cache(shared_cache, redis_connection):  # pylint: disable=unused-argument
+    """Return a factory of subscribed caches; their listeners are stopped on teardown."""
+    created = []
+
+    def _make(max_size: int = 4) -> TopologyInstanceCache:
+        topology_cache = TopologyInstanceCache(max_size, shared=shared_cache)
+        topology_cache.start_listener()
+        assert wait_for(lambda: topology_cache.local_active)
+        created.append(topology_cache)
+        return topology_cache
+
+    yield _make
+    for topology_cache in created:
+        topology_cache.stop_listener()
+
+
+class TestLocalLRUCache:
+    """Tests for the in-process LRU tier."""
+
+    def test_evicts_least_recently_used(self):
+        """Test that the least recently used key is evicted over the size limit."""
+        lru = LocalLRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        assert 'a' in lru and 'c' in lru
+        assert 'b' not in lru
+
+    def test_zero_size_stores_nothing(self):
+        """Test that a zero-sized LRU is disabled."""
+        lru = LocalLRUCache(0)
+        lru.set('a', 1)
+        assert len(lru) == 0
+
+    def test_entries_expire(self):
+        """Test that an entry is dropped after its timeout."""
+        lru = LocalLRUCache(2)
+        lru.set('a', 1, timeout=0.01)
+        lru.set('b', 2)
+        time.sleep(0.02)
+        assert lru.get('a') is None
+        assert lru.get('b') == 2
+
+    def test_value_invalidated_while_read_is_not_stored(self):
+        """Test that a value read before its key was deleted is not stored."""
+        lru = LocalLRUCache(2)
+        generation = lru.generation('a')
+        lru.delete('a')
+        lru.set('a', 'stale', generation=generation)
+
+        generation = lru.generation('b')
+        lru.clear()
+        lru.set('b', 'stale', generation=generation)
+
+        assert 'a' not in lru and 'b' not in lru
+        lru.set('a', 'fresh', generation=lru.generation('a'))
+        assert lru.get('a') == 'fresh'
+
+
+class TestTopologyInstanceCache:
+    """Tests for the two-tier cache and its pub/sub invalidation."""
+
+    def test_local_tier_serves_repeated_lookups(self, mocker, make_cache):
+        """Test that only the first lookup reaches the shared tier and the producer."""
+        topology_cache = make_cache()
+        producer = mocker.Mock(return_value='topology-instance')
+
+        for _ in range(3):
+            assert topology_cache.get_or_set(KEY, producer, None) == 'topology-instance'
+
+        producer.assert_called_once()
+        stats = topology_cache.get_stats()
+        assert stats[LOCAL_TIER] == {'hits': 2, 'misses': 1, 'hit_rate': 2 / 3}
+        assert stats[SHARED_TIER] == {'hits': 0, 'misses': 1, 'hit_rate': 0.0}
+
+    def test_shared_tier_hit_fills_local_tier(self, mocker, make_cache, shared_cache):
+        """Test that a value found in the shared tier is kept locally."""
+        topology_cache = make_cache()
+        shared_cache.set(KEY, 'shared-instance')
+        producer = mocker.Mock()
+
+        assert topology_cache.get_or_set(KEY, producer, None) == 'shared-instance'
+        assert KEY in topology_cache.local
+        producer.assert_not_called()
+        assert topology_cache.get_stats()[SHARED_TIER]['hits'] == 1
+
+    def test_get_or_set_many(self, mocker, make_cache, shared_cache):
+        """Test that a batch is read from both tiers and only the misses are produced."""
+        topology_cache = make_cache()
+        topology_cache.get_or_set('local', lambda: 'local-instance', None)
+        shared_cache.set('shared', 'shared-instance')
+        get_many = mocker.spy(shared_cache, 'get_many')
+        producer = mocker.Mock(return_value={'missing': 'new-instance'})
+
+        values = topology_cache.get_or_set_many(['local', 'shared', 'missing'], producer, None)
+
+        assert values == {
+            'local': 'local-instance',
+            'shared': 'shared-instance',
+            'missing': 'new-instance',
+        }
+        get_many.assert_called_once_with(['shared', 'missing'])
+        producer.assert_called_once_with(['missing'])
+        assert shared_cache.get('missing') == 'new-instance'
+        assert 'shared' in topology_cache.local and 'missing' in topology_cache.local
+
+    def test_invalidation_during_miss_is_not_lost(self, make_cache):
+        """Test that a value invalidated while it is produced is not kept locally."""
+        topology_cache = make_cache()
+
+        def producer():
+            # The invalidation of another process arrives while the value is produced.
+            topology_cache.local.delete(KEY)
+            return 'stale-instance'
+
+        assert topology_cache.get_or_set(KEY, producer, None) == 'stale-instance'
+        assert KEY not in topology_cache.local
+
+    def test_delete_evicts_local_copies_of_other_processes(self, make_cache, shared_cache):
+        """Test that a deletion is broadcast to the local tier of other caches."""
+        first, second = make_cache(), make_cache()
+        first.get_or_set(KEY, lambda: 'topology-instance', None)
+        second.get_or_set(KEY, lambda: 'topology-instance', None)
+
+        first.delete(KEY)
+
+        assert KEY not in first.local
+        assert shared_cache.get(KEY) is None
+        assert wait_for(lambda: KEY not in second.local)
+
+    def test_local_tier_unused_without_subscription(self, mocker, shared_cache):
+        """Test that the local tier is bypassed until invalidations can be received."""
+        topology_cache = TopologyInstanceCache(4, shared=shared_cache)
+        producer = mocker.Mock(return_value='topology-instance')
+
+        topology_cache.get_or_set(KEY, producer, None)
+        topology_cache.get_or_set(KEY, producer, None)
+
+        assert len(topology_cache.local) == 0
+        assert topology_cache.get_stats()[SHARED_TIER]['hits'] == 1
+
+    def test_publish_failure_is_not_raised(self, mocker, shared_cache):
+        """Test that an unreachable Redis does not break the deletion."""
+        connection = mocker.Mock()
+        connection.publish.side_effect = redis.ConnectionError('unreachable')
+        mocker.patch(
+            'crczp.sandbox_instance_app.lib.topology_cache.django_rq.get_connection',
+            return_value=connection,
+        )
+        topology_cache = TopologyInstanceCache(4, shared=shared_cache)
+        shared_cache.set(KEY, 'topology-instance')
+
+        topology_cache.delete(KEY)
+
+        assert shared_cache.get(KEY) is None
+
+    def test_sandbox_clear_cache_uses_topology_cache(self, mocker):
+        """Test that clearing a sandbox cache deletes its key from the topology cache."""
+        topology_cache = mocker.Mock()
+        mocker.patch(
+            'crczp.sandbox_instance_app.lib.sandboxes.get_topology_cache',
+            return_value=topology_cache,
+        )
+        sandbox = mocker.Mock(id=1)
+
+        sandboxes.clear_cache(sandbox)
+
+        topology_cache.delete.assert_called_once_with(KEY)
@@ -131,6 +131,11 @@ urlpatterns = [
         views.SandboxTopologyView.as_view(),
         name='sandbox-topology',
     ),
+    path(
+        'sandboxes/<str:sandbox_uuid>/topology-refresh',
+        views.SandboxTopologyRefreshView.as_view(),
+        name='sandbox-topology-refresh',
+    ),
     path(
         'sandboxes/<str:sandbox_uuid>/topology/<str:node_name>',
         views.TopologyNodeConnectionData.as_view(),
@@ -166,4 +171,5 @@ urlpatterns = [
         views.SandboxVpnView.as_view(),
         name='sandbox-vpn',
     ),
+    path('stats', views.ServiceStatsView.as_view(), name='service-stats'),
 ]
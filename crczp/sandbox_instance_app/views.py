@@ -1,21 +1,30 @@
 """REST API views for sandbox instance management."""
 
+import asyncio
 import shlex
 from typing import Any, override
-from wsgiref.util import FileWrapper
 
 import structlog
-from django.conf import settings
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import QuerySet
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBase
 from drf_spectacular.utils import OpenApiParameter, OpenApiRequest, OpenApiResponse, extend_schema
 from rest_framework import generics, status
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from crczp.sandbox_common_lib import exceptions, log_output_mixin, utils
+from crczp.sandbox_common_lib import (
+    common_cloud,
+    exceptions,
+    http_client,
+    log_output_mixin,
+    utils,
+)
+from crczp.sandbox_common_lib.async_views import AsyncAPIView, AsyncGenericAPIView
 from crczp.sandbox_common_lib.netbird_client import get_client_management_url
 from crczp.sandbox_common_lib.swagger_typing import (
     PoolRequestSerializer,
@@ -23,11 +32,19 @@ from crczp.sandbox_common_lib.swagger_typing import (
     SandboxDefinitionSerializer,
 )
 from crczp.sandbox_common_lib.utils import get_object_or_404
-from crczp.sandbox_definition_app.lib import definitions
+from crczp.sandbox_definition_app.lib import conditional_requests
 from crczp.sandbox_definition_app.serializers import DefinitionSerializer
 from crczp.sandbox_instance_app import serializers
-from crczp.sandbox_instance_app.lib import nodes, pools, sandboxes, stage_handlers
+from crczp.sandbox_instance_app.lib import (
+    access_bundles,
+    definition_snapshots,
+    nodes,
+    pools,
+    sandboxes,
+    stage_handlers,
+)
 from crczp.sandbox_instance_app.lib import requests as sandbox_requests
+from crczp.sandbox_instance_app.lib.topology_cache import get_topology_cache
 from crczp.sandbox_instance_app.models import (
     AllocationRequest,
     CleanupRequest,
@@ -69,6 +86,8 @@ class PoolListCreateView(generics.ListCreateAPIView[Any]):
 
     queryset = Pool.objects.all()
     serializer_class = serializers.PoolSerializer
+    # Creating a pool reads the topology of its definition from git.
+    request_deadline = 120
 
     @extend_schema(
         request=OpenApiRequest(PoolRequestSerializer),
@@ -377,6 +396,8 @@ class SandboxAllocationUnitListCreateView(generics.ListCreateAPIView[Any]):
     """
 
     serializer_class = serializers.SandboxAllocationUnitSerializer
+    # Allocating sandboxes reads the definition from git and the hardware usage from the cloud.
+    request_deadline = 120
 
     @override
     def get_queryset(self) -> QuerySet[Any, Any]:
@@ -900,19 +921,48 @@ class SandboxAllocationUnitLockRetrieveCreateDestroyView(
         **SANDBOX_RESPONSES,
     },
 )
-class SandboxTopologyView(generics.RetrieveAPIView[Any]):
+class SandboxTopologyView(AsyncGenericAPIView):
     """
     get: Get topology data for given sandbox.
     Hosts specified as hidden are filtered out, but the network is still visible.
     """
 
+    queryset = Sandbox.objects.filter(ready=True).select_related('allocation_unit__pool')
+    lookup_url_kwarg = 'sandbox_uuid'
+    serializer_class = serializers.TopologySerializer
+
+    async def get(self, request: Request, *args: Any, **kwargs: Any) -> HttpResponseBase:
+        """Get topology data for given sandbox."""
+        sandbox = await self.aget_object()
+        bundle = await access_bundles.aget(sandbox)
+        return utils.create_conditional_response(request, bundle.etag, Response(bundle.topology))
+
+
+@extend_schema(
+    request=None,
+    responses={
+        200: OpenApiResponse(
+            response=serializers.TopologySerializer, description='Refreshed topology'
+        ),
+        **SANDBOX_RESPONSES,
+    },
+)
+class SandboxTopologyRefreshView(generics.GenericAPIView[Any]):
+    """
+    post: Re-read the topology instance of given sandbox from the cloud.
+    Use when the stack of the sandbox has changed since its allocation.
+    """
+
     queryset = Sandbox.objects.filter(ready=True)
     lookup_url_kwarg = 'sandbox_uuid'
     serializer_class = serializers.TopologySerializer
+    permission_classes = [OrganizerPermission | AdminPermission]
 
-    @override
-    def get_object(self) -> Any:
-        return sandboxes.get_sandbox_topology(super().get_object())
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Refresh the stored topology snapshot of the sandbox and return its topology."""
+        sandbox = self.get_object()
+        sandboxes.refresh_topology_instance(sandbox)
+        return Response(access_bundles.build(sandbox).topology)
 
 
 @extend_schema(
@@ -930,14 +980,14 @@ class SandboxTopologyView(generics.RetrieveAPIView[Any]):
         **SANDBOX_RESPONSES,
     },
 )
-class SandboxVMDetailView(generics.GenericAPIView[Any]):
+class SandboxVMDetailView(AsyncGenericAPIView):
     """API view to retrieve VM details and perform actions on a VM in a sandbox."""
 
-    queryset = Sandbox.objects.filter(ready=True)
+    queryset = Sandbox.objects.filter(ready=True).select_related('allocation_unit__pool')
     lookup_url_kwarg = 'sandbox_uuid'
     serializer_class = serializers.NodeSerializer
 
-    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+    async def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Retrieve a VM info.
         Important Statuses:
         - ACTIVE (vm is active and running)
@@ -945,23 +995,27 @@ class SandboxVMDetailView(generics.GenericAPIView[Any]):
         - SUSPENDED (vm suspended)
         - ... https://developer.openstack.org/api-guide/compute/server_concepts.html#server-status
         """
-        sandbox = self.get_object()
-        node = nodes.get_node(sandbox, kwargs['vm_name'])
+        sandbox = await self.aget_object()
+        node = await sync_to_async(nodes.get_node, thread_sensitive=False)(
+            sandbox, kwargs['vm_name']
+        )
         return Response(serializers.NodeSerializer(node).data)
 
-    def patch(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+    async def patch(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Perform specified action on given VM.
         Available actions are:
         - suspend
         - resume
         - reboot
         """
-        sandbox = self.get_object()
+        sandbox = await self.aget_object()
         try:
             action = request.data['action']
         except KeyError:
             raise exceptions.ValidationError('No action specified!') from None
-        nodes.node_action(sandbox, kwargs['vm_name'], action)
+        await sync_to_async(nodes.node_action, thread_sensitive=False)(
+            sandbox, kwargs['vm_name'], action
+        )
         return Response()
 
 
@@ -986,23 +1040,23 @@ class SandboxVMConsoleView(APIView):
 
 
 @extend_schema(responses={200: OpenApiResponse(description='SSH Config File'), **SANDBOX_RESPONSES})
-class SandboxUserSSHAccessView(APIView):
+class SandboxUserSSHAccessView(AsyncAPIView):
     """API view to generate SSH config for user access to a sandbox."""
 
     queryset = Sandbox.objects.none()
 
     # noinspection PyMethodMayBeStatic
-    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response | HttpResponse:
+    async def get(self, request: Request, *args: Any, **kwargs: Any) -> HttpResponseBase:
         """Generate SSH config for User access to this sandbox.
         Some values are user specific, the config contains placeholders for them."""
-        sandbox = sandboxes.get_sandbox(kwargs['sandbox_uuid'])
-        in_memory_zip_file = sandboxes.get_user_ssh_access(sandbox)
-        response = HttpResponse(FileWrapper(in_memory_zip_file), content_type='application/zip')
+        sandbox = await sandboxes.aget_sandbox(kwargs['sandbox_uuid'])
+        bundle = await access_bundles.aget(sandbox)
+        response = HttpResponse(bundle.user_ssh_access, content_type='application/zip')
         response['Content-Disposition'] = (
             f'attachment; filename=user-ssh-access-pool-{sandbox.allocation_unit.pool.id}'
             f'-sandbox-{sandbox.allocation_unit.id}.zip'
         )
-        return response
+        return utils.create_conditional_response(request, bundle.etag, response)
 
 
 @extend_schema(responses={200: OpenApiResponse(description='Man IP'), **SANDBOX_RESPONSES})
@@ -1026,17 +1080,24 @@ class PoolManagementSSHAccessView(APIView):
     queryset = Pool.objects.none()
 
     # noinspection PyMethodMayBeStatic
-    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response | HttpResponse:
+    def get(self, request: Request, *args: Any, **kwargs: Any) -> StreamingHttpResponse:
         """Generate SSH config for User access to this sandbox.
-        Some values are user specific, the config contains placeholders for them."""
+        Some values are user specific, the config contains placeholders for them.
+        The zip is streamed to the client as it is written, under ASGI through
+        an asynchronous iterator."""
         pool = pools.get_pool(kwargs['pool_id'])
-        in_memory_zip_file = pools.get_management_ssh_access(pool)
-        response = HttpResponse(FileWrapper(in_memory_zip_file), content_type='application/zip')
+        chunks = pools.get_management_ssh_access(pool)
+        response = StreamingHttpResponse(
+            utils.aiter_chunks(chunks)
+            if isinstance(request._request, ASGIRequest)  # pylint: disable=protected-access
+            else chunks,
+            content_type='application/zip',
+        )
         response['Content-Disposition'] = 'attachment; filename=ssh-access.zip'
         return response
 
 
-class SandboxConsolesView(APIView):
+class SandboxConsolesView(AsyncAPIView):
     """API view to retrieve SPICE console URLs for all nodes in a sandbox topology."""
 
     queryset = Sandbox.objects.none()
@@ -1046,22 +1107,18 @@ class SandboxConsolesView(APIView):
         description='Console URLs',
     )
     # noinspection PyMethodMayBeStatic
-    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+    async def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Retrieve spice console urls for all machines in the topology. Returns 202 if
         consoles are not ready yet."""
-        sandbox = sandboxes.get_sandbox(kwargs['sandbox_uuid'])
-        topology_instance = sandboxes.get_topology_instance(sandbox)
-        node_names = [host.name for host in topology_instance.get_hosts() if not host.hidden] + [
-            router.name for router in topology_instance.get_routers()
-        ]
-        consoles = {}
-        is_ready = True
-        for name in node_names:
-            console_url = nodes.get_console_url(sandbox, name)
-            if not console_url:
-                is_ready = False
-            consoles[name] = console_url
-        return Response(consoles) if is_ready else Response(status=status.HTTP_202_ACCEPTED)
+        sandbox = await sandboxes.aget_sandbox(kwargs['sandbox_uuid'])
+        consoles = await nodes.aget_console_urls(
+            sandbox, await sandboxes.aget_console_node_names(sandbox)
+        )
+        return (
+            Response(consoles)
+            if consoles is not None
+            else Response(status=status.HTTP_202_ACCEPTED)
+        )
 
 
 @extend_schema(responses={200: OpenApiResponse(description='Variables List'), **SANDBOX_RESPONSES})
@@ -1075,12 +1132,9 @@ class PoolVariablesView(APIView):
         """Retrieve APG variables from sandbox definition of this pool, empty list if variables.yml
         was not found."""
         pool = utils.get_object_or_404(Pool, pk=kwargs['pool_id'])
-        definition = pool.definition
         variable_names = []
         try:
-            variables = definitions.get_variables(
-                definition.url, definition.rev, settings.CRCZP_CONFIG
-            )
+            variables = definition_snapshots.get_variables(pool)
             variable_names = [variable.name for variable in variables]
         except exceptions.GitError:
             pass
@@ -1098,20 +1152,27 @@ class PoolVariablesView(APIView):
         **SANDBOX_RESPONSES,
     }
 )
-class TopologyNodeConnectionData(APIView):
+class TopologyNodeConnectionData(AsyncAPIView):
     """API view to retrieve connection data for a node in a sandbox topology."""
 
     queryset = Sandbox.objects.none()
     serializer_class = serializers.NodeAccessDataSerializer
 
     # noinspection PyMethodMayBeStatic
-    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+    async def get(self, request: Request, *args: Any, **kwargs: Any) -> HttpResponseBase:
         """Retrieves data needed to establish connection to a node in the topology."""
-        sandbox = sandboxes.get_sandbox(kwargs['sandbox_uuid'])
-        if sandbox is None:
-            raise Http404(f'Sandbox with UUID {kwargs["sandbox_uuid"]} does not exist.')
+        sandbox = await sandboxes.aget_sandbox(kwargs['sandbox_uuid'])
         node_name = kwargs['node_name']
-        topology_instance = sandboxes.get_topology_instance(sandbox)
+        bundle = await access_bundles.aget(sandbox)
+        if node_name in bundle.node_access_data:
+            return utils.create_conditional_response(
+                request, bundle.etag, Response(bundle.node_access_data[node_name])
+            )
+        # The node does not exist or has no image, let the topology instance tell.
+        topology_instance, images = await asyncio.gather(
+            sandboxes.aget_topology_instance(sandbox),
+            sync_to_async(common_cloud.get_image_catalog, thread_sensitive=False)(),
+        )
         node = topology_instance.get_node(node_name)
         if node is None:
             raise Http404(
@@ -1120,7 +1181,7 @@ class TopologyNodeConnectionData(APIView):
             )
         return Response(
             serializers.NodeAccessDataSerializer(
-                nodes.get_node_access_data(topology_instance, node)
+                nodes.get_node_access_data(topology_instance, node, images)
             ).data
         )
 
@@ -1134,7 +1195,7 @@ class TopologyNodeConnectionData(APIView):
         **SANDBOX_RESPONSES,
     }
 )
-class SandboxVpnView(APIView):
+class SandboxVpnView(AsyncAPIView):
     """
     Returns the Netbird VPN client configuration for this sandbox.
 
@@ -1159,17 +1220,17 @@ class SandboxVpnView(APIView):
     serializer_class = serializers.SandboxVpnConfigSerializer
 
     # noinspection PyMethodMayBeStatic
-    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+    async def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Returns the Netbird VPN client configuration for this sandbox."""
-        sandbox = sandboxes.get_sandbox(self.kwargs['sandbox_uuid'])
-        access = SandboxNetbirdAccess.objects.filter(sandbox=sandbox).first()
+        sandbox = await sandboxes.aget_sandbox(self.kwargs['sandbox_uuid'])
+        access = await SandboxNetbirdAccess.objects.filter(sandbox=sandbox).afirst()
         setup_key = access.access_setup_key_value if access else None
         management_url = get_client_management_url()
 
         routes: list[str] = []
         command: str | None = None
         if setup_key:
-            for nbr in sandbox.netbird_resources.all():
+            async for nbr in sandbox.netbird_resources.all():
                 routes.extend(nbr.get_route_cidr_list())
             routes = list(dict.fromkeys(routes))
             # Build the command server-side so the NetBird CLI syntax lives in
@@ -1186,3 +1247,29 @@ class SandboxVpnView(APIView):
             'routes': routes,
             'command': command,
         })
+
+
+class ServiceStatsView(APIView):
+    """API view to get the statistics the caches of this service process collected."""
+
+    permission_classes = [AdminPermission]
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(description='Statistics by cache'),
+            **{k: v for k, v in utils.ERROR_RESPONSES.items() if k in [401, 403, 500]},
+        },
+    )
+    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """
+        Get the statistics of this process, the counters are not shared by the workers.
+        Topology cache: hits and misses of the local and the shared tier.
+        Definition responses: definition provider responses fetched in full (200) and
+        revalidated (304).
+        HTTP destinations: requests, errors and latency of the outgoing requests by host.
+        """
+        return Response({
+            'topology_cache': get_topology_cache().get_stats(),
+            'definition_responses': conditional_requests.RESPONSES.get_stats(),
+            'http_destinations': http_client.METRICS.get_stats(),
+        })
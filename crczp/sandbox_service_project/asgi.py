@@ -0,0 +1,18 @@
+"""
+ASGI config for crczp.sandbox_service_project project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Asynchronous views (see crczp.sandbox_common_lib.async_views) serve many concurrent
+requests in a single process when the service runs on an ASGI server.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crczp.sandbox_service_project.settings')
+
+application = get_asgi_application()
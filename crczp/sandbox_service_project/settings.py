@@ -39,6 +39,7 @@ else:
     class _RedisConfig:  # pylint: disable=too-few-public-methods
         host, port, db = 'localhost', 6379, 0
         default_cache_timeout = uag_cache_timeout = topology_cache_timeout = None
+        topology_local_cache_size = 0
 
     class _DatabaseConfig:  # pylint: disable=too-few-public-methods
         engine = 'django.db.backends.sqlite3'
@@ -48,6 +49,8 @@ else:
         allowed_oidc_providers: list[str] = []
         authenticated_rest_api = False
         roles_registration_url = roles_acquisition_url = None
+        local_token_verification = False
+        jwks_refresh_interval = 3600
 
     class _CrczpConfig:  # pylint: disable=too-few-public-methods
         ssl_ca_certificate_verify = ''
@@ -115,6 +118,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'crczp.sandbox_common_lib.middleware.DeadlineMiddleware',
 ]
 
 ROOT_URLCONF = 'crczp.sandbox_service_project.urls'
@@ -136,6 +140,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'crczp.sandbox_service_project.wsgi.application'
+ASGI_APPLICATION = 'crczp.sandbox_service_project.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -221,6 +226,8 @@ SANDBOX_UAG = {
     # which supports multiple OIDC providers (parsing them from the token).
     # Only those listed here will be allowed.
     'ALLOWED_OIDC_PROVIDERS': tuple(CRCZP_SERVICE_CONFIG.authentication.allowed_oidc_providers),
+    # Interval of refreshing the cached JWKS used by JWKSAccessTokenAuthentication
+    'JWKS_REFRESH_INTERVAL': CRCZP_SERVICE_CONFIG.authentication.jwks_refresh_interval,
     # User and Group roles registration endpoint URL
     'ROLES_REGISTRATION_URL': None,
     # User and Group roles acquisition endpoint URL
@@ -243,7 +250,9 @@ if CRCZP_SERVICE_CONFIG.authentication.authenticated_rest_api:
             # For testing purposes, uncomment BasicAuthentication.
             # It allows login using name & password (nice for permission testing).
             # 'rest_framework.authentication.BasicAuthentication',
-            'crczp.sandbox_uag.oidc_jwt.JWTAccessTokenAuthentication',
+            'crczp.sandbox_uag.oidc_jwt.JWKSAccessTokenAuthentication'
+            if CRCZP_SERVICE_CONFIG.authentication.local_token_verification
+            else 'crczp.sandbox_uag.oidc_jwt.JWTAccessTokenAuthentication',
         ),
     })
 
@@ -70,6 +70,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'crczp.sandbox_common_lib.middleware.DeadlineMiddleware',
 ]
 
 ROOT_URLCONF = 'crczp.sandbox_service_project.urls'
@@ -91,6 +92,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'crczp.sandbox_service_project.wsgi.application'
+ASGI_APPLICATION = 'crczp.sandbox_service_project.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -188,6 +190,8 @@ SANDBOX_UAG = {
     # which supports multiple OIDC providers (parsing them from the token).
     # Only those listed here will be allowed.
     'ALLOWED_OIDC_PROVIDERS': tuple(CRCZP_SERVICE_CONFIG.authentication.allowed_oidc_providers),
+    # Interval of refreshing the cached JWKS used by JWKSAccessTokenAuthentication
+    'JWKS_REFRESH_INTERVAL': CRCZP_SERVICE_CONFIG.authentication.jwks_refresh_interval,
     # User and Group roles registration endpoint URL
     'ROLES_REGISTRATION_URL': None,
     # User and Group roles acquisition endpoint URL
@@ -15,6 +15,8 @@ from django.core.cache import caches
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.request import Request
 
+from crczp.sandbox_common_lib import http_client
+from crczp.sandbox_common_lib.single_flight import CacheSingleFlight
 from crczp.sandbox_uag.oidc_jwt import JWTAccessTokenAuthentication
 
 from . import exceptions
@@ -25,14 +27,21 @@ authenticator_class = JWTAccessTokenAuthentication()
 USER_CACHE_TIMEOUT = 300
 CACHE = caches['uag_auth_groups_cache']
 UAG_SETTINGS = settings.SANDBOX_UAG
+ROLE_FETCHES = CacheSingleFlight(CACHE)
 
 
-def get_or_create_user(request: Request, user_info: dict[str, Any]) -> AbstractBaseUser:  # pylint: disable=too-many-locals
+def get_or_create_user(request: Request, user_info: dict[str, Any]) -> AbstractBaseUser:
     """
     Retrieve (or create if non-existent) user from database.
     Set corresponding roles (Django groups).
 
+    The ID of the user and the IDs of their groups are cached, so that the database is written
+    only when the profile fields or the roles of the user change. The user is still read from
+    the database, so deactivated and deleted users are not served from the cache. Roles are
+    fetched from the User-and-group service once per bearer token.
+
     :return: User instance
+    :raise AuthenticationFailed: if the user is inactive
     """
     # noinspection PyPep8Naming
     bearer_token = authenticator_class.get_bearer_token(request)
@@ -44,58 +53,89 @@ def get_or_create_user(request: Request, user_info: dict[str, Any]) -> AbstractB
     # {sub, iss} pair.
     # the limit for username is 140 characters so this may be a problem for long sub+iss
     username = get_unique_username(sub, iss)
+    profile = {
+        'first_name': user_info.get('given_name'),
+        'last_name': user_info.get('family_name'),
+        'email': user_info.get('email'),
+    }
+    group_ids = get_group_ids(username, bearer_token, sub, iss)
 
-    user_cls = get_user_model()  # this is suggested way of getting User model
-    (user, _) = user_cls.objects.update_or_create(
-        username=username,
-        defaults=cast(
-            dict[str, Any],
-            {
-                'first_name': user_info.get('given_name'),
-                'last_name': user_info.get('family_name'),
-                'email': user_info.get('email'),
-            },
-        ),
-    )
+    user_cache_key = get_user_cache_key(username)
+    cached_user = CACHE.get(user_cache_key)
+    user = None
+    if cached_user is not None:
+        (user_id, cached_profile, cached_group_ids) = cached_user
+        if cached_profile == profile and cached_group_ids == group_ids:
+            user = get_user_model().objects.filter(pk=user_id).first()
+
+    if user is None:
+        user = _save_user(username, profile, group_ids)
+        CACHE.set(user_cache_key, (user.pk, profile, group_ids), USER_CACHE_TIMEOUT)
+    if not user.is_active:
+        raise AuthenticationFailed('User is inactive.')
+    return cast(AbstractBaseUser, user)
+
+
+def get_group_ids(username: str, bearer_token: bytes, sub: str, iss: str) -> frozenset[int]:
+    """
+    Get the IDs of the groups of the user, cached for the bearer token.
+    Concurrent requests with the same token, in all processes, fetch the roles only once.
 
+    :raise AuthenticationFailed: if the roles cannot be fetched or a role is not in the database
+    """
     cache_key = get_cache_key(username, bearer_token)
 
-    cached_value = CACHE.get(cache_key)
-    if cached_value is not None:
-        (cached_groups, cached_bearer_token) = cached_value
-        # if there is a key collision due to SHA-1 clash, this will detect it
-        if cached_bearer_token == bearer_token:
-            user.groups.set(cached_groups)
-            return user
+    def fetch_group_ids() -> tuple[frozenset[int], bytes]:
+        return _fetch_group_ids(username, bearer_token, sub, iss), bearer_token
+
+    (group_ids, cached_bearer_token) = ROLE_FETCHES.do(
+        cache_key, fetch_group_ids, USER_CACHE_TIMEOUT
+    )
+    # if there is a key collision due to SHA-1 clash, this will detect it
+    if cached_bearer_token != bearer_token:
+        group_ids = _fetch_group_ids(username, bearer_token, sub, iss)
+    return cast(frozenset[int], group_ids)
+
 
+def _fetch_group_ids(username: str, bearer_token: bytes, sub: str, iss: str) -> frozenset[int]:
+    """Fetch the roles of the user and return the IDs of their groups."""
     try:
         user_roles = get_user_roles(UAG_SETTINGS['ROLES_ACQUISITION_URL'], bearer_token)
     except Exception as ex:
         raise AuthenticationFailed(str(ex)) from ex
 
     LOG.debug('roles:', user_roles=user_roles)
-    groups = []
+    # We work only with existing predefined groups.
+    groups = dict(Group.objects.filter(name__in=user_roles).values_list('name', 'id'))
     for group_name in user_roles:
-        # We work only with existing predefined groups.
-        try:
-            group = Group.objects.get(name=group_name)
-        except Group.DoesNotExist as ex:
+        if group_name not in groups:
             LOG.warning(
                 'role not in database',
-                username=user.username,
+                username=username,
                 sub=sub,
                 iss=iss,
                 role=group_name,
-                exc_info=ex,
             )
-            raise AuthenticationFailed('Authentication failed.') from ex
-        groups.append(group)
+            raise AuthenticationFailed('Authentication failed.')
 
-    user.groups.set(groups)
-    value_to_cache = (groups, bearer_token)
-    CACHE.set(cache_key, value_to_cache, USER_CACHE_TIMEOUT)
+    return frozenset(groups.values())
 
-    return user
+
+def _save_user(
+    username: str, profile: dict[str, Any], group_ids: frozenset[int]
+) -> AbstractBaseUser:
+    """Create the user or update their changed profile fields and groups."""
+    user_cls = get_user_model()  # this is suggested way of getting User model
+    (user, created) = user_cls.objects.get_or_create(username=username, defaults=profile)
+    if not created:
+        changed = [field for field, value in profile.items() if getattr(user, field) != value]
+        if changed:
+            for field in changed:
+                setattr(user, field, profile[field])
+            user.save(update_fields=changed)
+    if created or set(user.groups.values_list('id', flat=True)) != group_ids:
+        user.groups.set(group_ids)
+    return cast(AbstractBaseUser, user)
 
 
 def get_cache_key(username: str, bearer_token: bytes) -> str:
@@ -110,6 +150,11 @@ def get_cache_key(username: str, bearer_token: bytes) -> str:
     return f'{username}|{hashed_bearer_token}'
 
 
+def get_user_cache_key(username: str) -> str:
+    """Build a cache key of the cached user from username."""
+    return f'user|{username}'
+
+
 def get_unique_username(sub: str, iss: str) -> str:
     """Return a unique username string derived from OIDC subject and issuer."""
     return f'{str(sub)}|{str(iss)}'
@@ -121,7 +166,7 @@ def get_user_roles(url: str, bearer_token: bytes) -> list[str]:
 
     headers = {'Authorization': f'Bearer {bearer_token.decode("ascii")}'}
     try:
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http_client.get(url, headers=headers)
         response.raise_for_status()
 
     # All request exceptions inherit from requests.RequestException
@@ -153,7 +198,7 @@ def post_user_roles(
     headers = {'Content-Type': 'application/json'}
     LOG.debug('Posting roles', data=data, headers=headers, url=url)
     try:
-        response = requests.post(url, data=data, headers=headers, timeout=30)
+        response = http_client.post(url, data=data, headers=headers)
         response.raise_for_status()
 
     # All request exceptions inherit from requests.RequestException
@@ -1,7 +1,8 @@
 """OIDC JWT authentication utilities for sandbox UAG."""
 
-import base64
-from typing import Any, cast
+import hashlib
+import time
+from typing import Any, cast, override
 from urllib.parse import urlparse
 
 import requests
@@ -9,16 +10,29 @@ import structlog
 from django.conf import settings
 from django.core.cache import caches
 from django.utils.translation import gettext as _
+from joserfc import jwt
+from joserfc.errors import ExpiredTokenError, InvalidKeyIdError, JoseError
+from joserfc.jwk import KeySet
+from joserfc.jwt import JWTClaimsRegistry
 from jwkest.jwt import JWT
 from oidc_auth.authentication import BearerTokenAuthentication
 from oidc_auth.settings import api_settings as oidc_auth_settings
 from oidc_auth.util import cache
 from rest_framework.exceptions import AuthenticationFailed
 
+from crczp.sandbox_common_lib import http_client
+from crczp.sandbox_common_lib.single_flight import CacheSingleFlight
+
 LOG = structlog.get_logger()
 WELL_KNOWN_CONFIG_CACHE_TTL = oidc_auth_settings.OIDC_BEARER_TOKEN_EXPIRATION_TIME
 CACHE = caches['default']
-OIDC_SUB_PREFIX = 'oidc-sub-'
+OIDC_USERINFO_PREFIX = 'oidc-userinfo-'
+JWKS_CACHE_PREFIX = 'oidc-jwks-'
+JWKS_REFETCH_LOCK_PREFIX = 'oidc-jwks-refetch-'
+JWKS_MIN_REFETCH_INTERVAL = 60
+USERINFO_FETCHES = CacheSingleFlight(CACHE)
+# Claims get_or_create_user needs, the userinfo endpoint is called if the token lacks any of them
+USERINFO_CLAIMS = ('sub', 'given_name', 'family_name', 'email')
 
 
 class JWTAccessTokenAuthentication(BearerTokenAuthentication):  # type: ignore[misc]
@@ -36,11 +50,16 @@ class JWTAccessTokenAuthentication(BearerTokenAuthentication):  # type: ignore[m
         well_known_config_url = provider.get('well_known_config')
         if not well_known_config_url:
             well_known_config_url = provider['issuer'] + '/.well-known/openid-configuration'
-        response = requests.get(well_known_config_url, timeout=30)
+        response = http_client.get(well_known_config_url)
         response.raise_for_status()
         return cast(dict[str, Any], response.json())
 
-    def _get_userinfo(self, token: bytes) -> dict[str, Any]:
+    def get_provider(self, token: bytes) -> dict[str, str]:
+        """
+        Get the allowed OIDC provider that issued the token.
+
+        :raise AuthenticationFailed: if the issuer is not allowed
+        """
         issuer = self.extract_issuer(token)
         LOG.debug('Issuer extracted from token.', issuer=issuer)
         allowed_issuers = {
@@ -55,50 +74,110 @@ class JWTAccessTokenAuthentication(BearerTokenAuthentication):  # type: ignore[m
         if url.scheme != 'https':
             LOG.warn('DANGER! OIDC issuer is not using https protocol.', issuer=issuer)
 
-        provider = allowed_issuers[issuer]
+        return allowed_issuers[issuer]
+
+    def _get_userinfo(self, token: bytes) -> dict[str, Any]:
+        provider = self.get_provider(token)
         well_known_config = self.get_well_known_config(provider)
         userinfo_endpoint = provider.get('userinfo_endpoint')
         if not userinfo_endpoint:
             userinfo_endpoint = well_known_config['userinfo_endpoint']
         http_headers = {'Authorization': f'Bearer {token.decode("utf-8")}'}
 
-        response = requests.get(userinfo_endpoint, headers=http_headers, timeout=30)
+        response = http_client.get(userinfo_endpoint, headers=http_headers)
         response.raise_for_status()
 
         return cast(dict[str, Any], response.json())
 
     def get_userinfo(self, token: bytes) -> dict[str, Any]:
-        sub = ''
-        userinfo = None
+        # The userinfo is cached by the hash of the token, not by its unverified subject,
+        # so that a forged token never receives the userinfo fetched with another token.
+        # Concurrent requests with the token, in all processes, call the endpoint only once.
+        return USERINFO_FETCHES.do(  # type: ignore[no-any-return]
+            get_userinfo_cache_key(token),
+            lambda: self._get_userinfo(token),
+            oidc_auth_settings.OIDC_BEARER_TOKEN_EXPIRATION_TIME,
+        )
+
+
+class JWKSAccessTokenAuthentication(JWTAccessTokenAuthentication):
+    """
+    Use for Bearer token in JWT format, verified locally.
+
+    The signature of the token is verified against the JWKS of its issuer, which is cached
+    and refreshed periodically, and the user information is taken from the claims of the
+    verified token. The userinfo endpoint is called only if the token lacks some of them.
+    """
+
+    @override
+    def get_userinfo(self, token: bytes) -> dict[str, Any]:
+        claims = self.verify_token(token)
+        if all(claim in claims for claim in USERINFO_CLAIMS):
+            return claims
+        LOG.debug('Token lacks user claims, calling the userinfo endpoint.')
+        return super().get_userinfo(token)
+
+    def verify_token(self, token: bytes) -> dict[str, Any]:
+        """
+        Verify the signature and claims of the token.
+
+        :param token: The bearer token
+        :return: Claims of the verified token
+        :raise AuthenticationFailed: if the token is not valid
+        """
+        provider = self.get_provider(token)
+        algorithms = list(oidc_auth_settings.JWT_ALGORITHMS)
         try:
-            token_decoded = token.decode('utf-8')
-            payload = token_decoded.split('.')[1]
-            payload_bytes = payload.encode('utf-8')
-            padding = '=' * (-len(payload) % 4)
-            payload_bytes_decoded = base64.urlsafe_b64decode(
-                payload_bytes + padding.encode('utf-8')
-            )
-            payload_string = payload_bytes_decoded.decode('utf-8')
-
-            sub_pos = payload_string.find('"sub":"')
-            if sub_pos != -1:
-                payload_decoded_trim = payload_string[sub_pos + len('"sub":"') :]
-                sub = payload_decoded_trim[: payload_decoded_trim.find('"')]
-                userinfo = CACHE.get(OIDC_SUB_PREFIX + sub)
-        except Exception as e:  # pylint: disable=broad-exception-caught
-            LOG.warn(f'An exception occurred during parsing of the token: {e}')
-
-        if not userinfo:
-            userinfo = self._get_userinfo(token)
-            if sub:
-                CACHE.set(
-                    OIDC_SUB_PREFIX + sub,
-                    userinfo,
-                    oidc_auth_settings.OIDC_BEARER_TOKEN_EXPIRATION_TIME,
+            try:
+                decoded = jwt.decode(token, self.get_jwks(provider), algorithms=algorithms)
+            except InvalidKeyIdError:
+                # The issuer may have rotated its keys since the JWKS was cached.
+                decoded = jwt.decode(
+                    token, self.get_jwks(provider, refetch=True), algorithms=algorithms
                 )
-            else:
-                LOG.warn(
-                    'Sub was not found in the token, the result of this authentication'
-                    ' will not be cached'
-                )
-        return userinfo
+            JWTClaimsRegistry(
+                now=int(time.time()),
+                leeway=oidc_auth_settings.OIDC_LEEWAY,
+                iss={'essential': True, 'value': provider['issuer']},
+                exp={'essential': True},
+            ).validate(decoded.claims)
+        except ExpiredTokenError as ex:
+            raise AuthenticationFailed(_('Invalid Authorization header. JWT has expired.')) from ex
+        except (JoseError, ValueError) as ex:
+            LOG.info('JWT verification failed.', error=str(ex))
+            raise AuthenticationFailed(
+                _('Invalid Authorization header. JWT verification failed.')
+            ) from ex
+        return decoded.claims
+
+    def get_jwks(self, provider: dict[str, str], refetch: bool = False) -> KeySet:
+        """
+        Get the JSON Web Key Set of the provider, cached for JWKS_REFRESH_INTERVAL seconds.
+
+        :param provider: The OIDC provider
+        :param refetch: Fetch the JWKS even if it is cached; done at most once
+            per JWKS_MIN_REFETCH_INTERVAL seconds
+        :return: The key set
+        """
+        cache_key = JWKS_CACHE_PREFIX + provider['issuer']
+        jwks = CACHE.get(cache_key)
+        if jwks is None or (
+            refetch
+            and CACHE.add(
+                JWKS_REFETCH_LOCK_PREFIX + provider['issuer'], True, JWKS_MIN_REFETCH_INTERVAL
+            )
+        ):
+            jwks_uri = provider.get('jwks_uri') or self.get_well_known_config(provider)['jwks_uri']
+            try:
+                response = http_client.get(jwks_uri)
+                response.raise_for_status()
+            except requests.RequestException as ex:
+                raise AuthenticationFailed(_('Failed to fetch the JWKS of the issuer.')) from ex
+            jwks = response.json()
+            CACHE.set(cache_key, jwks, settings.SANDBOX_UAG['JWKS_REFRESH_INTERVAL'])
+        return KeySet.import_key_set(jwks)
+
+
+def get_userinfo_cache_key(token: bytes) -> str:
+    """Return the cache key of the userinfo of the bearer token."""
+    return OIDC_USERINFO_PREFIX + hashlib.sha256(token).hexdigest()
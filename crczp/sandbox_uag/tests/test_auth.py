@@ -0,0 +1,205 @@
+"""Tests for resolving the authenticated user and their roles."""
+
+import threading
+import time
+
+import pytest
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from crczp.sandbox_uag import auth
+
+pytestmark = pytest.mark.django_db
+
+ISSUER = 'https://oidc.example.com'
+USER_INFO = {'sub': 'trainee', 'given_name': 'Jane', 'family_name': 'Doe', 'email': 'j@d.com'}
+TRAINEE = 'ROLE_SANDBOX-SERVICE_TRAINEE'
+ORGANIZER = 'ROLE_SANDBOX-SERVICE_ORGANIZER'
+
+
+@pytest.fixture(autouse=True)
+def set_up(mocker):
+    """Create the groups, start with an empty cache and mock the token handling."""
+    Group.objects.bulk_create([Group(name=TRAINEE), Group(name=ORGANIZER)])
+    auth.CACHE.clear()
+    authenticator = mocker.patch('crczp.sandbox_uag.auth.authenticator_class')
+    authenticator.get_bearer_token.side_effect = lambda request: request.token
+    authenticator.extract_issuer.return_value = ISSUER
+
+
+@pytest.fixture
+def get_user_roles(mocker):
+    """Mock the User-and-group service returning the trainee role."""
+    return mocker.patch('crczp.sandbox_uag.auth.get_user_roles', return_value=[TRAINEE])
+
+
+def authenticate(token=b'token', user_info=None):
+    """Resolve the user of a request with the bearer token."""
+    request = APIRequestFactory().get('/')
+    request.token = token
+    return auth.get_or_create_user(request, user_info or USER_INFO)
+
+
+def writes(queries):
+    """Return the queries modifying the database."""
+    return [
+        query['sql']
+        for query in queries
+        if query['sql'].split(' ', 1)[0] in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+class TestGetOrCreateUser:
+    """Tests for get_or_create_user."""
+
+    def test_user_created_with_groups(self, get_user_roles):  # pylint: disable=unused-argument
+        """Test that a new user is created with the groups of their roles."""
+        user = authenticate()
+
+        user = User.objects.get(pk=user.pk)
+        assert user.username == auth.get_unique_username('trainee', ISSUER)
+        assert user.first_name == 'Jane'
+        assert list(user.groups.values_list('name', flat=True)) == [TRAINEE]
+
+    def test_cached_user_read_only(self, django_assert_num_queries, get_user_roles):
+        """Test that a repeated request with the same token only reads the user row."""
+        first = authenticate()
+
+        with django_assert_num_queries(1):
+            user = authenticate()
+
+        assert user.pk == first.pk
+        get_user_roles.assert_called_once()
+
+    def test_deactivated_user_refused(self, get_user_roles):  # pylint: disable=unused-argument
+        """Test that a cached user deactivated meanwhile fails the authentication."""
+        user = authenticate()
+        User.objects.filter(pk=user.pk).update(is_active=False)
+
+        with pytest.raises(auth.AuthenticationFailed):
+            authenticate()
+
+    def test_deleted_user_not_served_from_cache(self, get_user_roles):  # pylint: disable=unused-argument
+        """Test that a cached user deleted meanwhile is created again."""
+        deleted = authenticate()
+        User.objects.filter(pk=deleted.pk).delete()
+
+        user = authenticate()
+
+        assert user.pk != deleted.pk
+        assert User.objects.filter(pk=user.pk).exists()
+
+    def test_new_token_without_writes(self, get_user_roles):
+        """Test that a new token with unchanged roles fetches the roles but writes nothing."""
+        authenticate()
+
+        with CaptureQueriesContext(connection) as context:
+            authenticate(token=b'refreshed-token')
+
+        assert not writes(context.captured_queries)
+        assert get_user_roles.call_count == 2
+
+    def test_changed_profile_updated(self, get_user_roles):  # pylint: disable=unused-argument
+        """Test that a changed profile field is written."""
+        authenticate()
+
+        with CaptureQueriesContext(connection) as context:
+            user = authenticate(user_info={**USER_INFO, 'email': 'jane@d.com'})
+
+        assert len(writes(context.captured_queries)) == 1
+        assert User.objects.get(pk=user.pk).email == 'jane@d.com'
+
+    def test_changed_roles_updated(self, get_user_roles):
+        """Test that the groups are updated when the roles of a new token change."""
+        authenticate()
+        get_user_roles.return_value = [TRAINEE, ORGANIZER]
+
+        user = authenticate(token=b'refreshed-token')
+
+        assert set(User.objects.get(pk=user.pk).groups.values_list('name', flat=True)) == {
+            TRAINEE,
+            ORGANIZER,
+        }
+
+    def test_unknown_role(self, get_user_roles):
+        """Test that a role without a group fails the authentication."""
+        get_user_roles.return_value = ['ROLE_UNKNOWN']
+
+        with pytest.raises(auth.AuthenticationFailed):
+            authenticate()
+
+
+class UserInfoAuthentication(BaseAuthentication):
+    """Authentication resolving the user of every request through get_or_create_user."""
+
+    def authenticate(self, request):
+        request.token = b'token'
+        return auth.get_or_create_user(request, USER_INFO), USER_INFO
+
+
+class AuthenticatedView(APIView):
+    """Read-only view requiring an authenticated user."""
+
+    authentication_classes = [UserInfoAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Return the username."""
+        return Response({'username': request.user.username})
+
+
+@pytest.mark.benchmark
+def test_authenticated_get_throughput(get_user_roles):  # pylint: disable=unused-argument
+    """Benchmark authenticated GET requests, none of which should write to the database."""
+    requests = 500
+    view = AuthenticatedView.as_view()
+    factory = APIRequestFactory()
+    assert view(factory.get('/')).status_code == 200
+
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        for _ in range(requests):
+            view(factory.get('/'))
+        elapsed = time.perf_counter() - start
+
+    print(
+        f'\n{requests / elapsed:.0f} authenticated GET/s,'
+        f' {len(context.captured_queries) / requests:.2f} queries per request'
+    )
+    assert not writes(context.captured_queries)
+
+
+def test_burst_fetches_roles_once(mocker):
+    """Test that a burst of requests with the same new token fetches the roles once."""
+    release = threading.Event()
+
+    def get_user_roles(url, bearer_token):  # pylint: disable=unused-argument
+        release.wait(5)
+        return [TRAINEE]
+
+    fetch = mocker.patch('crczp.sandbox_uag.auth.get_user_roles', side_effect=get_user_roles)
+    mocker.patch(
+        'crczp.sandbox_uag.auth.Group.objects.filter'
+    ).return_value.values_list.return_value = [(TRAINEE, 1)]
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(auth.get_group_ids('user', b'token', 'sub', ISSUER))
+        )
+        for _ in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)  # let all the requests wait for the roles in flight
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [frozenset({1})] * 20
+    fetch.assert_called_once()
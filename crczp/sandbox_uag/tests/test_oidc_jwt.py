@@ -0,0 +1,132 @@
+"""Tests for the local verification of JWT access tokens."""
+
+import time
+
+import pytest
+from django.core.cache import caches
+from joserfc import jwt
+from joserfc.jwk import KeySet, RSAKey
+from rest_framework.exceptions import AuthenticationFailed
+
+from crczp.sandbox_uag import oidc_jwt
+
+ISSUER = 'https://oidc.example.com'
+JWKS_URI = f'{ISSUER}/jwks'
+CLAIMS = {'sub': 'trainee', 'given_name': 'Jane', 'family_name': 'Doe', 'email': 'j@d.com'}
+
+
+@pytest.fixture(autouse=True)
+def set_up(settings):
+    """Allow the issuer and start with an empty cache."""
+    settings.SANDBOX_UAG = {
+        **settings.SANDBOX_UAG,
+        'ALLOWED_OIDC_PROVIDERS': ({'issuer': ISSUER, 'jwks_uri': JWKS_URI},),
+    }
+    caches['default'].clear()
+
+
+@pytest.fixture
+def key():
+    """Return the signing key of the issuer."""
+    return RSAKey.generate_key(2048, parameters={'kid': 'key-1'})
+
+
+@pytest.fixture
+def jwks_get(mocker, key):
+    """Mock the JWKS endpoint of the issuer publishing the key."""
+    get = mocker.patch('crczp.sandbox_uag.oidc_jwt.http_client.get')
+    get.return_value.json.return_value = KeySet([key]).as_dict(private=False)
+    return get
+
+
+def sign(key, **claims):
+    """Return a token with the claims signed by the key."""
+    now = int(time.time())
+    payload = {'iss': ISSUER, 'iat': now, 'exp': now + 300, **CLAIMS, **claims}
+    return jwt.encode({'alg': 'RS256', 'kid': key.kid}, payload, key).encode()
+
+
+class TestJWKSAccessTokenAuthentication:
+    """Tests for JWKSAccessTokenAuthentication."""
+
+    authentication = oidc_jwt.JWKSAccessTokenAuthentication()
+
+    def test_claims_from_verified_token(self, mocker, key, jwks_get):
+        """Test that the claims are taken from the token, the JWKS is fetched once."""
+        userinfo = mocker.patch.object(oidc_jwt.JWTAccessTokenAuthentication, '_get_userinfo')
+
+        for _ in range(3):
+            claims = self.authentication.get_userinfo(sign(key))
+
+        assert claims['sub'] == 'trainee'
+        assert claims['email'] == 'j@d.com'
+        jwks_get.assert_called_once_with(JWKS_URI)
+        userinfo.assert_not_called()
+
+    def test_userinfo_fallback(self, mocker, key, jwks_get):  # pylint: disable=unused-argument
+        """Test that the userinfo endpoint is called when the token lacks user claims."""
+        userinfo = mocker.patch.object(
+            oidc_jwt.JWTAccessTokenAuthentication, '_get_userinfo', return_value=CLAIMS
+        )
+        token = jwt.encode(
+            {'alg': 'RS256', 'kid': key.kid},
+            {'iss': ISSUER, 'sub': 'trainee', 'exp': int(time.time()) + 300},
+            key,
+        ).encode()
+
+        assert self.authentication.get_userinfo(token) == CLAIMS
+        userinfo.assert_called_once_with(token)
+
+    def test_rotated_key(self, key, jwks_get):
+        """Test that the JWKS is fetched again when the token is signed by an unknown key."""
+        self.authentication.get_userinfo(sign(key))
+        rotated = RSAKey.generate_key(2048, parameters={'kid': 'key-2'})
+        jwks_get.return_value.json.return_value = KeySet([rotated]).as_dict(private=False)
+
+        assert self.authentication.get_userinfo(sign(rotated))['sub'] == 'trainee'
+        assert jwks_get.call_count == 2
+
+        # Unknown keys do not fetch the JWKS again within the refetch interval.
+        with pytest.raises(AuthenticationFailed):
+            self.authentication.get_userinfo(sign(key))
+        assert jwks_get.call_count == 2
+
+    @pytest.mark.parametrize(
+        'claims',
+        [
+            {'exp': int(time.time()) - 3600},
+            {'iss': 'https://other.example.com'},
+        ],
+    )
+    def test_invalid_claims(self, key, jwks_get, claims):  # pylint: disable=unused-argument
+        """Test that expired tokens and tokens of other issuers are refused."""
+        with pytest.raises(AuthenticationFailed):
+            self.authentication.get_userinfo(sign(key, **claims))
+
+    def test_invalid_signature(self, key, jwks_get):  # pylint: disable=unused-argument
+        """Test that a token with a forged signature is refused."""
+        forged = RSAKey.generate_key(2048, parameters={'kid': key.kid})
+
+        with pytest.raises(AuthenticationFailed):
+            self.authentication.get_userinfo(sign(forged))
+
+
+class TestJWTAccessTokenAuthentication:
+    """Tests for JWTAccessTokenAuthentication."""
+
+    authentication = oidc_jwt.JWTAccessTokenAuthentication()
+
+    def test_userinfo_cached_by_token(self, mocker, key):
+        """Test that a token with the subject of another token does not get its userinfo."""
+        userinfo = mocker.patch.object(
+            oidc_jwt.JWTAccessTokenAuthentication,
+            '_get_userinfo',
+            side_effect=lambda token: {**CLAIMS, 'token': token},
+        )
+        token = sign(key)
+        forged = sign(RSAKey.generate_key(2048, parameters={'kid': key.kid}))
+
+        assert self.authentication.get_userinfo(token)['token'] == token
+        assert self.authentication.get_userinfo(forged)['token'] == forged
+        assert self.authentication.get_userinfo(token)['token'] == token
+        assert userinfo.call_count == 2